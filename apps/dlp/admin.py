@@ -6,14 +6,49 @@ from apps.dlp.models import Pattern, DetectedMessage
 
 @admin.register(DetectedMessage)
 class DetectedMessageAdmin(admin.ModelAdmin):
-    list_display = ("content", "pattern_link", "created", "modified")
+    list_display = ("content_digest", "content_size", "pattern_link", "created")
     search_fields = (
-        "content",
+        "blob__digest",
         "pattern__name",
     )
     ordering = ("-created",)
     list_per_page = 10
     list_filter = ("pattern", "created")
+    fields = ("content", "content_digest", "content_size", "pattern", "created")
+    readonly_fields = fields
+
+    def get_queryset(self, request):
+        """
+        Fetch the blob size with each row, but not its compressed data, which is
+        only loaded and decompressed when a detected message is opened.
+        """
+        return (
+            super()
+            .get_queryset(request)
+            .select_related("blob", "pattern")
+            .defer("blob__data")
+        )
+
+    def has_add_permission(self, request):
+        """
+        Detected messages are only reported by the workers.
+        """
+        return False
+
+    @admin.display(description="Content")
+    def content(self, obj):
+        """
+        Return the decompressed content of the detected message.
+        """
+        return obj.content
+
+    @admin.display(description="Content digest")
+    def content_digest(self, obj):
+        return obj.blob_id
+
+    @admin.display(description="Size (bytes)")
+    def content_size(self, obj):
+        return obj.blob.size
 
     @admin.display(description="Pattern Link")
     def pattern_link(self, obj):
@@ -0,0 +1,198 @@
+"""
+Async-native versions of the ingestion endpoints, served instead of the DRF
+views of ``apps.dlp.views`` when ``DLP_ASYNC_VIEWS`` is set, so that a single
+ASGI process can hold many concurrent Slack and worker connections.
+"""
+
+import json
+import logging
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import JsonResponse
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+
+from apps.dlp.constants import EVENT_CALLBACK, EVENT_TYPE_MESSAGE
+from apps.dlp.idempotency import aclaim_event, acount_event, arelease_event
+from apps.dlp.models import ContentBlob
+from apps.dlp.pattern_cache import (
+    aget_patterns_payload,
+    aget_patterns_version,
+    get_not_modified_response,
+    get_patterns_response,
+)
+from apps.dlp.serializers import (
+    ContentDigestsSerializer,
+    DetectedMessageBulkSerializer,
+    DetectedMessageSerializer,
+)
+from apps.dlp.services import asend_to_sqs
+from apps.dlp.views import get_message_tasks
+
+logger = logging.getLogger(__name__)
+
+
+def parse_json(request):
+    """
+    Parse the JSON body of a request.
+
+    Returns:
+        The parsed body, or None if it is not valid JSON.
+    """
+    try:
+        return json.loads(request.body)
+    except ValueError:
+        return None
+
+
+def invalid_json_response() -> JsonResponse:
+    return JsonResponse({"detail": "Invalid JSON body."}, status=400)
+
+
+@method_decorator(csrf_exempt, name="dispatch")
+class AsyncAPIView(View):
+    """
+    Base of the async views, which, like the DRF views, are not protected by
+    CSRF since their clients are Slack and the worker.
+    """
+
+
+class SlackEventView(AsyncAPIView):
+    http_method_names = ["post"]
+
+    async def check_event_callback(self, data: dict):
+        """Handle Slack event callbacks."""
+        if data.get("type") != EVENT_CALLBACK:
+            return
+        event = data.get("event", {})
+        if event.get("type") != EVENT_TYPE_MESSAGE:
+            logger.debug(f"Unhandled event type: {event.get('type')}")
+            return
+
+        channel_id = event.get("channel", "")
+        ts = event.get("ts", "")
+        event_id = data.get("event_id")
+        if not await aclaim_event(event_id, channel_id, ts):
+            await acount_event("duplicates")
+            logger.info(f"Ignoring duplicate event {event_id}")
+            return
+
+        queued = True
+        for task_name, kwargs in get_message_tasks(event):
+            if not await asend_to_sqs(task_name=task_name, kwargs=kwargs):
+                queued = False
+        if not queued:
+            # Let the redelivery of the event be processed
+            await arelease_event(event_id, channel_id, ts)
+
+    async def post(self, request, *args, **kwargs):
+        """Handle POST requests from Slack."""
+        data = parse_json(request)
+        if not isinstance(data, dict):
+            return invalid_json_response()
+        retry_num = request.headers.get("X-Slack-Retry-Num")
+        if retry_num:
+            await acount_event("retries")
+            logger.info(
+                f"Slack retry {retry_num} of event {data.get('event_id')}: "
+                f"{request.headers.get('X-Slack-Retry-Reason')}"
+            )
+        await self.check_event_callback(data)
+        response_data = {"status": "received"}
+        if data.get("challenge"):
+            logger.info("Slack challenge detected in the payload.")
+            response_data["challenge"] = data["challenge"]
+        return JsonResponse(response_data)
+
+
+class PatternListAPIView(AsyncAPIView):
+    """
+    API endpoint to retrieve all patterns.
+    """
+
+    http_method_names = ["get"]
+
+    async def get(self, request):
+        """
+        Return the cached pattern list, or a 304 response when the client
+        already has its version, after querying only the version.
+        """
+        version = await aget_patterns_version()
+        response = get_not_modified_response(request, version)
+        if response is None:
+            payload = await aget_patterns_payload(version)
+            response = get_patterns_response(payload, version)
+        return response
+
+
+class DetectedMessageCreateAPIView(AsyncAPIView):
+    """
+    API endpoint to save detected messages.
+    """
+
+    http_method_names = ["post"]
+
+    def get_serializer(self, data):
+        return DetectedMessageSerializer(data=data)
+
+    def save(self, data) -> JsonResponse:
+        """
+        Validate and save the request data.
+
+        The validation looks up patterns and content digests and the messages
+        are saved in a transaction, which Django's async ORM cannot do, so this
+        runs in a thread.
+        """
+        serializer = self.get_serializer(data)
+        if serializer.is_valid():
+            serializer.save()
+            return JsonResponse(serializer.data, status=201, safe=False)
+        return JsonResponse(serializer.errors, status=400, safe=False)
+
+    async def post(self, request):
+        data = parse_json(request)
+        if data is None:
+            return invalid_json_response()
+        return await sync_to_async(self.save)(data)
+
+
+class DetectedMessageBulkCreateAPIView(DetectedMessageCreateAPIView):
+    """
+    API endpoint to save a list of detected messages at once.
+    """
+
+    def get_serializer(self, data):
+        return DetectedMessageBulkSerializer(
+            data=data,
+            many=True,
+            allow_empty=False,
+            max_length=settings.DLP_DETECTED_MESSAGES_BULK_LIMIT,
+        )
+
+
+class ContentBlobMissingAPIView(AsyncAPIView):
+    """
+    API endpoint returning which of the given content digests are not stored
+    yet, so that clients only upload content the server does not have.
+    """
+
+    http_method_names = ["post"]
+
+    async def post(self, request):
+        data = parse_json(request)
+        if data is None:
+            return invalid_json_response()
+        serializer = ContentDigestsSerializer(data=data)
+        if not serializer.is_valid():
+            return JsonResponse(serializer.errors, status=400)
+        digests = serializer.validated_data["digests"]
+        stored = {
+            digest
+            async for digest in ContentBlob.objects.filter(
+                digest__in=digests
+            ).values_list("digest", flat=True)
+        }
+        missing = [digest for digest in dict.fromkeys(digests) if digest not in stored]
+        return JsonResponse({"missing": missing})
@@ -0,0 +1,166 @@
+import logging
+import threading
+import time
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from apps.dlp.models import EventClaim
+
+logger = logging.getLogger(__name__)
+
+EVENT_KEY = "event:{}"
+MESSAGE_KEY = "message:{}:{}"
+COUNTER_KEY = "dlp:slack-events:{}"
+
+# Monotonic time after which the process next deletes the expired claims
+_next_prune = 0.0
+_prune_lock = threading.Lock()
+
+
+def _event_keys(event_id, channel_id=None, ts=None) -> list:
+    keys = []
+    if event_id:
+        keys.append(EVENT_KEY.format(event_id))
+    if channel_id and ts:
+        keys.append(MESSAGE_KEY.format(channel_id, ts))
+    return keys
+
+
+def _prune_claims(expired):
+    """
+    Delete the expired claims, at most every ``DLP_EVENT_CLAIM_PRUNE_INTERVAL``
+    seconds, so that most events are claimed without it.
+    """
+    global _next_prune
+    with _prune_lock:
+        now = time.monotonic()
+        if now < _next_prune:
+            return
+        _next_prune = now + settings.DLP_EVENT_CLAIM_PRUNE_INTERVAL
+    EventClaim.objects.filter(created__lt=expired).delete()
+
+
+def _add_claim(key: str, expired) -> bool:
+    """
+    Record a claim, unless an unexpired one exists.
+
+    Returns:
+        bool: True if the claim was added, or an expired one renewed.
+    """
+    try:
+        with transaction.atomic():
+            EventClaim.objects.create(key=key)
+    except IntegrityError:
+        # An expired claim not pruned yet is renewed, by a single process
+        return bool(
+            EventClaim.objects.filter(key=key, created__lt=expired).update(
+                created=timezone.now()
+            )
+        )
+    return True
+
+
+def claim_event(event_id, channel_id=None, ts=None) -> bool:
+    """
+    Record a Slack event as ingested, unless it was already.
+
+    An event is recognized by its ``event_id`` and, for messages, by its
+    channel and timestamp, so that the same message is processed once even
+    when it comes with another event ID. Both are remembered for
+    ``DLP_EVENT_DEDUP_TTL`` seconds, in the database, where the unique key of
+    a claim lets only one of the backend processes add it. Expired claims are
+    deleted every ``DLP_EVENT_CLAIM_PRUNE_INTERVAL`` seconds.
+
+    Args:
+        event_id (str): The ID Slack gave the event.
+        channel_id (str, optional): The channel of the message.
+        ts (str, optional): The timestamp of the message.
+
+    Returns:
+        bool: True if the event is new, False if it is a duplicate.
+    """
+    expired = timezone.now() - timedelta(seconds=settings.DLP_EVENT_DEDUP_TTL)
+    _prune_claims(expired)
+    # Every key is added, so that a duplicate by any of them is remembered too
+    fresh = [_add_claim(key, expired) for key in _event_keys(event_id, channel_id, ts)]
+    return all(fresh)
+
+
+async def aclaim_event(event_id, channel_id=None, ts=None) -> bool:
+    """
+    Async version of ``claim_event``, for the async views. The claims are
+    added in savepoints, which the async ORM cannot open, so this runs in a
+    thread.
+    """
+    return await sync_to_async(claim_event)(event_id, channel_id, ts)
+
+
+def release_event(event_id, channel_id=None, ts=None):
+    """
+    Forget an event that could not be ingested, so that its redelivery is.
+
+    Args:
+        event_id (str): The ID Slack gave the event.
+        channel_id (str, optional): The channel of the message.
+        ts (str, optional): The timestamp of the message.
+    """
+    EventClaim.objects.filter(key__in=_event_keys(event_id, channel_id, ts)).delete()
+
+
+async def arelease_event(event_id, channel_id=None, ts=None):
+    """
+    Async version of ``release_event``, for the async views.
+    """
+    await EventClaim.objects.filter(
+        key__in=_event_keys(event_id, channel_id, ts)
+    ).adelete()
+
+
+def count_event(name: str) -> int:
+    """
+    Increase an event counter, e.g. ``retries`` or ``duplicates``.
+
+    Args:
+        name (str): The counter name.
+
+    Returns:
+        int: The new count.
+    """
+    key = COUNTER_KEY.format(name)
+    cache.add(key, 0, timeout=None)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        # The counter was evicted in between
+        cache.set(key, 1, timeout=None)
+        return 1
+
+
+async def acount_event(name: str) -> int:
+    """
+    Async version of ``count_event``, for the async views.
+    """
+    key = COUNTER_KEY.format(name)
+    await cache.aadd(key, 0, timeout=None)
+    try:
+        return await cache.aincr(key)
+    except ValueError:
+        await cache.aset(key, 1, timeout=None)
+        return 1
+
+
+def get_event_counts() -> dict:
+    """
+    Return the number of Slack retries and of duplicate deliveries seen.
+
+    Returns:
+        dict: The counts, keyed by counter name.
+    """
+    names = ("retries", "duplicates")
+    values = cache.get_many([COUNTER_KEY.format(name) for name in names])
+    return {name: values.get(COUNTER_KEY.format(name), 0) for name in names}
@@ -4,7 +4,7 @@ from django.conf import settings
 
 
 class Command(BaseCommand):
-    help = "Create SQS queue if it does not exist"
+    help = "Create the SQS queues of every lane if they do not exist"
 
     def handle(self, *args, **kwargs):
         sqs = boto3.client(
@@ -14,11 +14,11 @@ class Command(BaseCommand):
             aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
             aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
         )
-        queue_name = settings.AWS_SQS_QUEUE_NAME
-        try:
-            response = sqs.create_queue(QueueName=queue_name)
-            self.stdout.write(f"Queue '{queue_name}' created successfully.")
-        except sqs.exceptions.QueueAlreadyExists:
-            self.stdout.write(f"Queue '{queue_name}' already exists.")
-        except Exception as e:
-            self.stderr.write(f"Failed to create queue: {e}")
+        for queue_name in settings.AWS_SQS_QUEUE_NAMES:
+            try:
+                response = sqs.create_queue(QueueName=queue_name)
+                self.stdout.write(f"Queue '{queue_name}' created successfully.")
+            except sqs.exceptions.QueueAlreadyExists:
+                self.stdout.write(f"Queue '{queue_name}' already exists.")
+            except Exception as e:
+                self.stderr.write(f"Failed to create queue: {e}")
@@ -0,0 +1,126 @@
+import asyncio
+import statistics
+import time
+import uuid
+from collections import Counter
+
+import aiohttp
+from django.core.management.base import BaseCommand, CommandError
+
+ENDPOINTS = ("slack", "patterns", "detections")
+
+
+def build_request(endpoint: str, run_id: str, index: int, pattern_id=None) -> tuple:
+    """
+    Build the request number ``index`` of a load test. Slack events and
+    detected contents are unique, so that none is deduplicated.
+
+    Returns:
+        tuple: The method, path and JSON body of the request.
+    """
+    if endpoint == "slack":
+        return (
+            "POST",
+            "/api/slack/events/",
+            {
+                "type": "event_callback",
+                "event_id": f"Ev{run_id}{index}",
+                "event": {
+                    "type": "message",
+                    "text": f"Load test message {index}",
+                    "channel": f"CLOAD{run_id}",
+                    "ts": f"{index}.000000",
+                },
+            },
+        )
+    if endpoint == "patterns":
+        return "GET", "/api/patterns/", None
+    return (
+        "POST",
+        "/api/detected-messages/bulk/",
+        [{"content": f"Load test {run_id} {index}", "pattern": pattern_id}],
+    )
+
+
+async def run_load(base_url: str, endpoint: str, total: int, concurrency: int) -> dict:
+    """
+    Send ``total`` requests to an endpoint, ``concurrency`` at a time.
+
+    Returns:
+        dict: The duration, response statuses and latencies of the requests.
+    """
+    run_id = uuid.uuid4().hex[:8]
+    latencies = []
+    statuses = Counter()
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(base_url, connector=connector) as session:
+        pattern_id = None
+        if endpoint == "detections":
+            async with session.get("/api/patterns/") as response:
+                patterns = await response.json()
+            if not patterns:
+                raise CommandError(f"{base_url} has no pattern to detect")
+            pattern_id = patterns[0]["id"]
+
+        indexes = iter(range(total))
+
+        async def worker():
+            for index in indexes:
+                method, path, body = build_request(endpoint, run_id, index, pattern_id)
+                start = time.perf_counter()
+                try:
+                    async with session.request(method, path, json=body) as response:
+                        await response.read()
+                        statuses[response.status] += 1
+                except aiohttp.ClientError as e:
+                    statuses[type(e).__name__] += 1
+                latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        duration = time.perf_counter() - start
+    return {"duration": duration, "statuses": statuses, "latencies": latencies}
+
+
+class Command(BaseCommand):
+    help = (
+        "Load test an ingestion endpoint of running backends, e.g. to compare a "
+        "WSGI and an ASGI deployment"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "targets",
+            nargs="+",
+            help="Base URLs of the backends, optionally named, e.g. "
+            "wsgi=http://localhost:8000",
+        )
+        parser.add_argument("--endpoint", choices=ENDPOINTS, default="slack")
+        parser.add_argument("--requests", type=int, default=1000)
+        parser.add_argument("--concurrency", type=int, default=100)
+
+    def handle(self, *args, **options):
+        for target in options["targets"]:
+            name, _, base_url = target.rpartition("=")
+            result = asyncio.run(
+                run_load(
+                    base_url,
+                    options["endpoint"],
+                    options["requests"],
+                    options["concurrency"],
+                )
+            )
+            latencies = sorted(result["latencies"])
+            percentiles = statistics.quantiles(latencies, n=100, method="inclusive")
+            statuses = ", ".join(
+                f"{status}: {count}" for status, count in result["statuses"].items()
+            )
+            self.stdout.write(
+                f"{name or base_url}: {len(latencies)} requests in "
+                f"{result['duration']:.2f}s "
+                f"({len(latencies) / result['duration']:.1f} req/s), "
+                f"p50 {percentiles[49] * 1000:.1f}ms, "
+                f"p95 {percentiles[94] * 1000:.1f}ms, "
+                f"p99 {percentiles[98] * 1000:.1f}ms, "
+                f"max {latencies[-1] * 1000:.1f}ms [{statuses}]"
+            )
@@ -0,0 +1,19 @@
+# Generated by Django 5.1.4 on 2026-10-16 22:40
+
+import apps.dlp.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("dlp", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="pattern",
+            name="regex",
+            field=models.TextField(validators=[apps.dlp.validators.validate_regex]),
+        ),
+    ]
@@ -0,0 +1,92 @@
+# Generated by Django 5.1.4 on 2026-10-16 23:10
+
+import hashlib
+import zlib
+
+import django.db.models.deletion
+import django.utils.timezone
+import model_utils.fields
+from django.db import migrations, models
+
+
+def move_content_to_blobs(apps, schema_editor):
+    """
+    Store the content of every detected message once, compressed.
+    """
+    ContentBlob = apps.get_model("dlp", "ContentBlob")
+    DetectedMessage = apps.get_model("dlp", "DetectedMessage")
+    for message in DetectedMessage.objects.only("id", "content").iterator():
+        raw = message.content.encode("utf-8")
+        digest = hashlib.sha256(raw).hexdigest()
+        ContentBlob.objects.get_or_create(
+            digest=digest, defaults={"data": zlib.compress(raw), "size": len(raw)}
+        )
+        DetectedMessage.objects.filter(id=message.id).update(blob_id=digest)
+
+
+def move_blobs_to_content(apps, schema_editor):
+    """
+    Copy the decompressed content back onto every detected message.
+    """
+    DetectedMessage = apps.get_model("dlp", "DetectedMessage")
+    for message in DetectedMessage.objects.select_related("blob").iterator():
+        content = zlib.decompress(bytes(message.blob.data)).decode("utf-8")
+        DetectedMessage.objects.filter(id=message.id).update(content=content)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("dlp", "0002_pattern_regex_validator"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ContentBlob",
+            fields=[
+                (
+                    "digest",
+                    models.CharField(max_length=64, primary_key=True, serialize=False),
+                ),
+                ("data", models.BinaryField()),
+                ("size", models.PositiveBigIntegerField()),
+                (
+                    "created",
+                    model_utils.fields.AutoCreatedField(
+                        default=django.utils.timezone.now,
+                        editable=False,
+                        verbose_name="created",
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddField(
+            model_name="detectedmessage",
+            name="blob",
+            field=models.ForeignKey(
+                null=True,
+                on_delete=django.db.models.deletion.PROTECT,
+                related_name="detected_messages",
+                to="dlp.contentblob",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="detectedmessage",
+            name="content",
+            field=models.TextField(default=""),
+        ),
+        migrations.RunPython(move_content_to_blobs, move_blobs_to_content),
+        migrations.RemoveField(
+            model_name="detectedmessage",
+            name="content",
+        ),
+        migrations.AlterField(
+            model_name="detectedmessage",
+            name="blob",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.PROTECT,
+                related_name="detected_messages",
+                to="dlp.contentblob",
+            ),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.1.4 on 2026-10-16 23:47
+
+import django.utils.timezone
+import model_utils.fields
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("dlp", "0004_eventclaim"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="pattern",
+            name="created",
+            field=model_utils.fields.AutoCreatedField(
+                default=django.utils.timezone.now,
+                editable=False,
+                verbose_name="created",
+            ),
+        ),
+        migrations.AddField(
+            model_name="pattern",
+            name="modified",
+            field=model_utils.fields.AutoLastModifiedField(
+                default=django.utils.timezone.now,
+                editable=False,
+                verbose_name="modified",
+            ),
+        ),
+    ]
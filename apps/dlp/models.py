@@ -1,11 +1,19 @@
+import hashlib
+import zlib
+
+from django.conf import settings
 from django.db import models
 from django.urls import reverse
+from django.utils.functional import cached_property
+from model_utils.fields import AutoCreatedField
 from model_utils.models import UUIDModel, SoftDeletableModel, TimeStampedModel
 
+from apps.dlp.validators import validate_regex
+
 
-class Pattern(UUIDModel, SoftDeletableModel):
+class Pattern(UUIDModel, TimeStampedModel, SoftDeletableModel):
     name = models.CharField(max_length=100)
-    regex = models.TextField()
+    regex = models.TextField(validators=[validate_regex])
 
     def get_admin_url(self):
         """
@@ -17,9 +25,84 @@ class Pattern(UUIDModel, SoftDeletableModel):
         return self.name
 
 
+class ContentBlob(models.Model):
+    """
+    Detected content stored once, compressed and keyed by its SHA-256 digest.
+    """
+
+    digest = models.CharField(max_length=64, primary_key=True)
+    data = models.BinaryField()
+    size = models.PositiveBigIntegerField()
+    created = AutoCreatedField("created")
+
+    @staticmethod
+    def digest_of(content: str) -> str:
+        """
+        Return the hex SHA-256 digest of the UTF-8 encoded content.
+        """
+        return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+    @classmethod
+    def build(cls, content: str) -> "ContentBlob":
+        """
+        Return an unsaved blob holding the compressed content.
+        """
+        raw = content.encode("utf-8")
+        blob = cls(
+            digest=hashlib.sha256(raw).hexdigest(),
+            data=zlib.compress(raw, settings.DLP_CONTENT_COMPRESSION_LEVEL),
+            size=len(raw),
+        )
+        # The content is known already, no need to decompress it again
+        blob.__dict__["content"] = content
+        return blob
+
+    @classmethod
+    def store(cls, content: str) -> "ContentBlob":
+        """
+        Save the content unless a blob with the same digest exists.
+        """
+        blob = cls.build(content)
+        cls.objects.bulk_create([blob], ignore_conflicts=True)
+        return blob
+
+    @cached_property
+    def content(self) -> str:
+        """
+        Return the decompressed content, decompressing it on first access only.
+        """
+        return zlib.decompress(bytes(self.data)).decode("utf-8")
+
+    def __str__(self):
+        return f"{self.digest[:12]} ({self.size} bytes)"
+
+
+class EventClaim(models.Model):
+    """
+    A Slack event, or message, being ingested. Claims are kept in the database
+    so that every backend process sees them, whatever the cache backend.
+    """
+
+    key = models.CharField(max_length=255, unique=True)
+    created = AutoCreatedField("created", db_index=True)
+
+    def __str__(self):
+        return self.key
+
+
 class DetectedMessage(UUIDModel, TimeStampedModel):
-    content = models.TextField()
+    blob = models.ForeignKey(
+        ContentBlob, on_delete=models.PROTECT, related_name="detected_messages"
+    )
     pattern = models.ForeignKey(Pattern, on_delete=models.CASCADE)
 
+    @property
+    def content(self) -> str:
+        return self.blob.content
+
+    @property
+    def content_digest(self) -> str:
+        return self.blob_id
+
     def __str__(self):
         return f"Message: {self.content[:20]} - Pattern: {self.pattern.name}"
@@ -0,0 +1,123 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Max, Q
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from rest_framework.renderers import JSONRenderer
+
+from apps.dlp.models import Pattern
+from apps.dlp.serializers import PatternSerializer
+
+PAYLOAD_KEY = "dlp:patterns:payload:{}"
+
+
+def _version_query() -> dict:
+    """
+    Return the aggregates the version of the pattern set is derived from: the
+    last time a pattern was saved or soft deleted, and the number of patterns,
+    which also changes when patterns are deleted.
+    """
+    return {
+        "modified": Max("modified"),
+        "count": Count("pk", filter=Q(is_removed=False)),
+    }
+
+
+def _version(modified, count: int) -> str:
+    microseconds = int(modified.timestamp() * 1_000_000) if modified else 0
+    return f"{microseconds}-{count}"
+
+
+def get_patterns_version() -> str:
+    """
+    Return the version of the pattern set, derived from the database with a
+    single query, so that every process agrees on it whatever the cache backend.
+
+    Returns:
+        str: The time in microseconds the patterns last changed, and their number.
+    """
+    return _version(**Pattern.all_objects.aggregate(**_version_query()))
+
+
+async def aget_patterns_version() -> str:
+    """
+    Async version of ``get_patterns_version``, for the async views.
+    """
+    return _version(**await Pattern.all_objects.aaggregate(**_version_query()))
+
+
+def render_patterns(patterns) -> bytes:
+    return JSONRenderer().render(PatternSerializer(patterns, many=True).data)
+
+
+def get_patterns_payload(version: str) -> bytes:
+    """
+    Return the JSON pattern list of a version, serialized once and cached.
+
+    Args:
+        version (str): The version of the pattern set.
+
+    Returns:
+        bytes: The JSON body.
+    """
+    key = PAYLOAD_KEY.format(version)
+    payload = cache.get(key)
+    if payload is None:
+        payload = render_patterns(Pattern.objects.all())
+        cache.set(key, payload, settings.DLP_PATTERN_LIST_CACHE_TTL)
+    return payload
+
+
+async def aget_patterns_payload(version: str) -> bytes:
+    """
+    Async version of ``get_patterns_payload``, for the async views.
+    """
+    key = PAYLOAD_KEY.format(version)
+    payload = await cache.aget(key)
+    if payload is None:
+        payload = render_patterns([pattern async for pattern in Pattern.objects.all()])
+        await cache.aset(key, payload, settings.DLP_PATTERN_LIST_CACHE_TTL)
+    return payload
+
+
+def patterns_etag(version: str) -> str:
+    return f'"patterns-{version}"'
+
+
+def set_validators(response: HttpResponse, version: str) -> HttpResponse:
+    """
+    Set the ``ETag`` of the pattern list on a response.
+
+    No ``Last-Modified`` is sent: soft deleting patterns with a queryset does
+    not update their ``modified`` time, so only the ``ETag`` changes with
+    every version.
+    """
+    response["ETag"] = patterns_etag(version)
+    return response
+
+
+def get_not_modified_response(request, version: str) -> HttpResponse | None:
+    """
+    Answer a request for the pattern list from its ``If-None-Match`` header,
+    without looking at the patterns.
+
+    Args:
+        request: The request.
+        version (str): The version of the pattern set.
+
+    Returns:
+        HttpResponse: A 304 response if the client has this version, else None.
+    """
+    response = get_conditional_response(request, etag=patterns_etag(version))
+    if response is not None:
+        set_validators(response, version)
+    return response
+
+
+def get_patterns_response(payload: bytes, version: str) -> HttpResponse:
+    """
+    Return the pattern list of a version, with its validators.
+    """
+    return set_validators(
+        HttpResponse(payload, content_type="application/json"), version
+    )
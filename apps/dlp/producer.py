@@ -0,0 +1,525 @@
+import asyncio
+import atexit
+import logging
+import queue
+import random
+import threading
+import time
+import weakref
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import connections
+
+from apps.dlp.transports import (
+    AsyncQueueTransport,
+    QueueTransport,
+    get_async_transport,
+    get_transport,
+)
+
+logger = logging.getLogger(__name__)
+
+# Put on the queue to make the sender thread flush everything and stop
+_STOP = object()
+
+
+class ProducerQueueFullError(Exception):
+    """Raised when a message cannot be queued because too many are waiting."""
+
+
+class ProducerSendError(Exception):
+    """Raised when a message could not be sent in any of its attempts."""
+
+
+def retry_delay(attempt: int, backoff: float, backoff_max: float) -> float:
+    """
+    Return the seconds to wait before sending a message again after its
+    attempt number ``attempt`` failed: ``backoff`` doubled on every attempt up
+    to ``backoff_max``, of which a random half is waited, so that the messages
+    failed together are not all sent again at once.
+    """
+    delay = min(backoff * 2 ** (attempt - 1), backoff_max)
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+class QueueProducer:
+    def __init__(
+        self,
+        transport: QueueTransport | None = None,
+        batch_size: int | None = None,
+        linger: float | None = None,
+        queue_size: int | None = None,
+        block_timeout: float | None = None,
+        max_attempts: int | None = None,
+        retry_backoff: float | None = None,
+        retry_backoff_max: float | None = None,
+    ):
+        """
+        Initialize a producer handing messages to a background thread, which
+        sends them in batches through a single transport.
+
+        The thread is started with the first message. It waits up to ``linger``
+        seconds for a batch to fill, so that messages sent together, like the
+        files of one Slack event, go out in a single request. A message that
+        fails is kept for a later batch once its backoff is over, while the
+        other messages keep being sent.
+
+        Args:
+            transport (QueueTransport, optional): The transport to send with.
+                The configured one is created by the thread if None.
+            batch_size (int, optional): Most messages sent in one batch.
+            linger (float, optional): Seconds to wait for a batch to fill.
+            queue_size (int, optional): Most messages waiting to be sent.
+            block_timeout (float, optional): Seconds ``send`` waits for room when
+                the queue is full before giving up.
+            max_attempts (int, optional): Times a message is sent before it is
+                dropped.
+            retry_backoff (float, optional): Seconds before the first retry,
+                doubled on every further one.
+            retry_backoff_max (float, optional): Most seconds between two
+                attempts.
+
+        The arguments left out default to the ``DLP_QUEUE_PRODUCER_*`` settings.
+        """
+        self.transport = transport
+        self.batch_size = batch_size or settings.DLP_QUEUE_PRODUCER_BATCH_SIZE
+        self.linger = settings.DLP_QUEUE_PRODUCER_LINGER if linger is None else linger
+        self.block_timeout = (
+            settings.DLP_QUEUE_PRODUCER_BLOCK_TIMEOUT
+            if block_timeout is None
+            else block_timeout
+        )
+        self.max_attempts = max_attempts or settings.DLP_QUEUE_PRODUCER_MAX_ATTEMPTS
+        self.retry_backoff = (
+            settings.DLP_QUEUE_PRODUCER_RETRY_BACKOFF
+            if retry_backoff is None
+            else retry_backoff
+        )
+        self.retry_backoff_max = (
+            settings.DLP_QUEUE_PRODUCER_RETRY_BACKOFF_MAX
+            if retry_backoff_max is None
+            else retry_backoff_max
+        )
+        self.stats = Counter()
+        self._queue = queue.Queue(
+            maxsize=queue_size or settings.DLP_QUEUE_PRODUCER_QUEUE_SIZE
+        )
+        self._thread = None
+        self._closed = False
+        self._lock = threading.Lock()
+        # Messages queued or being sent, which flush waits for
+        self._pending = 0
+        self._idle = threading.Condition()
+
+    def _start(self):
+        """
+        Start the sender thread unless it is running, e.g. again after a fork.
+        """
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name="dlp-queue-producer", daemon=True
+                )
+                self._thread.start()
+
+    def send(self, queue_url: str, body: str, on_failure=None):
+        """
+        Queue a message to be sent in the background.
+
+        When the queue is full, the caller is held back for up to
+        ``block_timeout`` seconds to let the thread catch up.
+
+        Args:
+            queue_url (str): The queue to send to.
+            body (str): The message body.
+            on_failure (callable, optional): Called without arguments, from the
+                sender thread, if the message is dropped after its last attempt.
+
+        Raises:
+            ProducerQueueFullError: If the queue is still full after waiting.
+            RuntimeError: If the producer was closed.
+        """
+        if self._closed:
+            raise RuntimeError("The queue producer is closed")
+        self._start()
+        with self._idle:
+            self._pending += 1
+        try:
+            self._queue.put(
+                (queue_url, body, 1, on_failure), timeout=self.block_timeout
+            )
+        except queue.Full:
+            self._done(1)
+            self.stats["rejected"] += 1
+            raise ProducerQueueFullError(
+                f"{self._queue.maxsize} messages are waiting to be sent"
+            ) from None
+
+    def flush(self, timeout: float | None = None) -> bool:
+        """
+        Wait until every queued message has been sent or dropped.
+
+        Args:
+            timeout (float, optional): Most seconds to wait, or None to wait
+                until done.
+
+        Returns:
+            bool: Whether all messages were handled in time.
+        """
+        with self._idle:
+            return self._idle.wait_for(lambda: self._pending == 0, timeout)
+
+    def close(self, timeout: float | None = None) -> bool:
+        """
+        Send the queued messages and stop the sender thread.
+
+        Args:
+            timeout (float, optional): Most seconds to wait for the thread.
+
+        Returns:
+            bool: Whether the thread stopped in time.
+        """
+        self._closed = True
+        thread = self._thread
+        if thread is None or not thread.is_alive():
+            return True
+        self._queue.put(_STOP)
+        thread.join(timeout)
+        if thread.is_alive():
+            logger.error(f"{self._pending} queued messages were not sent on shutdown.")
+            return False
+        return True
+
+    def _done(self, count: int):
+        with self._idle:
+            self._pending -= count
+            self._idle.notify_all()
+
+    def _run(self):
+        transport = self.transport or get_transport()
+        retries = []
+        stopping = False
+        while True:
+            items, retries, stopping = self._collect(retries, stopping)
+            if items:
+                retries.extend(self._send_items(transport, items))
+            elif stopping and retries:
+                # Wait out the backoff of the last messages
+                time.sleep(max(retries[0][0] - time.monotonic(), 0))
+            if stopping and not retries and self._queue.empty():
+                return
+
+    def _collect(self, retries: list, stopping: bool) -> tuple:
+        """
+        Gather up to ``batch_size`` messages, starting with the retries whose
+        backoff is over.
+
+        Args:
+            retries (list): The messages to send again, with the time their
+                backoff is over.
+
+        Returns:
+            tuple: The messages, the retries still backing off, sorted by the
+                end of their backoff, and whether the producer is stopping.
+        """
+        now = time.monotonic()
+        retries = sorted(retries, key=lambda retry: retry[0])
+        items = []
+        while retries and retries[0][0] <= now and len(items) < self.batch_size:
+            items.append(retries.pop(0)[1])
+        deadline = now + self.linger if items else None
+        while len(items) < self.batch_size:
+            # Without a batch to fill, wait for new messages until a retry is due
+            wake_at = deadline if deadline is not None or not retries else retries[0][0]
+            try:
+                if stopping:
+                    item = self._queue.get_nowait()
+                elif wake_at is None:
+                    item = self._queue.get()
+                else:
+                    remaining = wake_at - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is _STOP:
+                stopping = True
+                continue
+            items.append(item)
+            if deadline is None:
+                deadline = time.monotonic() + self.linger
+        return items, retries, stopping
+
+    def _send_items(self, transport: QueueTransport, items: list) -> list:
+        """
+        Send messages with one batch request per queue.
+
+        Returns:
+            list: The messages to send again, with the time their backoff is over.
+        """
+        by_queue = defaultdict(list)
+        for item in items:
+            by_queue[item[0]].append(item)
+
+        retries = []
+        finished = 0
+        for queue_url, entries in by_queue.items():
+            bodies = [body for _, body, _, _ in entries]
+            try:
+                failed = Counter(transport.send_batch(queue_url, bodies))
+            except Exception as e:
+                logger.error(f"Failed to send {len(bodies)} messages to SQS: {e}")
+                failed = Counter(bodies)
+
+            for entry in entries:
+                _, body, attempt, on_failure = entry
+                if not failed[body]:
+                    self.stats["sent"] += 1
+                    finished += 1
+                    continue
+                failed[body] -= 1
+                if attempt < self.max_attempts:
+                    due = time.monotonic() + retry_delay(
+                        attempt, self.retry_backoff, self.retry_backoff_max
+                    )
+                    retries.append((due, (queue_url, body, attempt + 1, on_failure)))
+                else:
+                    logger.error(f"Dropping message after {attempt} attempts: {body}")
+                    self.stats["dropped"] += 1
+                    finished += 1
+                    self._report_failure(on_failure)
+        self._done(finished)
+        return retries
+
+    def _report_failure(self, on_failure):
+        if on_failure is None:
+            return
+        try:
+            on_failure()
+        except Exception as e:
+            logger.error(f"Failed to report a dropped message: {e}")
+        finally:
+            # The sender thread serves no requests, so Django never closes the
+            # connections the callback opens: close them before they go stale
+            connections.close_all()
+
+
+_producer = None
+_producer_lock = threading.Lock()
+
+
+def get_producer() -> QueueProducer:
+    """
+    Return the producer of the process, creating it on first use.
+
+    It is flushed and stopped when the process exits.
+
+    Returns:
+        QueueProducer: The producer.
+    """
+    global _producer
+    with _producer_lock:
+        if _producer is None:
+            _producer = QueueProducer()
+            atexit.register(
+                _producer.close, settings.DLP_QUEUE_PRODUCER_SHUTDOWN_TIMEOUT
+            )
+        return _producer
+
+
+class AsyncQueueProducer:
+    def __init__(
+        self,
+        transport: AsyncQueueTransport | None = None,
+        batch_size: int | None = None,
+        linger: float | None = None,
+        queue_size: int | None = None,
+        block_timeout: float | None = None,
+        max_attempts: int | None = None,
+        retry_backoff: float | None = None,
+        retry_backoff_max: float | None = None,
+    ):
+        """
+        Initialize a producer for the async views, which sends the messages of
+        concurrent requests in batches through a single transport, on the
+        running event loop.
+
+        Unlike ``QueueProducer``, ``send`` returns once its message is sent, so
+        that a request is only answered when its tasks are queued and nothing is
+        lost when the process stops. A batch is sent when it is full, or
+        ``linger`` seconds after its first message.
+
+        Args:
+            transport (AsyncQueueTransport, optional): The transport to send
+                with. The configured one is created on first use if None.
+            batch_size (int, optional): Most messages sent in one batch.
+            linger (float, optional): Seconds to wait for a batch to fill.
+            queue_size (int, optional): Most messages waiting to be sent.
+            block_timeout (float, optional): Seconds ``send`` waits for room when
+                too many messages are waiting before giving up.
+            max_attempts (int, optional): Times a message is sent before it is
+                given up.
+            retry_backoff (float, optional): Seconds before the first retry,
+                doubled on every further one.
+            retry_backoff_max (float, optional): Most seconds between two
+                attempts.
+
+        The arguments left out default to the ``DLP_QUEUE_PRODUCER_*`` settings.
+        """
+        self.transport = transport
+        self.batch_size = batch_size or settings.DLP_QUEUE_PRODUCER_BATCH_SIZE
+        self.linger = settings.DLP_QUEUE_PRODUCER_LINGER if linger is None else linger
+        self.queue_size = queue_size or settings.DLP_QUEUE_PRODUCER_QUEUE_SIZE
+        self.block_timeout = (
+            settings.DLP_QUEUE_PRODUCER_BLOCK_TIMEOUT
+            if block_timeout is None
+            else block_timeout
+        )
+        self.max_attempts = max_attempts or settings.DLP_QUEUE_PRODUCER_MAX_ATTEMPTS
+        self.retry_backoff = (
+            settings.DLP_QUEUE_PRODUCER_RETRY_BACKOFF
+            if retry_backoff is None
+            else retry_backoff
+        )
+        self.retry_backoff_max = (
+            settings.DLP_QUEUE_PRODUCER_RETRY_BACKOFF_MAX
+            if retry_backoff_max is None
+            else retry_backoff_max
+        )
+        self.stats = Counter()
+        self._slots = asyncio.Semaphore(self.queue_size)
+        # Messages waiting for their batch, and the timer sending it, by queue
+        self._batches = {}
+        self._timers = {}
+        self._tasks = set()
+        self._closed = False
+
+    async def send(self, queue_url: str, body: str):
+        """
+        Send a message in the next batch of its queue.
+
+        When too many messages are waiting, the caller is held back for up to
+        ``block_timeout`` seconds for one of them to be sent.
+
+        Args:
+            queue_url (str): The queue to send to.
+            body (str): The message body.
+
+        Raises:
+            ProducerQueueFullError: If there is still no room after waiting.
+            ProducerSendError: If the message could not be sent.
+            RuntimeError: If the producer was closed.
+        """
+        if self._closed:
+            raise RuntimeError("The queue producer is closed")
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.block_timeout)
+        except asyncio.TimeoutError:
+            self.stats["rejected"] += 1
+            raise ProducerQueueFullError(
+                f"{self.queue_size} messages are waiting to be sent"
+            ) from None
+        try:
+            loop = asyncio.get_running_loop()
+            future = loop.create_future()
+            batch = self._batches.setdefault(queue_url, [])
+            batch.append((body, future))
+            if len(batch) >= self.batch_size:
+                self._flush(queue_url)
+            elif queue_url not in self._timers:
+                self._timers[queue_url] = loop.call_later(
+                    self.linger, self._flush, queue_url
+                )
+            await future
+        finally:
+            self._slots.release()
+
+    async def close(self):
+        """
+        Send the waiting messages and release the transport.
+        """
+        self._closed = True
+        for queue_url in list(self._batches):
+            self._flush(queue_url)
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self.transport is not None:
+            await self.transport.close()
+
+    def _flush(self, queue_url: str):
+        """
+        Start sending the waiting batch of a queue.
+        """
+        timer = self._timers.pop(queue_url, None)
+        if timer is not None:
+            timer.cancel()
+        batch = self._batches.pop(queue_url, None)
+        if batch:
+            task = asyncio.get_running_loop().create_task(
+                self._send_batch(queue_url, batch)
+            )
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _send_batch(self, queue_url: str, batch: list):
+        """
+        Send a batch, again for its failed messages after a backoff, and
+        resolve the futures their senders wait on.
+        """
+        if self.transport is None:
+            self.transport = get_async_transport()
+        for attempt in range(1, self.max_attempts + 1):
+            if attempt > 1:
+                await asyncio.sleep(
+                    retry_delay(attempt - 1, self.retry_backoff, self.retry_backoff_max)
+                )
+            bodies = [body for body, _ in batch]
+            try:
+                failed = Counter(await self.transport.send_batch(queue_url, bodies))
+            except Exception as e:
+                logger.error(f"Failed to send {len(bodies)} messages to SQS: {e}")
+                failed = Counter(bodies)
+
+            remaining = []
+            for body, future in batch:
+                if failed[body]:
+                    failed[body] -= 1
+                    remaining.append((body, future))
+                    continue
+                self.stats["sent"] += 1
+                if not future.done():
+                    future.set_result(None)
+            batch = remaining
+            if not batch:
+                return
+
+        for body, future in batch:
+            logger.error(
+                f"Giving up message after {self.max_attempts} attempts: {body}"
+            )
+            self.stats["dropped"] += 1
+            if not future.done():
+                future.set_exception(
+                    ProducerSendError(f"Not sent in {self.max_attempts} attempts")
+                )
+
+
+# The async producers by event loop, which ASGI servers run one of per process
+_async_producers = weakref.WeakKeyDictionary()
+
+
+def get_async_producer() -> AsyncQueueProducer:
+    """
+    Return the async producer of the running event loop, creating it on first
+    use.
+
+    Returns:
+        AsyncQueueProducer: The producer.
+    """
+    loop = asyncio.get_running_loop()
+    producer = _async_producers.get(loop)
+    if producer is None:
+        producer = _async_producers[loop] = AsyncQueueProducer()
+    return producer
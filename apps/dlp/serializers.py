@@ -1,5 +1,9 @@
+from django.conf import settings
+from django.db import transaction
 from rest_framework import serializers
-from apps.dlp.models import Pattern, DetectedMessage
+from apps.dlp.models import ContentBlob, Pattern, DetectedMessage
+
+DIGEST_REGEX = r"^[0-9a-f]{64}$"
 
 
 class PatternSerializer(serializers.ModelSerializer):
@@ -8,7 +12,109 @@ class PatternSerializer(serializers.ModelSerializer):
         fields = ("id", "name", "regex")
 
 
+class ContentDigestsSerializer(serializers.Serializer):
+    digests = serializers.ListField(
+        child=serializers.RegexField(DIGEST_REGEX),
+        allow_empty=False,
+        max_length=settings.DLP_DETECTED_MESSAGES_BULK_LIMIT,
+    )
+
+
+class DetectedMessageListSerializer(serializers.ListSerializer):
+    def to_internal_value(self, data):
+        """
+        Look up the content digests of all items with a single query before
+        validating them.
+        """
+        if isinstance(data, list):
+            # Digests that are not strings are left to the field validation
+            digests = {
+                item.get("content_digest")
+                for item in data
+                if isinstance(item, dict)
+                and isinstance(item.get("content_digest"), str)
+            }
+            self.context["known_digests"] = set(
+                ContentBlob.objects.filter(digest__in=digests).values_list(
+                    "digest", flat=True
+                )
+            )
+        return super().to_internal_value(data)
+
+    def create(self, validated_data):
+        """
+        Save the new content blobs and all detected messages with a single
+        INSERT each, in one transaction.
+        """
+        blobs = {
+            item["blob"].digest: item["blob"]
+            for item in validated_data
+            if "blob" in item
+        }
+        with transaction.atomic():
+            ContentBlob.objects.bulk_create(blobs.values(), ignore_conflicts=True)
+            return DetectedMessage.objects.bulk_create(
+                [DetectedMessage(**item) for item in validated_data]
+            )
+
+
 class DetectedMessageSerializer(serializers.ModelSerializer):
+    """
+    A detected message, given either with its ``content`` or, for content the
+    server already has, with only its ``content_digest``.
+    """
+
+    content = serializers.CharField(required=False, trim_whitespace=False)
+    content_digest = serializers.RegexField(DIGEST_REGEX, required=False)
+
     class Meta:
         model = DetectedMessage
-        fields = ("id", "content", "pattern", "created", "modified")
+        fields = ("id", "content", "content_digest", "pattern", "created", "modified")
+        list_serializer_class = DetectedMessageListSerializer
+
+    def _is_known(self, digest: str) -> bool:
+        known = self.context.get("known_digests")
+        if known is None:
+            return ContentBlob.objects.filter(digest=digest).exists()
+        return digest in known
+
+    def validate(self, attrs):
+        content = attrs.pop("content", None)
+        digest = attrs.pop("content_digest", None)
+        if content is not None:
+            blob = ContentBlob.build(content)
+            if digest is not None and digest != blob.digest:
+                raise serializers.ValidationError(
+                    {"content_digest": ["Does not match the content."]}
+                )
+            attrs["blob"] = blob
+            # Later items of the same request may refer to it by digest only
+            self.context.get("known_digests", set()).add(blob.digest)
+        elif digest is not None:
+            if not self._is_known(digest):
+                raise serializers.ValidationError(
+                    {"content_digest": ["Unknown content, send it as content."]}
+                )
+            attrs["blob_id"] = digest
+        else:
+            raise serializers.ValidationError(
+                {"content": ["Either content or content_digest is required."]}
+            )
+        return attrs
+
+    def create(self, validated_data):
+        blob = validated_data.get("blob")
+        with transaction.atomic():
+            if blob is not None:
+                ContentBlob.objects.bulk_create([blob], ignore_conflicts=True)
+            return super().create(validated_data)
+
+
+class DetectedMessageBulkSerializer(DetectedMessageSerializer):
+    """
+    A detected message of a bulk request, answered without its content.
+    """
+
+    content = serializers.CharField(
+        required=False, trim_whitespace=False, write_only=True
+    )
@@ -1,33 +1,67 @@
 import json
 import logging
 
-import boto3
 from django.conf import settings
 
+from apps.dlp.producer import get_async_producer, get_producer
+
 logger = logging.getLogger(__name__)
 
 
-def send_to_sqs(task_name, args=None, kwargs=None):
-    """Send a task to SQS."""
+def _task_message(task_name, args=None, kwargs=None) -> tuple:
+    """
+    Build the message of a task.
+
+    Returns:
+        tuple: The URL of the queue of its lane, and the message body.
+    """
+    queue_url = settings.AWS_SQS_TASK_QUEUE_URLS.get(
+        task_name, settings.AWS_SQS_QUEUE_URL
+    )
+    message = {
+        "task": task_name,
+        "args": args or [],
+        "kwargs": kwargs or {},
+    }
+    logger.info(f"Sending message to SQS: {message}")
+    return queue_url, json.dumps(message)
+
+
+def send_to_sqs(task_name, args=None, kwargs=None, on_failure=None):
+    """
+    Queue a task for its lane. It is sent in the background, in a batch with the
+    other tasks of the process, through the configured transport.
+
+    Args:
+        on_failure (callable, optional): Called without arguments if the task
+            is queued but cannot be sent.
+
+    Returns:
+        bool: Whether the task was queued.
+    """
     try:
-        sqs = boto3.client(
-            "sqs",
-            endpoint_url=settings.AWS_SQS_ENDPOINT_URL,
-            region_name=settings.AWS_REGION_NAME,
-            aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
-            aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
+        get_producer().send(
+            *_task_message(task_name, args, kwargs), on_failure=on_failure
         )
+        logger.info("Message queued for SQS.")
+        return True
+    except Exception as e:
+        logger.error(f"Failed to send message to SQS. Error: {e}")
+        return False
 
-        queue_url = settings.AWS_SQS_QUEUE_URL
-        message = {
-            "task": task_name,
-            "args": args or [],
-            "kwargs": kwargs or {},
-        }
 
-        logger.info(f"Sending message to SQS: {message}")
+async def asend_to_sqs(task_name, args=None, kwargs=None):
+    """
+    Send a task to its lane without blocking the event loop. It is sent in a
+    batch with the tasks of concurrent requests, and awaited until it is.
 
-        response = sqs.send_message(QueueUrl=queue_url, MessageBody=json.dumps(message))
-        logger.info(f"Message sent to SQS successfully. Response: {response}")
+    Returns:
+        bool: Whether the task was sent.
+    """
+    try:
+        await get_async_producer().send(*_task_message(task_name, args, kwargs))
+        logger.info("Message sent to SQS.")
+        return True
     except Exception as e:
         logger.error(f"Failed to send message to SQS. Error: {e}")
+        return False
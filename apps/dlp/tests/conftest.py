@@ -1,8 +1,17 @@
 import pytest
+from django.core.cache import cache
 from django.urls import reverse
 from rest_framework.test import APIClient
 
-from apps.dlp.models import Pattern, DetectedMessage
+from apps.dlp.models import ContentBlob, Pattern, DetectedMessage
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    """Make every test start without Slack event counts or cached patterns."""
+    cache.clear()
+    yield
+    cache.clear()
 
 
 @pytest.fixture
@@ -70,7 +79,7 @@ def mock_requests_get(mocker):
 @pytest.fixture
 def detected_message(pattern_email):
     return DetectedMessage.objects.create(
-        content="This is a test message", pattern=pattern_email
+        blob=ContentBlob.store("This is a test message"), pattern=pattern_email
     )
 
 
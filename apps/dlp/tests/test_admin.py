@@ -1,7 +1,9 @@
 import pytest
+from django.contrib import admin
 from django.contrib.admin.sites import AdminSite
 from django.urls import reverse
 from apps.dlp.admin import DetectedMessageAdmin
+from apps.dlp.pattern_cache import get_patterns_version
 from apps.dlp.models import DetectedMessage, Pattern
 
 
@@ -16,3 +18,35 @@ def test_admin_pattern_link(detected_message):
         f'<a href="{detected_message.pattern.get_admin_url()}">'
         f"{detected_message.pattern.name}</a>"
     )
+
+
+@pytest.mark.django_db
+def test_admin_content_is_loaded_lazily(detected_message, django_assert_num_queries):
+    """
+    Test that the changelist does not load the compressed content, and that an
+    opened detected message shows it decompressed.
+    """
+    admin_instance = DetectedMessageAdmin(DetectedMessage, AdminSite())
+    (row,) = admin_instance.get_queryset(request=None)
+
+    assert "data" in row.blob.get_deferred_fields()
+    assert admin_instance.content_size(row) == len("This is a test message")
+
+    # Opening the row loads and decompresses the data with one query
+    with django_assert_num_queries(1):
+        assert admin_instance.content(row) == "This is a test message"
+
+
+@pytest.mark.django_db
+def test_admin_pattern_bulk_delete_changes_version(pattern):
+    """
+    Test that soft deleting patterns from the changelist, which updates them
+    without saving them, gives the pattern set a new version.
+    """
+    admin_instance = admin.site._registry[Pattern]
+    version = get_patterns_version()
+
+    admin_instance.delete_queryset(None, Pattern.objects.all())
+
+    assert not Pattern.objects.exists()
+    assert get_patterns_version() != version
@@ -0,0 +1,223 @@
+import json
+from unittest.mock import patch
+
+import pytest
+from asgiref.sync import async_to_sync
+from django.test import RequestFactory
+
+from apps.dlp import async_views
+from apps.dlp.idempotency import get_event_counts
+from apps.dlp.models import ContentBlob, DetectedMessage, Pattern
+from apps.dlp.serializers import PatternSerializer
+
+
+def call_view(view_class, method="post", data=None, **headers):
+    """
+    Run an async view on a request, the way the ASGI handler does.
+
+    Returns:
+        tuple: The status code and the decoded JSON body of the response.
+    """
+    factory = RequestFactory()
+    if method == "get":
+        request = factory.get("/", **headers)
+    else:
+        body = data if isinstance(data, str) else json.dumps(data)
+        request = factory.post(
+            "/", data=body, content_type="application/json", **headers
+        )
+    response = async_to_sync(view_class.as_view())(request)
+    return response.status_code, json.loads(response.content or "null")
+
+
+@pytest.fixture
+def message_event():
+    return {
+        "type": "event_callback",
+        "event_id": "Ev123",
+        "event": {
+            "type": "message",
+            "text": "Test message",
+            "channel": "C123456789",
+            "ts": "1234567890.123456",
+        },
+    }
+
+
+@pytest.mark.django_db
+@patch("apps.dlp.async_views.asend_to_sqs", return_value=True)
+def test_slack_event_view_process_message(mock_send_to_sqs, message_event):
+    """
+    Test the async SlackEventView sends a message task.
+    """
+    status, body = call_view(async_views.SlackEventView, data=message_event)
+
+    assert status == 200
+    assert body == {"status": "received"}
+    mock_send_to_sqs.assert_awaited_once_with(
+        task_name="process_message",
+        kwargs={
+            "message": "Test message",
+            "channel_id": "C123456789",
+            "ts": "1234567890.123456",
+        },
+    )
+
+
+@pytest.mark.django_db
+@patch("apps.dlp.async_views.asend_to_sqs", return_value=True)
+def test_slack_event_view_ignores_redelivery(mock_send_to_sqs, message_event):
+    """
+    Test the async SlackEventView sends a redelivered event once, and counts
+    the retry and the duplicate.
+    """
+    call_view(async_views.SlackEventView, data=message_event)
+    status, _ = call_view(
+        async_views.SlackEventView, data=message_event, HTTP_X_SLACK_RETRY_NUM="1"
+    )
+
+    assert status == 200
+    mock_send_to_sqs.assert_awaited_once()
+    assert get_event_counts() == {"retries": 1, "duplicates": 1}
+
+
+@pytest.mark.django_db
+@patch("apps.dlp.async_views.asend_to_sqs", side_effect=[False, True])
+def test_slack_event_view_retries_unsent_event(mock_send_to_sqs, message_event):
+    """
+    Test the async SlackEventView processes the redelivery of an event it
+    failed to send.
+    """
+    call_view(async_views.SlackEventView, data=message_event)
+    call_view(async_views.SlackEventView, data=message_event)
+
+    assert mock_send_to_sqs.await_count == 2
+
+
+def test_slack_event_view_challenge():
+    """
+    Test the async SlackEventView answers the Slack challenge.
+    """
+    status, body = call_view(
+        async_views.SlackEventView,
+        data={"type": "url_verification", "challenge": "challenge_token"},
+    )
+
+    assert status == 200
+    assert body["challenge"] == "challenge_token"
+
+
+def test_slack_event_view_invalid_json():
+    """
+    Test the async SlackEventView rejects a body that is not a JSON object.
+    """
+    status, _ = call_view(async_views.SlackEventView, data="{not json")
+
+    assert status == 400
+
+
+def test_slack_event_view_get_not_allowed():
+    """
+    Test the async SlackEventView only accepts POST requests.
+    """
+    status, _ = call_view(async_views.SlackEventView, method="get")
+
+    assert status == 405
+
+
+@pytest.mark.django_db
+def test_pattern_list_view(pattern):
+    """
+    Test the async PatternListAPIView retrieves all patterns.
+    """
+    status, body = call_view(async_views.PatternListAPIView, method="get")
+
+    assert status == 200
+    assert body == PatternSerializer(Pattern.objects.all(), many=True).data
+
+
+@pytest.mark.django_db
+def test_pattern_list_view_not_modified(pattern, django_assert_num_queries):
+    """
+    Test the async PatternListAPIView answers a client holding the current
+    version with a 304 response, querying only the version.
+    """
+    first = async_to_sync(async_views.PatternListAPIView.as_view())(
+        RequestFactory().get("/")
+    )
+
+    with django_assert_num_queries(1):
+        status, _ = call_view(
+            async_views.PatternListAPIView,
+            method="get",
+            HTTP_IF_NONE_MATCH=first["ETag"],
+        )
+
+    assert status == 304
+
+
+@pytest.mark.django_db
+def test_detected_message_create_view(pattern):
+    """
+    Test the async DetectedMessageCreateAPIView creates a detected message.
+    """
+    status, body = call_view(
+        async_views.DetectedMessageCreateAPIView,
+        data={"content": "Test content", "pattern": str(pattern.id)},
+    )
+
+    assert status == 201
+    assert body["content"] == "Test content"
+    assert body["pattern"] == str(pattern.id)
+    assert DetectedMessage.objects.get().content == "Test content"
+
+
+@pytest.mark.django_db
+def test_detected_message_create_view_invalid_data():
+    """
+    Test the async DetectedMessageCreateAPIView returns the validation errors.
+    """
+    status, body = call_view(
+        async_views.DetectedMessageCreateAPIView, data={"content": ""}
+    )
+
+    assert status == 400
+    assert "pattern" in body
+    assert not DetectedMessage.objects.exists()
+
+
+@pytest.mark.django_db
+def test_detected_message_bulk_create_view(pattern):
+    """
+    Test the async DetectedMessageBulkCreateAPIView saves a list of detected
+    messages, the second referring to the content of the first by digest.
+    """
+    digest = ContentBlob.digest_of("Test content")
+    status, body = call_view(
+        async_views.DetectedMessageBulkCreateAPIView,
+        data=[
+            {"content": "Test content", "pattern": str(pattern.id)},
+            {"content_digest": digest, "pattern": str(pattern.id)},
+        ],
+    )
+
+    assert status == 201
+    assert [item["content_digest"] for item in body] == [digest, digest]
+    assert DetectedMessage.objects.filter(blob_id=digest).count() == 2
+
+
+@pytest.mark.django_db
+def test_content_blob_missing_view():
+    """
+    Test the async ContentBlobMissingAPIView returns the digests not stored.
+    """
+    stored = ContentBlob.store("Stored content").digest
+    missing = ContentBlob.digest_of("Missing content")
+
+    status, body = call_view(
+        async_views.ContentBlobMissingAPIView,
+        data={"digests": [stored, missing, missing]},
+    )
+
+    assert status == 200
+    assert body == {"missing": [missing]}
@@ -0,0 +1,49 @@
+from io import StringIO
+from unittest.mock import patch, call
+
+import pytest
+from django.core.management import call_command
+
+from apps.dlp.models import DetectedMessage
+
+
+@patch("apps.dlp.management.commands.create_queue.boto3.client")
+def test_create_queue_creates_every_lane(mock_client):
+    """
+    Test that create_queue creates the queue of every lane.
+    """
+    mock_sqs = mock_client.return_value
+    out = StringIO()
+
+    call_command("create_queue", stdout=out)
+
+    mock_sqs.create_queue.assert_has_calls(
+        [call(QueueName="dlp-tasks"), call(QueueName="dlp-files")]
+    )
+    assert "Queue 'dlp-tasks' created successfully." in out.getvalue()
+    assert "Queue 'dlp-files' created successfully." in out.getvalue()
+
+
+@pytest.mark.django_db(transaction=True)
+def test_load_test_reports_throughput_and_latency(live_server, pattern):
+    """
+    Test that load_test sends the requests to every target and reports them.
+    """
+    out = StringIO()
+
+    call_command(
+        "load_test",
+        f"wsgi={live_server.url}",
+        "--endpoint",
+        "detections",
+        "--requests",
+        "6",
+        "--concurrency",
+        # Test databases do not take concurrent writes
+        "1",
+        stdout=out,
+    )
+
+    assert out.getvalue().startswith("wsgi: 6 requests in ")
+    assert "[201: 6]" in out.getvalue()
+    assert DetectedMessage.objects.count() == 6
@@ -0,0 +1,95 @@
+from datetime import timedelta
+
+import pytest
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+from django.utils import timezone
+
+from apps.dlp import idempotency
+from apps.dlp.idempotency import (
+    aclaim_event,
+    arelease_event,
+    claim_event,
+    release_event,
+)
+from apps.dlp.models import EventClaim
+
+
+@pytest.fixture(autouse=True)
+def reset_prune_time(monkeypatch):
+    monkeypatch.setattr(idempotency, "_next_prune", 0.0)
+
+
+@pytest.mark.django_db
+def test_claim_event_once():
+    """
+    Test that an event is claimed once, by its ID or by its message, and that
+    claims do not depend on the cache.
+    """
+    assert claim_event("Ev1", "C1", "1.0") is True
+    cache.clear()
+
+    assert claim_event("Ev1", "C1", "1.0") is False
+    assert claim_event("Ev2", "C1", "1.0") is False
+    assert claim_event("Ev3", "C1", "2.0") is True
+
+
+@pytest.mark.django_db
+def test_release_event():
+    """
+    Test that a released event can be claimed again.
+    """
+    claim_event("Ev1", "C1", "1.0")
+    release_event("Ev1", "C1", "1.0")
+
+    assert not EventClaim.objects.exists()
+    assert claim_event("Ev1", "C1", "1.0") is True
+
+
+@pytest.mark.django_db
+def test_expired_claims_are_removed(settings):
+    """
+    Test that claims older than DLP_EVENT_DEDUP_TTL no longer count and are
+    deleted.
+    """
+    settings.DLP_EVENT_DEDUP_TTL = 60
+    claim_event("Ev1", "C1", "1.0")
+    EventClaim.objects.update(created=timezone.now() - timedelta(seconds=61))
+    idempotency._next_prune = 0.0
+
+    assert claim_event("Ev2") is True
+    assert list(EventClaim.objects.values_list("key", flat=True)) == ["event:Ev2"]
+    assert claim_event("Ev1", "C1", "1.0") is True
+
+
+@pytest.mark.django_db
+def test_expired_claims_are_pruned_occasionally(settings, django_assert_num_queries):
+    """
+    Test that expired claims are deleted at most every
+    DLP_EVENT_CLAIM_PRUNE_INTERVAL seconds, and are renewed meanwhile by the
+    redelivery of their event.
+    """
+    settings.DLP_EVENT_DEDUP_TTL = 60
+    settings.DLP_EVENT_CLAIM_PRUNE_INTERVAL = 300
+    claim_event("Ev1", "C1", "1.0")
+    EventClaim.objects.update(created=timezone.now() - timedelta(seconds=61))
+
+    with django_assert_num_queries(3):
+        # A savepoint, its release and the insert, without a deletion
+        assert claim_event("Ev2") is True
+    assert claim_event("Ev1", "C1", "1.0") is True
+    assert claim_event("Ev1", "C1", "1.0") is False
+    assert EventClaim.objects.count() == 3
+
+
+@pytest.mark.django_db
+def test_async_claim_and_release():
+    """
+    Test the async versions used by the async views.
+    """
+    assert async_to_sync(aclaim_event)("Ev1", "C1", "1.0") is True
+    assert async_to_sync(aclaim_event)("Ev1", "C1", "1.0") is False
+
+    async_to_sync(arelease_event)("Ev1", "C1", "1.0")
+
+    assert async_to_sync(aclaim_event)("Ev1", "C1", "1.0") is True
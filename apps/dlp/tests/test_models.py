@@ -0,0 +1,33 @@
+import hashlib
+
+import pytest
+
+from apps.dlp.models import ContentBlob
+
+
+@pytest.mark.django_db
+def test_content_blob_round_trip():
+    """
+    Test that content is stored compressed under its SHA-256 digest.
+    """
+    content = "card 1234-5678-9012-3456 " * 1000
+
+    blob = ContentBlob.store(content)
+
+    stored = ContentBlob.objects.get()
+    assert stored.digest == hashlib.sha256(content.encode("utf-8")).hexdigest()
+    assert stored.size == len(content)
+    assert len(bytes(stored.data)) < stored.size
+    assert stored.content == content
+    assert blob.digest == stored.digest
+
+
+@pytest.mark.django_db
+def test_content_blob_is_stored_once():
+    """
+    Test that storing the same content again keeps a single blob.
+    """
+    ContentBlob.store("Shared file")
+    ContentBlob.store("Shared file")
+
+    assert ContentBlob.objects.count() == 1
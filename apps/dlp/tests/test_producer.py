@@ -0,0 +1,283 @@
+import asyncio
+import threading
+import time
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+
+from apps.dlp.producer import (
+    AsyncQueueProducer,
+    ProducerQueueFullError,
+    ProducerSendError,
+    QueueProducer,
+    retry_delay,
+)
+from apps.dlp.transports import MemoryTransport, ThreadedTransport
+
+
+def test_messages_are_sent_in_batches():
+    """
+    Test that messages queued together are sent with one batch request per queue.
+    """
+    transport = MagicMock(wraps=MemoryTransport())
+    producer = QueueProducer(transport=transport, batch_size=10, linger=0.2)
+
+    for index in range(3):
+        producer.send("http://sqs/tasks", f"message {index}")
+    producer.send("http://sqs/files", "file")
+    assert producer.flush(timeout=5)
+
+    transport.send_batch.assert_any_call(
+        "http://sqs/tasks", ["message 0", "message 1", "message 2"]
+    )
+    transport.send_batch.assert_any_call("http://sqs/files", ["file"])
+    assert transport.send_batch.call_count == 2
+    assert producer.stats["sent"] == 4
+    producer.close(timeout=5)
+
+
+def test_failed_messages_are_retried_then_dropped():
+    """
+    Test that messages the transport fails to send are retried up to
+    ``max_attempts`` times, and reported when dropped.
+    """
+    transport = MagicMock()
+    transport.send_batch.side_effect = lambda queue_url, bodies: [
+        body for body in bodies if body == "poison"
+    ]
+    producer = QueueProducer(
+        transport=transport, linger=0.1, max_attempts=3, retry_backoff=0
+    )
+    on_failure = MagicMock()
+
+    producer.send("http://sqs/tasks", "poison", on_failure=on_failure)
+    producer.send("http://sqs/tasks", "ok")
+    assert producer.flush(timeout=5)
+
+    on_failure.assert_called_once_with()
+    assert [call.args[1] for call in transport.send_batch.call_args_list] == [
+        ["poison", "ok"],
+        ["poison"],
+        ["poison"],
+    ]
+    assert producer.stats == {"sent": 1, "dropped": 1}
+    producer.close(timeout=5)
+
+
+def test_failure_callback_connections_are_closed():
+    """
+    Test that the database connections a failure callback opens on the sender
+    thread are closed after it, even when it raises.
+    """
+    transport = MagicMock()
+    transport.send_batch.side_effect = lambda queue_url, bodies: bodies
+    producer = QueueProducer(transport=transport, linger=0.1, max_attempts=1)
+    threads = []
+    on_failure = MagicMock(side_effect=RuntimeError("database gone"))
+
+    with patch("apps.dlp.producer.connections") as connections:
+        connections.close_all.side_effect = lambda: threads.append(
+            threading.current_thread()
+        )
+        producer.send("http://sqs/tasks", "dropped", on_failure=on_failure)
+        assert producer.flush(timeout=5)
+
+    on_failure.assert_called_once_with()
+    assert [thread.name for thread in threads] == ["dlp-queue-producer"]
+    producer.close(timeout=5)
+
+
+def test_retries_back_off_without_holding_other_messages():
+    """
+    Test that a failed message is sent again after its backoff, in a later
+    batch, while new messages are sent meanwhile.
+    """
+    attempts = []
+
+    def send_batch(queue_url, bodies):
+        attempts.append((time.monotonic(), list(bodies)))
+        return ["flaky"] if len(attempts) == 1 else []
+
+    transport = MagicMock()
+    transport.send_batch.side_effect = send_batch
+    producer = QueueProducer(
+        transport=transport, linger=0, retry_backoff=0.4, retry_backoff_max=0.4
+    )
+
+    producer.send("http://sqs/tasks", "flaky")
+    time.sleep(0.1)
+    producer.send("http://sqs/tasks", "next")
+    assert producer.flush(timeout=5)
+
+    assert [bodies for _, bodies in attempts] == [["flaky"], ["next"], ["flaky"]]
+    assert 0.2 <= attempts[2][0] - attempts[0][0] < 1
+    assert producer.stats == {"sent": 2}
+    producer.close(timeout=5)
+
+
+def test_retry_delay_doubles_with_jitter():
+    """
+    Test that the delay before a retry doubles with every attempt up to its
+    maximum, of which a random half is waited.
+    """
+    for attempt, delay in [(1, 0.1), (2, 0.2), (3, 0.4), (6, 1.0)]:
+        assert delay / 2 <= retry_delay(attempt, 0.1, 1.0) <= delay
+
+
+def test_full_queue_applies_backpressure():
+    """
+    Test that a sender waits for room in a full queue, then gives up.
+    """
+    sending, release = threading.Event(), threading.Event()
+
+    def send_batch(queue_url, bodies):
+        sending.set()
+        release.wait()
+        return []
+
+    transport = MagicMock()
+    transport.send_batch.side_effect = send_batch
+    producer = QueueProducer(
+        transport=transport, batch_size=1, queue_size=1, block_timeout=0.05
+    )
+
+    # The first message is being sent and the second fills the queue
+    producer.send("http://sqs/tasks", "sending")
+    assert sending.wait(timeout=5)
+    producer.send("http://sqs/tasks", "queued")
+    with pytest.raises(ProducerQueueFullError):
+        producer.send("http://sqs/tasks", "rejected")
+
+    release.set()
+    assert producer.flush(timeout=5)
+    assert producer.stats == {"sent": 2, "rejected": 1}
+    producer.close(timeout=5)
+
+
+def test_close_sends_queued_messages():
+    """
+    Test that closing sends what is still queued and refuses new messages.
+    """
+    transport = MemoryTransport()
+    producer = QueueProducer(transport=transport, linger=60)
+
+    producer.send("http://sqs/tasks", "last")
+    assert producer.close(timeout=5)
+
+    assert transport.queues["http://sqs/tasks"] == ["last"]
+    with pytest.raises(RuntimeError):
+        producer.send("http://sqs/tasks", "too late")
+
+
+def run_producer(producer, *sends):
+    """
+    Run sends of an async producer concurrently, then close it.
+
+    Returns:
+        list: The result or exception of every send.
+    """
+
+    async def run():
+        results = await asyncio.gather(
+            *(producer.send(queue_url, body) for queue_url, body in sends),
+            return_exceptions=True,
+        )
+        await producer.close()
+        return results
+
+    return asyncio.run(run())
+
+
+def test_async_concurrent_messages_are_sent_in_batches():
+    """
+    Test that messages sent concurrently are sent with one batch request per
+    queue, and that every send returns once its message is sent.
+    """
+    transport = ThreadedTransport(MagicMock(wraps=MemoryTransport()))
+    producer = AsyncQueueProducer(transport=transport, batch_size=10, linger=0.1)
+
+    results = run_producer(
+        producer,
+        *[("http://sqs/tasks", f"message {index}") for index in range(3)],
+        ("http://sqs/files", "file"),
+    )
+
+    assert results == [None] * 4
+    transport.transport.send_batch.assert_any_call(
+        "http://sqs/tasks", ["message 0", "message 1", "message 2"]
+    )
+    transport.transport.send_batch.assert_any_call("http://sqs/files", ["file"])
+    assert transport.transport.send_batch.call_count == 2
+    assert producer.stats["sent"] == 4
+
+
+def test_async_full_batch_is_sent_without_lingering():
+    """
+    Test that a full batch is sent right away.
+    """
+    transport = ThreadedTransport(MemoryTransport())
+    producer = AsyncQueueProducer(transport=transport, batch_size=2, linger=60)
+
+    async def run():
+        await asyncio.wait_for(
+            asyncio.gather(
+                producer.send("http://sqs/tasks", "first"),
+                producer.send("http://sqs/tasks", "second"),
+            ),
+            timeout=5,
+        )
+        await producer.close()
+
+    asyncio.run(run())
+
+    assert transport.transport.queues["http://sqs/tasks"] == ["first", "second"]
+
+
+def test_async_failed_messages_are_retried_then_raised():
+    """
+    Test that messages the transport fails to send are retried up to
+    ``max_attempts`` times, after which their senders get an error.
+    """
+    transport = MagicMock()
+    transport.send_batch = AsyncMock(
+        side_effect=lambda queue_url, bodies: [
+            body for body in bodies if body == "poison"
+        ]
+    )
+    transport.close = AsyncMock()
+    producer = AsyncQueueProducer(
+        transport=transport, linger=0.05, max_attempts=3, retry_backoff=0.01
+    )
+
+    poison, ok = run_producer(
+        producer, ("http://sqs/tasks", "poison"), ("http://sqs/tasks", "ok")
+    )
+
+    assert isinstance(poison, ProducerSendError)
+    assert ok is None
+    assert [call.args[1] for call in transport.send_batch.call_args_list] == [
+        ["poison", "ok"],
+        ["poison"],
+        ["poison"],
+    ]
+    assert producer.stats == {"sent": 1, "dropped": 1}
+    transport.close.assert_awaited_once()
+
+
+def test_async_too_many_waiting_messages_are_rejected():
+    """
+    Test that a sender waits for room when too many messages are waiting,
+    then gives up.
+    """
+    transport = ThreadedTransport(MemoryTransport())
+    producer = AsyncQueueProducer(
+        transport=transport, linger=0.2, queue_size=1, block_timeout=0.05
+    )
+
+    waiting, rejected = run_producer(
+        producer, ("http://sqs/tasks", "waiting"), ("http://sqs/tasks", "rejected")
+    )
+
+    assert waiting is None
+    assert isinstance(rejected, ProducerQueueFullError)
+    assert producer.stats == {"sent": 1, "rejected": 1}
@@ -1,7 +1,15 @@
+import asyncio
 import json
 import pytest
-from unittest.mock import patch, MagicMock
-from apps.dlp.services import send_to_sqs
+from unittest.mock import patch
+from apps.dlp.producer import (
+    AsyncQueueProducer,
+    ProducerQueueFullError,
+    ProducerSendError,
+    QueueProducer,
+)
+from apps.dlp.services import asend_to_sqs, send_to_sqs
+from apps.dlp.transports import MemoryTransport, SQSTransport, ThreadedTransport
 
 
 @pytest.fixture
@@ -9,20 +17,32 @@ def sqs_client_mock():
     """
     Fixture to mock boto3 SQS client.
     """
-    with patch("apps.dlp.services.boto3.client") as mock_client:
+    with patch("apps.dlp.transports.boto3.client") as mock_client:
         yield mock_client
 
 
+@pytest.fixture
+def producer(sqs_client_mock):
+    """
+    Fixture replacing the producer of the process with one sending to the
+    mocked SQS client.
+    """
+    producer = QueueProducer(transport=SQSTransport(), linger=0)
+    with patch("apps.dlp.services.get_producer", return_value=producer):
+        yield producer
+    producer.close(timeout=5)
+
+
 @patch("apps.dlp.services.logger")
-def test_send_to_sqs_success(mock_logger, sqs_client_mock):
+def test_send_to_sqs_success(mock_logger, sqs_client_mock, producer):
     """
-    Test send_to_sqs successfully sends a message to SQS.
+    Test send_to_sqs queues a message that is then sent to SQS in a batch.
     """
     # Configure the mocked SQS client
     mock_sqs = sqs_client_mock.return_value
-    mock_sqs.send_message.return_value = {
-        "ResponseMetadata": {"HTTPStatusCode": 200},
-        "MessageId": "12345",
+    mock_sqs.send_message_batch.return_value = {
+        "Successful": [{"Id": "0", "MessageId": "12345"}],
+        "Failed": [],
     }
 
     task_name = "process_message"
@@ -33,15 +53,14 @@ def test_send_to_sqs_success(mock_logger, sqs_client_mock):
     queue_url = "http://elasticmq:9324/000000000000/dlp-tasks"
 
     # Call the function
-    send_to_sqs(task_name=task_name, args=args, kwargs=kwargs)
+    assert send_to_sqs(task_name=task_name, args=args, kwargs=kwargs) is True
+    assert producer.flush(timeout=5)
 
     # Assertions for logger
     mock_logger.info.assert_any_call(
         f"Sending message to SQS: {{'task': '{task_name}', 'args': {args}, 'kwargs': {kwargs}}}"
     )
-    mock_logger.info.assert_any_call(
-        "Message sent to SQS successfully. Response: {'ResponseMetadata': {'HTTPStatusCode': 200}, 'MessageId': '12345'}"
-    )
+    mock_logger.info.assert_any_call("Message queued for SQS.")
 
     # Assertions for SQS client
     sqs_client_mock.assert_called_once_with(
@@ -51,58 +70,88 @@ def test_send_to_sqs_success(mock_logger, sqs_client_mock):
         aws_access_key_id="test",
         aws_secret_access_key="test",
     )
-    mock_sqs.send_message.assert_called_once_with(
+    mock_sqs.send_message_batch.assert_called_once_with(
         QueueUrl=queue_url,
-        MessageBody=json.dumps(
+        Entries=[
             {
-                "task": task_name,
-                "args": args,
-                "kwargs": kwargs,
+                "Id": "0",
+                "MessageBody": json.dumps(
+                    {
+                        "task": task_name,
+                        "args": args,
+                        "kwargs": kwargs,
+                    }
+                ),
             }
-        ),
+        ],
     )
 
 
 @patch("apps.dlp.services.logger")
-def test_send_to_sqs_failure(mock_logger, sqs_client_mock):
+def test_send_to_sqs_failure(mock_logger, producer):
     """
-    Test send_to_sqs handles an error during the SQS operation.
+    Test send_to_sqs logs a message it could not queue.
     """
-    # Simulate an exception in SQS client
-    mock_sqs = sqs_client_mock.return_value
-    mock_sqs.send_message.side_effect = Exception("SQS error")
-
     task_name = "process_file"
     args = []
     kwargs = {"file_id": "F123456"}
 
-    # Adjust URL to match the actual test environment
-    queue_url = "http://elasticmq:9324/000000000000/dlp-tasks"
-
-    # Call the function
-    send_to_sqs(task_name=task_name, args=args, kwargs=kwargs)
+    # Simulate a full producer queue
+    with patch.object(
+        producer, "send", side_effect=ProducerQueueFullError("queue full")
+    ) as mock_send:
+        assert send_to_sqs(task_name=task_name, args=args, kwargs=kwargs) is False
 
     # Assertions for logger
     mock_logger.info.assert_any_call(
         f"Sending message to SQS: {{'task': '{task_name}', 'args': {args}, 'kwargs': {kwargs}}}"
     )
-    mock_logger.error.assert_any_call("Failed to send message to SQS. Error: SQS error")
-
-    # Assertions for SQS client
-    sqs_client_mock.assert_called_once_with(
-        "sqs",
-        endpoint_url="http://sqs:9324",
-        region_name="us-east-1",
-        aws_access_key_id="test",
-        aws_secret_access_key="test",
+    mock_logger.error.assert_any_call(
+        "Failed to send message to SQS. Error: queue full"
     )
-    mock_sqs.send_message.assert_called_once_with(
-        QueueUrl=queue_url,
-        MessageBody=json.dumps(
-            {
-                "task": task_name,
-                "args": args,
-                "kwargs": kwargs,
-            }
-        ),
+
+    # The task was routed to the files lane
+    mock_send.assert_called_once_with(
+        "http://elasticmq:9324/000000000000/dlp-files",
+        json.dumps({"task": task_name, "args": args, "kwargs": kwargs}),
+        on_failure=None,
     )
+
+
+@patch("apps.dlp.services.logger")
+def test_asend_to_sqs_success(mock_logger):
+    """
+    Test asend_to_sqs sends a message with the producer of the event loop.
+    """
+    producer = AsyncQueueProducer(transport=ThreadedTransport(MemoryTransport()))
+    kwargs = {"file_id": "F123456"}
+
+    async def send():
+        with patch("apps.dlp.services.get_async_producer", return_value=producer):
+            sent = await asend_to_sqs(task_name="process_file", kwargs=kwargs)
+        await producer.close()
+        return sent
+
+    assert asyncio.run(send()) is True
+    assert producer.transport.transport.queues[
+        "http://elasticmq:9324/000000000000/dlp-files"
+    ] == [json.dumps({"task": "process_file", "args": [], "kwargs": kwargs})]
+    mock_logger.info.assert_any_call("Message sent to SQS.")
+
+
+@patch("apps.dlp.services.logger")
+def test_asend_to_sqs_failure(mock_logger):
+    """
+    Test asend_to_sqs logs a message it could not send.
+    """
+    producer = AsyncQueueProducer(transport=ThreadedTransport(MemoryTransport()))
+
+    async def send():
+        with patch("apps.dlp.services.get_async_producer", return_value=producer):
+            with patch.object(
+                producer, "send", side_effect=ProducerSendError("not sent")
+            ):
+                return await asend_to_sqs(task_name="process_message")
+
+    assert asyncio.run(send()) is False
+    mock_logger.error.assert_any_call("Failed to send message to SQS. Error: not sent")
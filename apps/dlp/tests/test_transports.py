@@ -0,0 +1,140 @@
+import json
+import sqlite3
+from unittest.mock import patch
+
+import pytest
+from django.core.exceptions import ImproperlyConfigured
+
+from apps.dlp.producer import get_producer
+from apps.dlp.services import send_to_sqs
+from apps.dlp.transports import (
+    MemoryTransport,
+    SQLiteTransport,
+    SQSTransport,
+    get_transport,
+)
+
+
+def test_get_transport(settings, tmp_path):
+    """
+    Test that the transport is selected by the DLP_QUEUE_TRANSPORT setting.
+    """
+    settings.DLP_QUEUE_SQLITE_PATH = str(tmp_path / "queue.sqlite3")
+
+    settings.DLP_QUEUE_TRANSPORT = "sqlite"
+    assert isinstance(get_transport(), SQLiteTransport)
+    settings.DLP_QUEUE_TRANSPORT = "memory"
+    assert get_transport() is get_transport()
+
+    settings.DLP_QUEUE_TRANSPORT = "kafka"
+    with pytest.raises(ValueError, match="Unknown queue transport: kafka"):
+        get_transport()
+
+
+def test_sqlite_path_is_required(settings):
+    """
+    Test that the SQLite queue is not used without a configured path, which
+    must be the one the worker receives from.
+    """
+    settings.DLP_QUEUE_TRANSPORT = "sqlite"
+    settings.DLP_QUEUE_SQLITE_PATH = ""
+
+    with pytest.raises(ImproperlyConfigured, match="DLP_QUEUE_SQLITE_PATH"):
+        get_transport()
+
+
+def test_send_to_memory_transport(settings):
+    """
+    Test that send_to_sqs goes through the producer and configured transport.
+    """
+    settings.DLP_QUEUE_TRANSPORT = "memory"
+    transport = get_transport()
+    transport.queues.clear()
+
+    send_to_sqs(task_name="process_message", kwargs={"message": "hi"})
+    assert get_producer().flush(timeout=5)
+
+    (body,) = transport.queues[settings.AWS_SQS_QUEUE_URL]
+    assert json.loads(body) == {
+        "task": "process_message",
+        "args": [],
+        "kwargs": {"message": "hi"},
+    }
+
+
+def test_sqlite_transport_writes_visible_messages(tmp_path):
+    """
+    Test that the SQLite transport stores messages the worker can receive.
+    """
+    path = str(tmp_path / "queue.sqlite3")
+    transport = SQLiteTransport(path=path)
+
+    assert transport.send_batch("dlp-tasks", ["first"]) == []
+    assert transport.send_batch("dlp-files", ["second", "third"]) == []
+
+    connection = sqlite3.connect(path)
+    rows = connection.execute(
+        "SELECT queue, body, visible_at <= sent_at, receipt_handle "
+        "FROM queue_messages ORDER BY id"
+    ).fetchall()
+    connection.close()
+    assert rows == [
+        ("dlp-tasks", "first", 1, None),
+        ("dlp-files", "second", 1, None),
+        ("dlp-files", "third", 1, None),
+    ]
+
+
+def test_sqlite_transport_creates_schema_once(tmp_path):
+    """
+    Test that the SQLite transport creates the queue schema on its first send
+    only, so that batches do not wait behind the schema lock.
+    """
+    transport = SQLiteTransport(path=str(tmp_path / "queue.sqlite3"))
+    statements = []
+    connect = sqlite3.connect
+
+    def traced_connect(*args, **kwargs):
+        connection = connect(*args, **kwargs)
+        connection.set_trace_callback(statements.append)
+        return connection
+
+    with patch("apps.dlp.transports.sqlite3.connect", side_effect=traced_connect):
+        transport.send_batch("dlp-tasks", ["first"])
+        transport.send_batch("dlp-tasks", ["second"])
+
+    assert sum("CREATE TABLE" in statement for statement in statements) == 1
+    assert sum("INSERT" in statement for statement in statements) == 2
+
+
+@patch("apps.dlp.transports.boto3.client")
+def test_sqs_transport_send_batch(mock_client):
+    """
+    Test that the SQS transport sends batches of ten and returns failed bodies.
+    """
+    mock_sqs = mock_client.return_value
+    mock_sqs.send_message_batch.side_effect = [
+        {"Failed": [{"Id": "1", "SenderFault": True}]},
+        {},
+    ]
+    bodies = [f"body-{index}" for index in range(11)]
+
+    failed = SQSTransport().send_batch("dlp-tasks", bodies)
+
+    assert failed == ["body-1"]
+    assert mock_sqs.send_message_batch.call_count == 2
+    assert mock_sqs.send_message_batch.call_args.kwargs["Entries"] == [
+        {"Id": "0", "MessageBody": "body-10"}
+    ]
+
+
+def test_memory_transport_send_batch():
+    """
+    Test that the in-memory transport keeps the messages of each queue in order.
+    """
+    transport = MemoryTransport()
+
+    transport.send_batch("dlp-tasks", ["a", "b"])
+    transport.send_batch("dlp-tasks", ["c"])
+
+    assert transport.queues == {"dlp-tasks": ["a", "b", "c"]}
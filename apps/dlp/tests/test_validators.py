@@ -0,0 +1,65 @@
+import json
+from pathlib import Path
+
+import pytest
+from django.core.exceptions import ValidationError
+
+from apps.dlp.models import Pattern
+from apps.dlp.validators import probe_strings, validate_regex
+
+
+FIXTURE_PATH = (
+    Path(__file__).resolve().parent.parent / "fixtures" / "initial_patterns.json"
+)
+
+
+def fixture_regexes():
+    with open(FIXTURE_PATH) as fixture:
+        return [item["fields"]["regex"] for item in json.load(fixture)]
+
+
+@pytest.mark.parametrize("regex", fixture_regexes())
+def test_validate_regex_accepts_fixture_patterns(regex):
+    """
+    Test that the shipped patterns pass the ReDoS probes.
+    """
+    validate_regex(regex)
+
+
+def test_validate_regex_rejects_invalid_regex():
+    """
+    Test that a regex that does not compile is rejected.
+    """
+    with pytest.raises(ValidationError, match="Invalid regular expression"):
+        validate_regex("(unclosed")
+
+
+def test_validate_regex_rejects_catastrophic_backtracking(settings):
+    """
+    Test that a regex with catastrophic backtracking is rejected within the budget.
+    """
+    settings.DLP_PATTERN_PROBE_BUDGET = 0.2
+
+    with pytest.raises(ValidationError, match="adversarial input"):
+        validate_regex(r"^(a+)+$")
+
+
+def test_probe_strings_use_regex_characters():
+    """
+    Test that the probes repeat characters taken from the regex itself.
+    """
+    probes = probe_strings(r"x+y")
+
+    assert "x" * 2000 + "\0" in probes
+    assert "xy" * 1000 + "\0" in probes
+
+
+@pytest.mark.django_db
+def test_pattern_full_clean_runs_validator():
+    """
+    Test that saving a pattern through model validation rejects unsafe regexes.
+    """
+    pattern = Pattern(name="Unsafe", regex=r"(\d+)+x")
+
+    with pytest.raises(ValidationError):
+        pattern.full_clean()
@@ -1,14 +1,18 @@
 import pytest
 from rest_framework.test import APIClient
+from django.core.cache import cache
 from django.urls import reverse
-from unittest.mock import patch
-from apps.dlp.models import Pattern, DetectedMessage
+from unittest.mock import ANY, patch
+from apps.dlp.idempotency import get_event_counts
+from apps.dlp.models import ContentBlob, Pattern, DetectedMessage
 from apps.dlp.serializers import PatternSerializer
 
 
 @pytest.fixture
 def detected_message(pattern):
-    return DetectedMessage.objects.create(content="Test content", pattern=pattern)
+    return DetectedMessage.objects.create(
+        blob=ContentBlob.store("Test content"), pattern=pattern
+    )
 
 
 # Tests for SlackEventView
@@ -39,6 +43,7 @@ def test_slack_event_view_process_message(mock_send_to_sqs, api_client):
             "channel_id": "C123456789",
             "ts": "1234567890.123456",
         },
+        on_failure=ANY,
     )
 
 
@@ -64,6 +69,7 @@ def test_slack_event_view_process_file(mock_send_to_sqs, api_client):
     mock_send_to_sqs.assert_called_once_with(
         task_name="process_file",
         kwargs={"file_id": "F123456", "channel_id": "C123456789"},
+        on_failure=ANY,
     )
 
 
@@ -80,6 +86,103 @@ def test_slack_event_view_challenge(api_client):
     assert response.json()["challenge"] == "challenge_token"
 
 
+@pytest.mark.django_db
+@patch("apps.dlp.views.send_to_sqs", return_value=True)
+def test_slack_event_view_ignores_redelivery(mock_send_to_sqs, api_client):
+    """
+    Test SlackEventView acknowledges a redelivered event without queueing it
+    again, and counts the retry and the duplicate.
+    """
+    url = reverse("dlp:slack_event")
+    payload = {
+        "type": "event_callback",
+        "event_id": "Ev123",
+        "event": {
+            "type": "message",
+            "text": "Test message",
+            "channel": "C123456789",
+            "ts": "1234567890.123456",
+        },
+    }
+
+    first = api_client.post(url, data=payload, format="json")
+    retry = api_client.post(
+        url,
+        data=payload,
+        format="json",
+        HTTP_X_SLACK_RETRY_NUM="1",
+        HTTP_X_SLACK_RETRY_REASON="http_timeout",
+    )
+
+    assert first.status_code == retry.status_code == 200
+    mock_send_to_sqs.assert_called_once()
+    assert get_event_counts() == {"retries": 1, "duplicates": 1}
+
+
+@pytest.mark.django_db
+@patch("apps.dlp.views.send_to_sqs", return_value=True)
+def test_slack_event_view_same_message_other_event(mock_send_to_sqs, api_client):
+    """
+    Test SlackEventView queues a message once even when it comes with another
+    event ID.
+    """
+    url = reverse("dlp:slack_event")
+    event = {
+        "type": "message",
+        "text": "Test message",
+        "channel": "C123456789",
+        "ts": "1234567890.123456",
+    }
+
+    for event_id in ("Ev1", "Ev2"):
+        payload = {"type": "event_callback", "event_id": event_id, "event": event}
+        api_client.post(url, data=payload, format="json")
+
+    mock_send_to_sqs.assert_called_once()
+
+
+@pytest.mark.django_db
+@patch("apps.dlp.views.send_to_sqs", side_effect=[False, True])
+def test_slack_event_view_retries_unqueued_event(mock_send_to_sqs, api_client):
+    """
+    Test SlackEventView processes the redelivery of an event it failed to queue.
+    """
+    url = reverse("dlp:slack_event")
+    payload = {
+        "type": "event_callback",
+        "event_id": "Ev123",
+        "event": {"type": "message", "files": [{"id": "F1"}], "channel": "C1"},
+    }
+
+    api_client.post(url, data=payload, format="json")
+    api_client.post(url, data=payload, format="json", HTTP_X_SLACK_RETRY_NUM="1")
+
+    assert mock_send_to_sqs.call_count == 2
+    assert get_event_counts() == {"retries": 1, "duplicates": 0}
+
+
+@pytest.mark.django_db
+@patch("apps.dlp.views.send_to_sqs", return_value=True)
+def test_slack_event_view_releases_dropped_event(mock_send_to_sqs, api_client):
+    """
+    Test SlackEventView lets the redelivery of an event be processed when one
+    of its queued tasks is dropped by the producer.
+    """
+    url = reverse("dlp:slack_event")
+    payload = {
+        "type": "event_callback",
+        "event_id": "Ev123",
+        "event": {"type": "message", "files": [{"id": "F1"}], "channel": "C1"},
+    }
+
+    api_client.post(url, data=payload, format="json")
+    mock_send_to_sqs.call_args.kwargs["on_failure"]()
+    api_client.post(url, data=payload, format="json", HTTP_X_SLACK_RETRY_NUM="1")
+
+    assert mock_send_to_sqs.call_count == 2
+    assert get_event_counts() == {"retries": 1, "duplicates": 0}
+
+
 # Tests for PatternListAPIView
 @pytest.mark.django_db
 def test_pattern_list_view(api_client, pattern):
@@ -95,6 +198,87 @@ def test_pattern_list_view(api_client, pattern):
     assert response.json() == serializer.data
 
 
+@pytest.mark.django_db
+def test_pattern_list_view_not_modified(api_client, pattern, django_assert_num_queries):
+    """
+    Test PatternListAPIView serves the cached list with its validators, and
+    answers a client holding its version with a 304 response, querying only
+    the version of the pattern set.
+    """
+    url = reverse("dlp:pattern-list")
+    first = api_client.get(url)
+
+    with django_assert_num_queries(2):
+        cached = api_client.get(url)
+        not_modified = api_client.get(url, HTTP_IF_NONE_MATCH=first["ETag"])
+
+    assert cached.content == first.content
+    assert cached["ETag"] == first["ETag"]
+    assert not_modified.status_code == 304
+    assert not_modified.content == b""
+    assert not_modified["ETag"] == first["ETag"]
+
+
+@pytest.mark.django_db
+def test_pattern_list_view_pattern_changes(api_client, pattern):
+    """
+    Test PatternListAPIView serves a new version once a pattern is saved or
+    soft deleted.
+    """
+    url = reverse("dlp:pattern-list")
+    first = api_client.get(url)
+
+    added = Pattern.objects.create(name="Added", regex=r"[a-z]+")
+    after_save = api_client.get(url, HTTP_IF_NONE_MATCH=first["ETag"])
+    added.delete()
+    after_delete = api_client.get(url, HTTP_IF_NONE_MATCH=after_save["ETag"])
+
+    assert after_save.status_code == after_delete.status_code == 200
+    assert len({first["ETag"], after_save["ETag"], after_delete["ETag"]}) == 3
+    assert [item["name"] for item in after_save.json()] == ["Test Pattern", "Added"]
+    assert [item["name"] for item in after_delete.json()] == ["Test Pattern"]
+
+
+@pytest.mark.django_db
+def test_pattern_list_view_version_does_not_depend_on_cache(api_client, pattern):
+    """
+    Test PatternListAPIView derives the version from the database, so that
+    processes with separate caches agree on it and see every change.
+    """
+    url = reverse("dlp:pattern-list")
+    first = api_client.get(url)
+
+    cache.clear()
+    same = api_client.get(url, HTTP_IF_NONE_MATCH=first["ETag"])
+    Pattern.objects.filter(pk=pattern.pk).update(is_removed=True)
+    changed = api_client.get(url, HTTP_IF_NONE_MATCH=first["ETag"])
+
+    assert same.status_code == 304
+    assert changed.status_code == 200
+    assert changed.json() == []
+
+
+@pytest.mark.django_db
+def test_pattern_list_view_queryset_delete(api_client, pattern):
+    """
+    Test PatternListAPIView serves the new list to every client after patterns
+    are soft deleted with a queryset, which does not update their modified
+    time, and does not answer If-Modified-Since with a 304.
+    """
+    url = reverse("dlp:pattern-list")
+    first = api_client.get(url)
+
+    Pattern.objects.filter(pk=pattern.pk).delete()
+    by_etag = api_client.get(url, HTTP_IF_NONE_MATCH=first["ETag"])
+    by_date = api_client.get(
+        url, HTTP_IF_MODIFIED_SINCE="Fri, 01 Jan 2100 00:00:00 GMT"
+    )
+
+    assert "Last-Modified" not in first
+    assert by_etag.status_code == by_date.status_code == 200
+    assert by_etag.json() == by_date.json() == []
+
+
 # Tests for DetectedMessageCreateAPIView
 @pytest.mark.django_db
 def test_detected_message_create_view(api_client, pattern):
@@ -123,3 +307,152 @@ def test_detected_message_create_view_invalid_data(api_client):
     response = api_client.post(url, data=payload, format="json")
 
     assert response.status_code == 400
+
+
+# Tests for DetectedMessageBulkCreateAPIView
+@pytest.mark.django_db
+def test_detected_message_bulk_create_view(
+    api_client, pattern, django_assert_max_num_queries
+):
+    """
+    Test DetectedMessageBulkCreateAPIView saves all detected messages and their
+    content with a single INSERT each, and answers without the content.
+    """
+    url = reverse("dlp:detected-message-bulk-create")
+    payload = [
+        {"content": f"Test content {i % 2}", "pattern": str(pattern.id)}
+        for i in range(5)
+    ]
+
+    # One lookup of the pattern per item, one of the digests, and two INSERTs
+    with django_assert_max_num_queries(len(payload) + 4):
+        response = api_client.post(url, data=payload, format="json")
+
+    assert response.status_code == 201
+    assert DetectedMessage.objects.count() == 5
+    assert ContentBlob.objects.count() == 2
+    assert [item["content_digest"] for item in response.json()] == [
+        ContentBlob.digest_of(f"Test content {i % 2}") for i in range(5)
+    ]
+    assert "content" not in response.json()[0]
+
+
+@pytest.mark.django_db
+def test_detected_message_bulk_create_view_by_digest(api_client, pattern):
+    """
+    Test DetectedMessageBulkCreateAPIView accepts the digest of content stored
+    before, or sent by an earlier item of the same request, instead of the
+    content.
+    """
+    stored = ContentBlob.store("Stored content")
+    new_digest = ContentBlob.digest_of("New content")
+    url = reverse("dlp:detected-message-bulk-create")
+    payload = [
+        {"content_digest": stored.digest, "pattern": str(pattern.id)},
+        {"content": "New content", "pattern": str(pattern.id)},
+        {"content_digest": new_digest, "pattern": str(pattern.id)},
+    ]
+
+    response = api_client.post(url, data=payload, format="json")
+
+    assert response.status_code == 201
+    assert sorted(DetectedMessage.objects.values_list("blob_id", flat=True)) == sorted(
+        [stored.digest, new_digest, new_digest]
+    )
+
+
+@pytest.mark.django_db
+def test_detected_message_bulk_create_view_unknown_digest(api_client, pattern):
+    """
+    Test DetectedMessageBulkCreateAPIView rejects digests of content it does not
+    have, and digests that do not match the content sent with them.
+    """
+    url = reverse("dlp:detected-message-bulk-create")
+    payload = [
+        {"content_digest": "0" * 64, "pattern": str(pattern.id)},
+        {"content": "Test", "content_digest": "1" * 64, "pattern": str(pattern.id)},
+    ]
+
+    response = api_client.post(url, data=payload, format="json")
+
+    assert response.status_code == 400
+    assert [list(errors) for errors in response.json()] == [
+        ["content_digest"],
+        ["content_digest"],
+    ]
+    assert ContentBlob.objects.count() == 0
+
+
+@pytest.mark.django_db
+def test_detected_message_bulk_create_view_invalid_item(api_client, pattern):
+    """
+    Test DetectedMessageBulkCreateAPIView saves nothing if any item is invalid.
+    """
+    url = reverse("dlp:detected-message-bulk-create")
+    payload = [{"content": "Test content", "pattern": str(pattern.id)}, {"content": ""}]
+
+    response = api_client.post(url, data=payload, format="json")
+
+    assert response.status_code == 400
+    assert DetectedMessage.objects.count() == 0
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("digest", [["a" * 64], {"digest": "a" * 64}, 1])
+def test_detected_message_bulk_create_view_invalid_digest(api_client, pattern, digest):
+    """
+    Test DetectedMessageBulkCreateAPIView rejects a content digest that is not
+    a string.
+    """
+    url = reverse("dlp:detected-message-bulk-create")
+    payload = [{"content_digest": digest, "pattern": str(pattern.id)}]
+
+    response = api_client.post(url, data=payload, format="json")
+
+    assert response.status_code == 400
+    assert list(response.json()[0]) == ["content_digest"]
+    assert DetectedMessage.objects.count() == 0
+
+
+@pytest.mark.django_db
+def test_detected_message_bulk_create_view_limit(api_client, pattern, settings):
+    """
+    Test DetectedMessageBulkCreateAPIView rejects empty and oversized batches.
+    """
+    settings.DLP_DETECTED_MESSAGES_BULK_LIMIT = 2
+    url = reverse("dlp:detected-message-bulk-create")
+    payload = [{"content": "Test content", "pattern": str(pattern.id)}] * 3
+
+    assert api_client.post(url, data=payload, format="json").status_code == 400
+    assert api_client.post(url, data=[], format="json").status_code == 400
+    assert DetectedMessage.objects.count() == 0
+
+
+# Tests for ContentBlobMissingAPIView
+@pytest.mark.django_db
+def test_content_blob_missing_view(api_client):
+    """
+    Test ContentBlobMissingAPIView returns the digests that are not stored yet.
+    """
+    stored = ContentBlob.store("Stored content")
+    missing = ContentBlob.digest_of("New content")
+    url = reverse("dlp:content-blob-missing")
+
+    response = api_client.post(
+        url, data={"digests": [stored.digest, missing, missing]}, format="json"
+    )
+
+    assert response.status_code == 200
+    assert response.json() == {"missing": [missing]}
+
+
+@pytest.mark.django_db
+def test_content_blob_missing_view_invalid_digest(api_client):
+    """
+    Test ContentBlobMissingAPIView rejects values that are not SHA-256 digests.
+    """
+    url = reverse("dlp:content-blob-missing")
+
+    response = api_client.post(url, data={"digests": ["abc"]}, format="json")
+
+    assert response.status_code == 400
@@ -0,0 +1,276 @@
+import asyncio
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+
+import boto3
+from aiobotocore.session import AioSession
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+# Maximum number of entries of an SQS batch request
+SQS_MAX_BATCH = 10
+
+# Schema of the SQLite queue, which must match SQLITE_SCHEMA in
+# dlp_distributed/transports.py, where the worker consumes it
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS queue_messages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    queue TEXT NOT NULL,
+    body TEXT NOT NULL,
+    sent_at REAL NOT NULL,
+    visible_at REAL NOT NULL,
+    receipt_handle TEXT
+);
+CREATE INDEX IF NOT EXISTS queue_messages_visible
+    ON queue_messages (queue, visible_at);
+CREATE INDEX IF NOT EXISTS queue_messages_receipt_handle
+    ON queue_messages (receipt_handle);
+"""
+
+
+class QueueTransport:
+    """
+    Interface of the queue backends the tasks are sent to.
+
+    The backend only produces messages; they are received, acknowledged and
+    kept invisible while in flight by the worker's transport of the same name.
+    """
+
+    def send_batch(self, queue_url: str, bodies: list) -> list:
+        """
+        Send messages to a queue.
+
+        Args:
+            queue_url (str): The queue to send to.
+            bodies (list): The message bodies.
+
+        Returns:
+            list: The bodies that could not be sent.
+        """
+        raise NotImplementedError
+
+
+class SQSTransport(QueueTransport):
+    def __init__(self):
+        """
+        Initialize a transport sending to SQS with the configured credentials.
+        """
+        self.sqs = boto3.client(
+            "sqs",
+            endpoint_url=settings.AWS_SQS_ENDPOINT_URL,
+            region_name=settings.AWS_REGION_NAME,
+            aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
+            aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
+        )
+
+    def send_batch(self, queue_url: str, bodies: list) -> list:
+        failed = []
+        for start in range(0, len(bodies), SQS_MAX_BATCH):
+            batch = bodies[start : start + SQS_MAX_BATCH]
+            response = self.sqs.send_message_batch(
+                QueueUrl=queue_url,
+                Entries=[
+                    {"Id": str(index), "MessageBody": body}
+                    for index, body in enumerate(batch)
+                ],
+            )
+            failed.extend(
+                batch[int(failure["Id"])] for failure in response.get("Failed", [])
+            )
+        return failed
+
+
+class SQLiteTransport(QueueTransport):
+    def __init__(self, path=None):
+        """
+        Initialize a transport writing to the SQLite queue of a single node.
+
+        Args:
+            path (str, optional): Path of the SQLite database shared with the
+                worker. Defaults to the ``DLP_QUEUE_SQLITE_PATH`` setting.
+
+        Raises:
+            ImproperlyConfigured: If no path is given or configured.
+        """
+        self.path = path or settings.DLP_QUEUE_SQLITE_PATH
+        if not self.path:
+            raise ImproperlyConfigured(
+                "DLP_QUEUE_SQLITE_PATH must be set to the SQLite queue shared with "
+                "the worker."
+            )
+        # The schema is created on the first send, not on every batch
+        self._schema_created = False
+
+    def send_batch(self, queue_url: str, bodies: list) -> list:
+        """
+        Insert messages, visible right away, in a single transaction.
+        """
+        now = time.time()
+        connection = sqlite3.connect(self.path, timeout=30)
+        try:
+            if not self._schema_created:
+                connection.executescript(SQLITE_SCHEMA)
+                self._schema_created = True
+            with connection:
+                connection.executemany(
+                    "INSERT INTO queue_messages (queue, body, sent_at, visible_at) "
+                    "VALUES (?, ?, ?, ?)",
+                    [(queue_url, body, now, now) for body in bodies],
+                )
+        finally:
+            connection.close()
+        return []
+
+
+class MemoryTransport(QueueTransport):
+    def __init__(self):
+        """
+        Initialize a transport keeping the sent messages in memory, for tests
+        and benchmarks of the backend without a queue service.
+        """
+        self.queues = defaultdict(list)
+        self._lock = threading.Lock()
+
+    def send_batch(self, queue_url: str, bodies: list) -> list:
+        with self._lock:
+            self.queues[queue_url].extend(bodies)
+        return []
+
+
+# The in-memory queues live as long as the process
+memory_transport = MemoryTransport()
+
+
+def get_transport() -> QueueTransport:
+    """
+    Return the queue transport selected by the ``DLP_QUEUE_TRANSPORT`` setting.
+
+    Returns:
+        QueueTransport: The transport.
+
+    Raises:
+        ValueError: If the transport is unknown.
+    """
+    name = settings.DLP_QUEUE_TRANSPORT
+    if name == "sqs":
+        return SQSTransport()
+    if name == "sqlite":
+        return SQLiteTransport()
+    if name == "memory":
+        return memory_transport
+    raise ValueError(f"Unknown queue transport: {name}")
+
+
+class AsyncQueueTransport:
+    """
+    Interface of the queue backends the async views send tasks to, without
+    blocking the event loop.
+    """
+
+    async def send_batch(self, queue_url: str, bodies: list) -> list:
+        """
+        Send messages to a queue.
+
+        Args:
+            queue_url (str): The queue to send to.
+            bodies (list): The message bodies.
+
+        Returns:
+            list: The bodies that could not be sent.
+        """
+        raise NotImplementedError
+
+    async def close(self):
+        """
+        Release the resources of the transport.
+        """
+
+
+class AsyncSQSTransport(AsyncQueueTransport):
+    def __init__(self):
+        """
+        Initialize a transport sending to SQS with an aiobotocore client, which
+        is created on first use, on the running event loop.
+        """
+        self.session = AioSession()
+        self._client = None
+        self._client_context = None
+        self._client_lock = asyncio.Lock()
+
+    async def _get_client(self):
+        """
+        Return the SQS client, creating it if needed.
+
+        Returns:
+            AioBaseClient: The SQS client.
+        """
+        if self._client is None:
+            async with self._client_lock:
+                if self._client is None:
+                    context = self.session.create_client(
+                        "sqs",
+                        endpoint_url=settings.AWS_SQS_ENDPOINT_URL,
+                        region_name=settings.AWS_REGION_NAME,
+                        aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
+                        aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
+                    )
+                    self._client = await context.__aenter__()
+                    self._client_context = context
+        return self._client
+
+    async def send_batch(self, queue_url: str, bodies: list) -> list:
+        client = await self._get_client()
+        failed = []
+        for start in range(0, len(bodies), SQS_MAX_BATCH):
+            batch = bodies[start : start + SQS_MAX_BATCH]
+            response = await client.send_message_batch(
+                QueueUrl=queue_url,
+                Entries=[
+                    {"Id": str(index), "MessageBody": body}
+                    for index, body in enumerate(batch)
+                ],
+            )
+            failed.extend(
+                batch[int(failure["Id"])] for failure in response.get("Failed", [])
+            )
+        return failed
+
+    async def close(self):
+        context = self._client_context
+        self._client = None
+        self._client_context = None
+        if context is not None:
+            await context.__aexit__(None, None, None)
+
+
+class ThreadedTransport(AsyncQueueTransport):
+    def __init__(self, transport: QueueTransport):
+        """
+        Initialize a transport running the sends of a blocking transport in a
+        thread, for the backends without an async client.
+
+        Args:
+            transport (QueueTransport): The transport to send with.
+        """
+        self.transport = transport
+
+    async def send_batch(self, queue_url: str, bodies: list) -> list:
+        return await asyncio.to_thread(self.transport.send_batch, queue_url, bodies)
+
+
+def get_async_transport() -> AsyncQueueTransport:
+    """
+    Return the async counterpart of the queue transport selected by the
+    ``DLP_QUEUE_TRANSPORT`` setting.
+
+    Returns:
+        AsyncQueueTransport: The transport.
+
+    Raises:
+        ValueError: If the transport is unknown.
+    """
+    if settings.DLP_QUEUE_TRANSPORT == "sqs":
+        return AsyncSQSTransport()
+    return ThreadedTransport(get_transport())
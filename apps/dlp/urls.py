@@ -1,16 +1,26 @@
+from django.conf import settings
 from django.urls import path
-from apps.dlp.views import (
-    SlackEventView,
-    PatternListAPIView,
-    DetectedMessageCreateAPIView,
-)
+from apps.dlp import async_views, views
+
+# ASGI deployments serve the async-native views, WSGI ones the DRF views
+dlp_views = async_views if settings.DLP_ASYNC_VIEWS else views
 
 urlpatterns = [
-    path("slack/events/", SlackEventView.as_view(), name="slack_event"),
-    path("patterns/", PatternListAPIView.as_view(), name="pattern-list"),
+    path("slack/events/", dlp_views.SlackEventView.as_view(), name="slack_event"),
+    path("patterns/", dlp_views.PatternListAPIView.as_view(), name="pattern-list"),
     path(
         "detected-messages/",
-        DetectedMessageCreateAPIView.as_view(),
+        dlp_views.DetectedMessageCreateAPIView.as_view(),
         name="detected-message-create",
     ),
+    path(
+        "detected-messages/bulk/",
+        dlp_views.DetectedMessageBulkCreateAPIView.as_view(),
+        name="detected-message-bulk-create",
+    ),
+    path(
+        "content-blobs/missing/",
+        dlp_views.ContentBlobMissingAPIView.as_view(),
+        name="content-blob-missing",
+    ),
 ]
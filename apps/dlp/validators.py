@@ -0,0 +1,107 @@
+import multiprocessing
+import re
+import time
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+
+# Length of the repeated part of every probe string
+PROBE_LENGTH = 2000
+
+# Characters always used to build probes, besides the ones found in the regex
+PROBE_CHARS = "a0 @.-_"
+
+# Seconds allowed for the probe process to start before the budget is applied
+PROBE_START_GRACE = 5.0
+
+
+def probe_strings(regex: str) -> list:
+    """
+    Build adversarial inputs for a regex.
+
+    Catastrophic backtracking shows up on long runs of characters the regex
+    accepts, followed by a character that makes the overall match fail. The
+    probes repeat every single character and every pair of characters found in
+    the regex (plus a few common ones) and end with a NUL byte.
+
+    Args:
+        regex (str): The regular expression to probe.
+
+    Returns:
+        list: The probe strings.
+    """
+    chars = []
+    for char in PROBE_CHARS + re.sub(r"\\.", "", regex):
+        if char.isprintable() and char not in chars:
+            chars.append(char)
+    chars = chars[:16]
+
+    probes = [char * PROBE_LENGTH + "\0" for char in chars]
+    probes += [
+        (first + second) * (PROBE_LENGTH // 2) + "\0"
+        for index, first in enumerate(chars)
+        for second in chars[index + 1 :]
+    ]
+    return probes
+
+
+def run_probes(regex: str, probes: list, connection):
+    """
+    Run a regex against every probe and send the elapsed time back.
+
+    This runs in a separate process so that it can be killed if it never returns.
+    A first message signals that the process is ready, so that its start-up time
+    is not counted against the budget.
+    """
+    compiled = re.compile(regex)
+    connection.send(None)
+    start = time.monotonic()
+    for probe in probes:
+        compiled.search(probe)
+    connection.send(time.monotonic() - start)
+    connection.close()
+
+
+def validate_regex(value: str):
+    """
+    Validate that a pattern regex compiles and does not backtrack catastrophically.
+
+    The regex is run against adversarial probes in a child process, which is
+    terminated if the probes exceed ``DLP_PATTERN_PROBE_BUDGET`` seconds.
+
+    Args:
+        value (str): The regular expression to validate.
+
+    Raises:
+        ValidationError: If the regex is invalid or too slow on the probes.
+    """
+    try:
+        re.compile(value)
+    except re.error as e:
+        raise ValidationError(f"Invalid regular expression: {e}")
+
+    budget = settings.DLP_PATTERN_PROBE_BUDGET
+    context = multiprocessing.get_context("spawn")
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(
+        target=run_probes, args=(value, probe_strings(value), sender), daemon=True
+    )
+    process.start()
+    sender.close()
+    try:
+        elapsed = None
+        if receiver.poll(PROBE_START_GRACE) and receiver.recv() is None:
+            elapsed = receiver.recv() if receiver.poll(budget) else None
+    except EOFError:
+        elapsed = None
+    finally:
+        if process.is_alive():
+            process.terminate()
+        process.join()
+        receiver.close()
+
+    if elapsed is None or elapsed > budget:
+        raise ValidationError(
+            f"Regular expression took longer than {budget}s on adversarial input "
+            f"and could stall the scanners."
+        )
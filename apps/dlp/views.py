@@ -1,18 +1,65 @@
 import logging
+from functools import partial
 
+from django.conf import settings
 from django.http import HttpResponseNotAllowed
 from rest_framework import status
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
 from apps.dlp.constants import EVENT_CALLBACK, EVENT_TYPE_MESSAGE
-from apps.dlp.models import Pattern
-from apps.dlp.serializers import DetectedMessageSerializer, PatternSerializer
+from apps.dlp.idempotency import claim_event, count_event, release_event
+from apps.dlp.models import ContentBlob
+from apps.dlp.pattern_cache import (
+    get_not_modified_response,
+    get_patterns_payload,
+    get_patterns_response,
+    get_patterns_version,
+)
+from apps.dlp.serializers import (
+    ContentDigestsSerializer,
+    DetectedMessageBulkSerializer,
+    DetectedMessageSerializer,
+)
 from apps.dlp.services import send_to_sqs
 
 logger = logging.getLogger(__name__)
 
 
+def get_message_tasks(event: dict) -> list:
+    """
+    Return the tasks checking a Slack message event: one per attached file, or
+    one for its text.
+
+    Args:
+        event (dict): The message event.
+
+    Returns:
+        list: The tasks, as pairs of task name and keyword arguments.
+    """
+    channel_id = event.get("channel", "")
+    if "files" in event:
+        logger.info("Checking file sent file")
+        return [
+            ("process_file", {"file_id": file["id"], "channel_id": channel_id})
+            for file in event["files"]
+        ]
+    message = event.get("text")
+    if message:
+        logger.info("Checking message sent")
+        return [
+            (
+                "process_message",
+                {
+                    "message": message,
+                    "channel_id": channel_id,
+                    "ts": event.get("ts", ""),
+                },
+            )
+        ]
+    return []
+
+
 class SlackEventView(APIView, HttpResponseNotAllowed):
     def get_slack_challenge(self, data):
         """Extract the Slack challenge token from the payload."""
@@ -26,30 +73,28 @@ class SlackEventView(APIView, HttpResponseNotAllowed):
             event = data.get("event", {})
 
             if event.get("type") == EVENT_TYPE_MESSAGE:
-                message = event.get("text")
                 channel_id = event.get("channel", "")
                 ts = event.get("ts", "")
-
-                if "files" in event:
-                    logger.info("Checking file sent file")
-                    for file in event["files"]:
-                        file_id = file["id"]
-                        # Send to SQS queue
-                        send_to_sqs(
-                            task_name="process_file",
-                            kwargs={"file_id": file_id, "channel_id": channel_id},
-                        )
-                elif message:
-                    logger.info("Checking message sent")
+                event_id = data.get("event_id")
+
+                if not claim_event(event_id, channel_id, ts):
+                    count_event("duplicates")
+                    logger.info(f"Ignoring duplicate event {event_id}")
+                    return data
+
+                # Let the redelivery of the event be processed if a task is
+                # dropped after it was queued
+                release = partial(release_event, event_id, channel_id, ts)
+                queued = True
+                for task_name, kwargs in get_message_tasks(event):
                     # Send to SQS queue
-                    send_to_sqs(
-                        task_name="process_message",
-                        kwargs={
-                            "message": message,
-                            "channel_id": channel_id,
-                            "ts": ts,
-                        },
-                    )
+                    if not send_to_sqs(
+                        task_name=task_name, kwargs=kwargs, on_failure=release
+                    ):
+                        queued = False
+                if not queued:
+                    # Let the redelivery of the event be processed
+                    release_event(event_id, channel_id, ts)
             else:
                 logger.debug(f"Unhandled event type: {event.get('type')}")
         return data
@@ -58,6 +103,13 @@ class SlackEventView(APIView, HttpResponseNotAllowed):
         """Handle POST requests from Slack."""
         response_data = {"status": "received"}
         data = request.data
+        retry_num = request.headers.get("X-Slack-Retry-Num")
+        if retry_num:
+            count_event("retries")
+            logger.info(
+                f"Slack retry {retry_num} of event {data.get('event_id')}: "
+                f"{request.headers.get('X-Slack-Retry-Reason')}"
+            )
         self.check_event_callback(data=data)
         challenge_data = self.get_slack_challenge(data)
         if challenge_data:
@@ -76,9 +128,15 @@ class PatternListAPIView(APIView):
     """
 
     def get(self, request):
-        patterns = Pattern.objects.all()
-        serializer = PatternSerializer(patterns, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        """
+        Return the cached pattern list, or a 304 response when the client
+        already has its version, after querying only the version.
+        """
+        version = get_patterns_version()
+        response = get_not_modified_response(request, version)
+        if response is None:
+            response = get_patterns_response(get_patterns_payload(version), version)
+        return response
 
 
 class DetectedMessageCreateAPIView(APIView):
@@ -92,3 +150,43 @@ class DetectedMessageCreateAPIView(APIView):
             serializer.save()
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
+class DetectedMessageBulkCreateAPIView(APIView):
+    """
+    API endpoint to save a list of detected messages at once.
+    """
+
+    def post(self, request):
+        serializer = DetectedMessageBulkSerializer(
+            data=request.data,
+            many=True,
+            allow_empty=False,
+            max_length=settings.DLP_DETECTED_MESSAGES_BULK_LIMIT,
+        )
+        if serializer.is_valid():
+            serializer.save()
+            return Response(serializer.data, status=status.HTTP_201_CREATED)
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
+class ContentBlobMissingAPIView(APIView):
+    """
+    API endpoint returning which of the given content digests are not stored
+    yet, so that clients only upload content the server does not have.
+    """
+
+    def post(self, request):
+        serializer = ContentDigestsSerializer(data=request.data)
+        if serializer.is_valid():
+            digests = serializer.validated_data["digests"]
+            stored = set(
+                ContentBlob.objects.filter(digest__in=digests).values_list(
+                    "digest", flat=True
+                )
+            )
+            missing = [
+                digest for digest in dict.fromkeys(digests) if digest not in stored
+            ]
+            return Response({"missing": missing}, status=status.HTTP_200_OK)
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -21,4 +21,5 @@ def create_queue(queue_name):
 
 
 if __name__ == "__main__":
-    create_queue(settings.AWS_SQS_QUEUE_NAME)
+    for queue_name in settings.AWS_SQS_QUEUE_NAMES:
+        create_queue(queue_name)
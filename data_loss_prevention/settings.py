@@ -111,6 +111,79 @@ AWS_SQS_QUEUE_URL = os.getenv(
     "AWS_SQS_QUEUE_URL", "http://elasticmq:9324/000000000000/dlp-tasks"
 )
 AWS_SQS_QUEUE_NAME = os.getenv("AWS_SQS_QUEUE_NAME", "dlp-tasks")
+AWS_SQS_FILES_QUEUE_URL = os.getenv(
+    "AWS_SQS_FILES_QUEUE_URL", "http://elasticmq:9324/000000000000/dlp-files"
+)
+AWS_SQS_FILES_QUEUE_NAME = os.getenv("AWS_SQS_FILES_QUEUE_NAME", "dlp-files")
+
+# Priority lanes: tasks sent to a queue other than AWS_SQS_QUEUE_URL, so that file
+# scans cannot delay chat messages
+AWS_SQS_TASK_QUEUE_URLS = {"process_file": AWS_SQS_FILES_QUEUE_URL}
+AWS_SQS_QUEUE_NAMES = [AWS_SQS_QUEUE_NAME, AWS_SQS_FILES_QUEUE_NAME]
+
+# Queue transport the tasks are sent with: "sqs", "sqlite" for a single node without
+# a queue service (the file is shared with the worker), or "memory" for benchmarks.
+# DLP_QUEUE_SQLITE_PATH is required by the SQLite queue and must be the same path
+# as the worker's.
+DLP_QUEUE_TRANSPORT = os.getenv("DLP_QUEUE_TRANSPORT", "sqs")
+DLP_QUEUE_SQLITE_PATH = os.getenv("DLP_QUEUE_SQLITE_PATH", "")
+
+# Tasks are handed to a background thread of the process that sends them in
+# batches of up to DLP_QUEUE_PRODUCER_BATCH_SIZE, waiting up to
+# DLP_QUEUE_PRODUCER_LINGER seconds for a batch to fill. At most
+# DLP_QUEUE_PRODUCER_QUEUE_SIZE tasks wait to be sent; beyond that a request waits
+# up to DLP_QUEUE_PRODUCER_BLOCK_TIMEOUT seconds for room before the task is
+# rejected. A task that fails is sent again with a later batch, up to
+# DLP_QUEUE_PRODUCER_MAX_ATTEMPTS times, after a backoff starting at
+# DLP_QUEUE_PRODUCER_RETRY_BACKOFF seconds and doubling up to
+# DLP_QUEUE_PRODUCER_RETRY_BACKOFF_MAX, with jitter. Queued tasks get
+# DLP_QUEUE_PRODUCER_SHUTDOWN_TIMEOUT seconds to be sent when the process exits.
+DLP_QUEUE_PRODUCER_BATCH_SIZE = int(os.getenv("DLP_QUEUE_PRODUCER_BATCH_SIZE", 10))
+DLP_QUEUE_PRODUCER_LINGER = float(os.getenv("DLP_QUEUE_PRODUCER_LINGER", 0.01))
+DLP_QUEUE_PRODUCER_QUEUE_SIZE = int(os.getenv("DLP_QUEUE_PRODUCER_QUEUE_SIZE", 10000))
+DLP_QUEUE_PRODUCER_BLOCK_TIMEOUT = float(
+    os.getenv("DLP_QUEUE_PRODUCER_BLOCK_TIMEOUT", 0.5)
+)
+DLP_QUEUE_PRODUCER_MAX_ATTEMPTS = int(os.getenv("DLP_QUEUE_PRODUCER_MAX_ATTEMPTS", 3))
+DLP_QUEUE_PRODUCER_RETRY_BACKOFF = float(
+    os.getenv("DLP_QUEUE_PRODUCER_RETRY_BACKOFF", 0.2)
+)
+DLP_QUEUE_PRODUCER_RETRY_BACKOFF_MAX = float(
+    os.getenv("DLP_QUEUE_PRODUCER_RETRY_BACKOFF_MAX", 5)
+)
+DLP_QUEUE_PRODUCER_SHUTDOWN_TIMEOUT = float(
+    os.getenv("DLP_QUEUE_PRODUCER_SHUTDOWN_TIMEOUT", 10)
+)
+
+# Serve the async-native versions of the Slack and worker endpoints, which send
+# tasks with aiobotocore, for deployments running data_loss_prevention.asgi under
+# an ASGI server such as uvicorn. WSGI deployments keep the DRF views.
+DLP_ASYNC_VIEWS = os.getenv("DLP_ASYNC_VIEWS", "false").lower() == "true"
+
+# Cache shared by the processes of the backend, e.g. to recognize Slack events
+# delivered twice. The default local memory cache only works with a single
+# process; use a shared backend such as Redis in production.
+CACHES = {
+    "default": {
+        "BACKEND": os.getenv(
+            "DJANGO_CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"
+        ),
+        "LOCATION": os.getenv("DJANGO_CACHE_LOCATION", ""),
+    }
+}
+
+# Seconds a Slack event is remembered in the database, so that its redeliveries
+# are not processed
+DLP_EVENT_DEDUP_TTL = int(os.getenv("DLP_EVENT_DEDUP_TTL", 3600))
+
+# Minimum seconds between two deletions of the expired event claims by a backend
+# process
+DLP_EVENT_CLAIM_PRUNE_INTERVAL = int(os.getenv("DLP_EVENT_CLAIM_PRUNE_INTERVAL", 300))
+
+# Seconds the serialized pattern list of a pattern set version stays cached.
+# The version is derived from the patterns in the database, so any change to
+# them starts a new version.
+DLP_PATTERN_LIST_CACHE_TTL = int(os.getenv("DLP_PATTERN_LIST_CACHE_TTL", 300))
 
 # SQS configuration
 sqs = boto3.client(
@@ -202,3 +275,13 @@ LOGGING = {
 SLACK_VERIFICATION_TOKEN = os.getenv("SLACK_VERIFICATION_TOKEN", "")
 SLACK_BOT_TOKEN = os.getenv("SLACK_BOT_TOKEN", "")
 SLACK_USER_TOKEN = os.getenv("SLACK_USER_TOKEN", "")
+
+# DLP settings
+# Seconds a pattern regex may spend on the adversarial probes run on save
+DLP_PATTERN_PROBE_BUDGET = float(os.getenv("DLP_PATTERN_PROBE_BUDGET", 1.0))
+# zlib level (0-9) detected content is compressed with
+DLP_CONTENT_COMPRESSION_LEVEL = int(os.getenv("DLP_CONTENT_COMPRESSION_LEVEL", 6))
+# Most detected messages accepted by one request to the bulk endpoint
+DLP_DETECTED_MESSAGES_BULK_LIMIT = int(
+    os.getenv("DLP_DETECTED_MESSAGES_BULK_LIMIT", 500)
+)
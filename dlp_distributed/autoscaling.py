@@ -0,0 +1,169 @@
+import asyncio
+import logging
+from collections import deque
+from dataclasses import dataclass
+
+from constants import (
+    AUTOSCALE_INTERVAL,
+    AUTOSCALE_TARGET_AGE,
+    SQS_MAX_POLLERS,
+    SQS_MIN_POLLERS,
+    WORKER_MAX_CONCURRENCY,
+    WORKER_MIN_CONCURRENCY,
+)
+
+logger = logging.getLogger(__name__)
+
+# Messages a single poll can receive, so the pollers needed to keep N slots fed
+MESSAGES_PER_POLL = 10
+
+
+class SlotLimiter:
+    def __init__(self, limit: int):
+        """
+        Initialize a semaphore whose number of slots can be changed while in use.
+
+        Lowering the limit never interrupts a holder; new acquisitions simply
+        wait until enough slots have been released.
+
+        Args:
+            limit (int): The initial number of slots.
+        """
+        self.limit = limit
+        self.in_use = 0
+        self._waiters = deque()
+
+    def locked(self) -> bool:
+        """Return whether acquiring a slot would wait."""
+        return self.in_use >= self.limit
+
+    async def acquire(self):
+        """
+        Take a slot, waiting for one to be free.
+        """
+        while self.locked():
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                # Pass a wake-up this waiter may have received to the next one
+                self._wake()
+                raise
+            finally:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+        self.in_use += 1
+
+    def release(self):
+        """
+        Give a slot back.
+        """
+        self.in_use -= 1
+        self._wake()
+
+    def set_limit(self, limit: int):
+        """
+        Change the number of slots.
+
+        Args:
+            limit (int): The new number of slots.
+        """
+        self.limit = limit
+        self._wake()
+
+    def _wake(self):
+        free = self.limit - self.in_use
+        for waiter in list(self._waiters):
+            if free <= 0:
+                break
+            if not waiter.done():
+                waiter.set_result(None)
+                free -= 1
+
+
+@dataclass(frozen=True)
+class QueueStats:
+    visible: int
+    not_visible: int
+    oldest_age: float
+
+
+class Autoscaler:
+    def __init__(
+        self,
+        min_slots: int = WORKER_MIN_CONCURRENCY,
+        max_slots: int = WORKER_MAX_CONCURRENCY,
+        min_pollers: int = SQS_MIN_POLLERS,
+        max_pollers: int = SQS_MAX_POLLERS,
+        target_age: float = AUTOSCALE_TARGET_AGE,
+        interval: float = AUTOSCALE_INTERVAL,
+    ):
+        """
+        Initialize a controller that sizes the task slots and pollers of a
+        manager from the depth of its queue.
+
+        Args:
+            min_slots (int): Fewest messages processed at the same time.
+            max_slots (int): Most messages processed at the same time.
+            min_pollers (int): Fewest concurrent long polls.
+            max_pollers (int): Most concurrent long polls.
+            target_age (float): Seconds a message may wait in the queue before
+                the backlog counts as falling behind.
+            interval (float): Seconds between two adjustments.
+        """
+        self.min_slots = min_slots
+        self.max_slots = max(max_slots, min_slots)
+        self.min_pollers = min_pollers
+        self.max_pollers = max(max_pollers, min_pollers)
+        self.target_age = target_age
+        self.interval = interval
+
+    def decide(self, stats: QueueStats, slots: SlotLimiter) -> tuple:
+        """
+        Compute the number of slots and pollers for the current queue state.
+
+        The slots double while messages are waiting and either old or more
+        numerous than the slots, so a backlog drains quickly. Once the queue is
+        empty and fewer than half of the slots are busy, they shrink by a
+        quarter at a time. Pollers follow the slots while there is a backlog,
+        and drop to the minimum when there is nothing to receive.
+
+        Args:
+            stats (QueueStats): The current queue attributes.
+            slots (SlotLimiter): The task slots of the manager.
+
+        Returns:
+            tuple: The number of slots and the number of pollers.
+        """
+        limit = slots.limit
+        if stats.visible and (
+            stats.oldest_age >= self.target_age or stats.visible >= limit
+        ):
+            limit = limit * 2
+        elif not stats.visible and slots.in_use < limit / 2:
+            limit = limit - max(limit // 4, 1)
+        limit = min(max(limit, self.min_slots), self.max_slots)
+
+        if stats.visible:
+            pollers = -(-limit // MESSAGES_PER_POLL)
+        else:
+            pollers = self.min_pollers
+        pollers = min(max(pollers, self.min_pollers), self.max_pollers)
+        return limit, pollers
+
+    async def run(self, manager):
+        """
+        Adjust a manager every ``interval`` seconds until cancelled.
+
+        Args:
+            manager (SQSManager): The manager to scale.
+        """
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                stats = await manager._queue_stats()
+            except Exception as e:
+                logger.error(f"Failed to read queue attributes: {e}")
+                continue
+            await manager._scale(*self.decide(stats, manager._slots))
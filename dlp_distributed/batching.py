@@ -0,0 +1,124 @@
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class BatchBuffer:
+    def __init__(
+        self,
+        flush,
+        max_size: int = 10,
+        max_delay: float = 1.0,
+        max_attempts: int = 3,
+        name: str = "batch",
+    ):
+        """
+        Initialize a buffer that groups items and hands them over in batches.
+
+        A batch is flushed as soon as ``max_size`` items have accumulated, or
+        ``max_delay`` seconds after the first item of a partial batch arrived.
+
+        Args:
+            flush (callable): Coroutine function called with a list of at most
+                ``max_size`` items. It returns the items (the same objects) that
+                failed and should be retried, or None if all of them succeeded.
+            max_size (int): Maximum number of items per batch.
+            max_delay (float): Seconds a partial batch may wait before it is flushed.
+            max_attempts (int): Times an item is flushed before it is dropped.
+            name (str): Name used in log messages.
+        """
+        self._flush = flush
+        self.max_size = max_size
+        self.max_delay = max_delay
+        self.max_attempts = max_attempts
+        self.name = name
+        self._items = []
+        self._timer = None
+        self._pending = set()
+
+    def __len__(self):
+        return len(self._items)
+
+    async def add(self, item):
+        """
+        Add an item, flushing a batch if the buffer is full.
+
+        Args:
+            item: The item to buffer.
+        """
+        self._items.append((item, 1))
+        if len(self._items) >= self.max_size:
+            await self.flush()
+        else:
+            self._schedule()
+
+    def _schedule(self):
+        """
+        Start the timer that flushes a partial batch, unless it is running.
+        """
+        if self._timer is None and self._items:
+            loop = asyncio.get_running_loop()
+            self._timer = loop.call_later(self.max_delay, self._on_timer)
+
+    def _on_timer(self):
+        self._timer = None
+        task = asyncio.ensure_future(self.flush())
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+
+    async def flush(self):
+        """
+        Flush the buffered items in batches of at most ``max_size``.
+
+        Items that the flush callback returns, or all items of a batch whose flush
+        raised, are buffered again until they run out of attempts.
+        """
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        while self._items:
+            batch = self._items[: self.max_size]
+            del self._items[: self.max_size]
+            attempts = {id(item): attempt for item, attempt in batch}
+
+            try:
+                failed = await self._flush([item for item, _ in batch]) or []
+            except Exception as e:
+                logger.error(f"Failed to flush {self.name} of {len(batch)} items: {e}")
+                failed = [item for item, _ in batch]
+
+            retries = []
+            for item in failed:
+                attempt = attempts.get(id(item), self.max_attempts)
+                if attempt < self.max_attempts:
+                    retries.append((item, attempt + 1))
+                else:
+                    logger.error(f"Dropping {self.name} item after {attempt} attempts.")
+            if retries:
+                # Retry later rather than hammering a failing endpoint
+                self._items.extend(retries)
+                break
+        self._schedule()
+
+    def clear(self):
+        """
+        Drop the buffered items without flushing them and stop the timer.
+        """
+        self._items = []
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    async def close(self):
+        """
+        Flush everything still buffered, including retries, and stop the timer.
+        """
+        if self._pending:
+            await asyncio.gather(*self._pending, return_exceptions=True)
+        while self._items:
+            await self.flush()
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
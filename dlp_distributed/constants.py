@@ -5,7 +5,139 @@ AWS_SQS_ENDPOINT_URL = os.environ.get("AWS_SQS_ENDPOINT_URL", "http://sqs:9324")
 AWS_SQS_QUEUE_URL = os.environ.get(
     "AWS_SQS_QUEUE_URL", "http://elasticmq:9324/000000000000/dlp-tasks"
 )
+AWS_SQS_FILES_QUEUE_URL = os.environ.get(
+    "AWS_SQS_FILES_QUEUE_URL", "http://elasticmq:9324/000000000000/dlp-files"
+)
 AWS_ACCESS_KEY_ID = os.environ.get("AWS_ACCESS_KEY_ID", "fake_access_key")
 AWS_SECRET_ACCESS_KEY = os.environ.get("AWS_SECRET_ACCESS_KEY", "fake_secret_key")
 BASE_URL = os.getenv("BASE_URL", "")
 ALLOWED_HOSTS = os.getenv("DJANGO_ALLOWED_HOSTS", "").split(",")
+
+# Queue transport of the worker: "sqs", "sqlite" for a single node without a
+# queue service (the file is shared with the backend), or "memory" for benchmarks.
+# DLP_QUEUE_SQLITE_PATH is required by the SQLite queue and must be the same path
+# as the backend's. The queue is polled every DLP_QUEUE_SQLITE_POLL_INTERVAL
+# seconds while empty.
+DLP_QUEUE_TRANSPORT = os.getenv("DLP_QUEUE_TRANSPORT", "sqs")
+DLP_QUEUE_SQLITE_PATH = os.getenv("DLP_QUEUE_SQLITE_PATH", "")
+DLP_QUEUE_SQLITE_POLL_INTERVAL = float(os.getenv("DLP_QUEUE_SQLITE_POLL_INTERVAL", 0.2))
+
+# Connection pool of the long-lived SQS client. The read timeout has to cover the
+# long polling wait of receive_message.
+SQS_MAX_POOL_CONNECTIONS = int(os.getenv("SQS_MAX_POOL_CONNECTIONS", 20))
+SQS_CONNECT_TIMEOUT = float(os.getenv("SQS_CONNECT_TIMEOUT", 5))
+SQS_READ_TIMEOUT = float(os.getenv("SQS_READ_TIMEOUT", 30))
+
+# Consumer pipeline: messages processed at once, concurrent long polls, and the
+# seconds in-flight messages get to finish on shutdown
+WORKER_CONCURRENCY = int(os.getenv("WORKER_CONCURRENCY", 20))
+SQS_POLLERS = int(os.getenv("SQS_POLLERS", 1))
+WORKER_SHUTDOWN_TIMEOUT = float(os.getenv("WORKER_SHUTDOWN_TIMEOUT", 30))
+
+# Prefork supervisor: worker processes, each with its own event loop and
+# consumer, and the delay before a crashed one is restarted
+WORKER_PROCESSES = int(os.getenv("WORKER_PROCESSES", os.cpu_count() or 1))
+WORKER_RESTART_DELAY = float(os.getenv("WORKER_RESTART_DELAY", 1.0))
+
+# Port of the Prometheus metrics endpoint of the first worker process; the others
+# listen on the next ports. 0 disables the endpoint.
+METRICS_PORT = int(os.getenv("METRICS_PORT", 9100))
+
+# Priority lanes: chat messages and files are consumed from separate queues, each
+# with a share of the concurrency proportional to its weight
+SQS_LANES = [
+    {
+        "name": "messages",
+        "queue_url": AWS_SQS_QUEUE_URL,
+        "weight": float(os.getenv("SQS_MESSAGES_WEIGHT", 3)),
+    },
+    {
+        "name": "files",
+        "queue_url": AWS_SQS_FILES_QUEUE_URL,
+        "weight": float(os.getenv("SQS_FILES_WEIGHT", 1)),
+    },
+]
+
+# Autoscaling bounds of the consumer pipelines of each worker process, shared out
+# between the lanes by weight. Every AUTOSCALE_INTERVAL seconds
+# the slots and pollers are adjusted to the queue depth; messages older than
+# AUTOSCALE_TARGET_AGE seconds mean the workers are falling behind.
+WORKER_MIN_CONCURRENCY = int(os.getenv("WORKER_MIN_CONCURRENCY", 4))
+WORKER_MAX_CONCURRENCY = int(os.getenv("WORKER_MAX_CONCURRENCY", 100))
+SQS_MIN_POLLERS = int(os.getenv("SQS_MIN_POLLERS", 1))
+SQS_MAX_POLLERS = int(os.getenv("SQS_MAX_POLLERS", 4))
+AUTOSCALE_INTERVAL = float(os.getenv("AUTOSCALE_INTERVAL", 15))
+AUTOSCALE_TARGET_AGE = float(os.getenv("AUTOSCALE_TARGET_AGE", 30))
+
+# Messages still being processed get their visibility timeout extended to
+# SQS_VISIBILITY_TIMEOUT seconds every SQS_HEARTBEAT_INTERVAL seconds. The interval
+# has to be shorter than the visibility timeout of the queue (30s by default).
+SQS_VISIBILITY_TIMEOUT = int(os.getenv("SQS_VISIBILITY_TIMEOUT", 30))
+SQS_HEARTBEAT_INTERVAL = float(os.getenv("SQS_HEARTBEAT_INTERVAL", 10))
+
+# Acknowledgements are deleted in batches of up to 10 (the SQS limit), or after
+# this many seconds for a partial batch
+SQS_ACK_BATCH_SIZE = min(int(os.getenv("SQS_ACK_BATCH_SIZE", 10)), 10)
+SQS_ACK_INTERVAL = float(os.getenv("SQS_ACK_INTERVAL", 0.5))
+SQS_ACK_MAX_ATTEMPTS = int(os.getenv("SQS_ACK_MAX_ATTEMPTS", 3))
+
+# Slack Web API: calls per second and burst of each method, from its rate limit
+# tier (shared out between the worker processes), the bounds of the concurrent
+# calls adapted to rate limiting, and the rate limited calls that may wait for a
+# retry at once
+SLACK_METHOD_RATES = {
+    "chat_update": (50 / 60, 5),
+    "chat_postMessage": (1.0, 3),
+    "files_delete": (50 / 60, 5),
+    "files_info": (100 / 60, 10),
+}
+SLACK_DEFAULT_RATE = (20 / 60, 2)
+SLACK_MIN_CONCURRENCY = int(os.getenv("SLACK_MIN_CONCURRENCY", 1))
+SLACK_MAX_CONCURRENCY = int(os.getenv("SLACK_MAX_CONCURRENCY", 10))
+SLACK_MAX_RETRIES = int(os.getenv("SLACK_MAX_RETRIES", 3))
+SLACK_RETRY_QUEUE_SIZE = int(os.getenv("SLACK_RETRY_QUEUE_SIZE", 100))
+SLACK_DEFAULT_RETRY_AFTER = float(os.getenv("SLACK_DEFAULT_RETRY_AFTER", 1.0))
+
+# Shared HTTP session of a worker process: connections in the pool overall and
+# per host, seconds DNS answers and idle connections are kept, and the seconds
+# to wait for a connection and for data on it
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", 100))
+HTTP_POOL_PER_HOST = int(os.getenv("HTTP_POOL_PER_HOST", 20))
+HTTP_DNS_CACHE_TTL = int(os.getenv("HTTP_DNS_CACHE_TTL", 300))
+HTTP_KEEPALIVE_TIMEOUT = float(os.getenv("HTTP_KEEPALIVE_TIMEOUT", 30))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", 10))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", 60))
+
+# Detected messages are buffered across tasks and reported to the backend in
+# batches of up to DETECTION_BATCH_SIZE, or after DETECTION_BATCH_INTERVAL seconds
+# for a partial batch
+DETECTION_BATCH_SIZE = int(os.getenv("DETECTION_BATCH_SIZE", 50))
+DETECTION_BATCH_INTERVAL = float(os.getenv("DETECTION_BATCH_INTERVAL", 1.0))
+DETECTION_MAX_ATTEMPTS = int(os.getenv("DETECTION_MAX_ATTEMPTS", 5))
+
+# Pattern cache
+PATTERN_CACHE_TTL = int(os.getenv("PATTERN_CACHE_TTL", 60))
+PATTERN_CACHE_RETRY_INTERVAL = int(os.getenv("PATTERN_CACHE_RETRY_INTERVAL", 5))
+
+# File scanning
+SCAN_CHUNK_SIZE = int(os.getenv("SCAN_CHUNK_SIZE", 1024 * 1024))
+SCAN_OVERLAP_LIMIT = int(os.getenv("SCAN_OVERLAP_LIMIT", 4096))
+SCAN_STREAM_THRESHOLD = int(os.getenv("SCAN_STREAM_THRESHOLD", SCAN_CHUNK_SIZE))
+
+# Scan process pool
+SCAN_PROCESSES = int(os.getenv("SCAN_PROCESSES", os.cpu_count() or 1))
+SCAN_INLINE_THRESHOLD = int(os.getenv("SCAN_INLINE_THRESHOLD", 64 * 1024))
+
+# Seconds a single pattern may run on one text before it is quarantined, plus
+# SCAN_TIME_BUDGET_PER_MB seconds for every MiB of the text
+SCAN_TIME_BUDGET = float(os.getenv("SCAN_TIME_BUDGET", 1.0))
+SCAN_TIME_BUDGET_PER_MB = float(os.getenv("SCAN_TIME_BUDGET_PER_MB", 1.0))
+
+# Seconds a pattern stays quarantined, unless the pattern set changes earlier
+PATTERN_QUARANTINE_TTL = int(os.getenv("PATTERN_QUARANTINE_TTL", 3600))
+
+# Bytes of context reported on each side of a match found in a file
+SCAN_REPORT_CONTEXT = int(os.getenv("SCAN_REPORT_CONTEXT", 256))
+
+# Scan result cache
+SCAN_CACHE_SIZE = int(os.getenv("SCAN_CACHE_SIZE", 10000))
@@ -0,0 +1,623 @@
+import codecs
+import re
+import signal
+import threading
+from contextlib import contextmanager
+
+try:  # Python 3.11+
+    from re import _constants as sre_constants, _parser as sre_parse
+except ImportError:  # pragma: no cover
+    import sre_constants
+    import sre_parse
+
+# Detectors kept per engine for the different subsets of patterns
+DETECTOR_CACHE_SIZE = 64
+
+# Below this many candidates, patterns are searched one by one instead of
+# compiling a detector for that particular subset
+DETECTOR_MIN_PATTERNS = 4
+
+# Opcodes that depend on the group numbering of the original pattern
+_GROUP_REFERENCES = {sre_constants.GROUPREF, sre_constants.GROUPREF_EXISTS}
+
+# Opcodes whose subpattern has to occur at least once when ``min >= 1``
+_REPEATS = {sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT} | (
+    {sre_constants.POSSESSIVE_REPEAT}
+    if hasattr(sre_constants, "POSSESSIVE_REPEAT")
+    else set()
+)
+
+# Bytes outside of these make ``str`` and ``bytes`` patterns disagree: anything
+# non-ASCII, and the separators that only ``str`` patterns count as ``\s``
+_UNSAFE_BYTES = re.compile(rb"[\x1c-\x1f\x80-\xff]")
+
+# Assertions that depend on what counts as a word character
+_BOUNDARIES = {sre_constants.AT_BOUNDARY, sre_constants.AT_NON_BOUNDARY}
+
+_CATEGORY_ESCAPES = {
+    sre_constants.CATEGORY_DIGIT: r"\d",
+    sre_constants.CATEGORY_NOT_DIGIT: r"\D",
+    sre_constants.CATEGORY_SPACE: r"\s",
+    sre_constants.CATEGORY_NOT_SPACE: r"\S",
+    sre_constants.CATEGORY_WORD: r"\w",
+    sre_constants.CATEGORY_NOT_WORD: r"\W",
+}
+
+
+class PatternTimeout(Exception):
+    """Raised inside a scan when a pattern exceeds its time budget."""
+
+
+def _raise_timeout(signum, frame):
+    raise PatternTimeout()
+
+
+@contextmanager
+def deadline(seconds: float | None):
+    """
+    Abort the enclosed regex work with PatternTimeout after ``seconds``.
+
+    The regex engine checks for signals while matching, so a SIGALRM timer can
+    interrupt even a catastrophically backtracking search. Timers only work in
+    the main thread of a process; elsewhere, or without a budget, this does
+    nothing.
+
+    Args:
+        seconds (float, optional): The time budget.
+    """
+    if (
+        not seconds
+        or not hasattr(signal, "setitimer")
+        or threading.current_thread() is not threading.main_thread()
+    ):
+        yield
+        return
+
+    previous = signal.signal(signal.SIGALRM, _raise_timeout)
+    signal.setitimer(signal.ITIMER_REAL, seconds)
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+
+def _children(av):
+    """
+    Yield the nested subpatterns contained in a parsed node argument.
+    """
+    if isinstance(av, sre_parse.SubPattern):
+        yield av
+    elif isinstance(av, (tuple, list)):
+        for item in av:
+            yield from _children(item)
+
+
+def iter_nodes(parsed):
+    """
+    Walk a parsed regex tree depth-first.
+
+    Args:
+        parsed (SubPattern): The output of ``sre_parse.parse``.
+
+    Yields:
+        tuple: ``(opcode, argument)`` pairs for every node in the tree.
+    """
+    for op, av in parsed:
+        yield op, av
+        for child in _children(av):
+            yield from iter_nodes(child)
+
+
+def is_combinable(compiled: re.Pattern) -> bool:
+    """
+    Return whether a regex can be embedded as one branch of a combined alternation.
+
+    Regexes with named groups (which could collide), inline global flags (which are
+    only valid at the start of a pattern) or group references (which would point at
+    renumbered groups) must be run on their own.
+
+    Args:
+        compiled (re.Pattern): The compiled pattern.
+
+    Returns:
+        bool: True if the regex keeps its meaning inside a combined matcher.
+    """
+    default_flags = re.UNICODE if isinstance(compiled.pattern, str) else 0
+    if compiled.groupindex or compiled.flags != default_flags:
+        return False
+    try:
+        parsed = sre_parse.parse(compiled.pattern)
+    except re.error:
+        return False
+    return not any(op in _GROUP_REFERENCES for op, _ in iter_nodes(parsed))
+
+
+def _class_source(items):
+    """
+    Rebuild the source of a parsed character class, or None if it is negated or
+    uses constructs that cannot be rebuilt.
+    """
+    parts = []
+    for op, av in items:
+        if op is sre_constants.LITERAL:
+            parts.append(re.escape(chr(av)))
+        elif op is sre_constants.RANGE:
+            parts.append(f"{re.escape(chr(av[0]))}-{re.escape(chr(av[1]))}")
+        elif op is sre_constants.CATEGORY and av in _CATEGORY_ESCAPES:
+            parts.append(_CATEGORY_ESCAPES[av])
+        else:
+            return None
+    return f"[{''.join(parts)}]"
+
+
+def _required_items(parsed, atoms: list):
+    """
+    Collect the literal runs and character classes that every match of ``parsed``
+    must contain. Anything that is optional, alternative or too complex to reason
+    about simply contributes nothing.
+    """
+    literal = []
+
+    def flush():
+        if literal:
+            atoms.append(("literal", "".join(literal)))
+            literal.clear()
+
+    for op, av in parsed:
+        if op is sre_constants.LITERAL:
+            literal.append(chr(av))
+            continue
+        flush()
+        if op is sre_constants.IN:
+            source = _class_source(av)
+            if source is not None:
+                atoms.append(("class", source))
+        elif op is sre_constants.SUBPATTERN:
+            _, add_flags, del_flags, subpattern = av
+            if not add_flags and not del_flags:
+                _required_items(subpattern, atoms)
+        elif op in _REPEATS:
+            minimum, _, subpattern = av
+            if minimum >= 1:
+                _required_items(subpattern, atoms)
+        elif op is getattr(sre_constants, "ATOMIC_GROUP", None):
+            _required_items(av, atoms)
+    flush()
+
+
+def required_atoms(compiled: re.Pattern) -> tuple:
+    """
+    Derive the cheap presence checks that a text must pass for a regex to match.
+
+    Each atom is either a literal string, checked with a substring test, or a
+    compiled single character class, checked with a one-character search. Atoms
+    of a ``bytes`` pattern are ``bytes`` as well.
+
+    Args:
+        compiled (re.Pattern): The compiled pattern.
+
+    Returns:
+        tuple: The atoms, longest literals first. Empty if nothing is required.
+    """
+    try:
+        parsed = sre_parse.parse(compiled.pattern, compiled.flags)
+    except re.error:
+        return ()
+    items = []
+    _required_items(parsed, items)
+
+    is_bytes = isinstance(compiled.pattern, bytes)
+    class_flags = compiled.flags & (re.IGNORECASE | re.ASCII)
+    atoms = {}
+    for kind, value in items:
+        if kind == "literal":
+            value = re.escape(value) if compiled.flags & re.IGNORECASE else value
+        if is_bytes:
+            value = value.encode("latin-1")
+        if kind == "literal" and not compiled.flags & re.IGNORECASE:
+            atom = value
+        else:
+            atom = re.compile(value, class_flags)
+        atoms[atom] = None
+    return tuple(
+        sorted(
+            atoms,
+            key=lambda atom: -len(atom) if isinstance(atom, (str, bytes)) else 0,
+        )
+    )
+
+
+def max_width(compiled: re.Pattern) -> int:
+    """
+    Return the length of the longest text a regex can match.
+
+    Args:
+        compiled (re.Pattern): The compiled pattern.
+
+    Returns:
+        int: The maximum match length, or ``sre_constants.MAXREPEAT`` if unbounded.
+    """
+    try:
+        parsed = sre_parse.parse(compiled.pattern, compiled.flags)
+    except re.error:
+        return sre_constants.MAXREPEAT
+    return min(parsed.getwidth()[1], sre_constants.MAXREPEAT)
+
+
+def bytes_pattern(compiled: re.Pattern) -> re.Pattern | None:
+    """
+    Compile the ``bytes`` version of a ``str`` pattern.
+
+    On ASCII text, except for the separators ``\\x1c``-``\\x1f``, both versions
+    match exactly the same. Only patterns written in ASCII can be converted.
+
+    Args:
+        compiled (re.Pattern): The compiled ``str`` pattern.
+
+    Returns:
+        re.Pattern | None: The ``bytes`` pattern, or None if it cannot be built.
+    """
+    if not compiled.pattern.isascii():
+        return None
+    try:
+        return re.compile(
+            compiled.pattern.encode("ascii"), compiled.flags & ~re.UNICODE
+        )
+    except re.error:
+        return None
+
+
+def is_byte_exact(compiled: re.Pattern) -> bool:
+    """
+    Return whether a ``bytes`` pattern matches UTF-8 text like its ``str`` version.
+
+    That holds when the pattern only ever matches ASCII characters and never
+    asks what a character is: no ``.``, no negation, no ``\\d``/``\\w``/``\\s``
+    categories, no ``\\b`` and no case folding. A multi-byte character then
+    never matches anything, just like in the decoded text.
+
+    Args:
+        compiled (re.Pattern): The compiled ``bytes`` pattern.
+
+    Returns:
+        bool: True if the pattern can scan non-ASCII UTF-8 bytes directly.
+    """
+    if compiled.flags & re.IGNORECASE:
+        return False
+    try:
+        parsed = sre_parse.parse(compiled.pattern, compiled.flags)
+    except re.error:
+        return False
+    for op, av in iter_nodes(parsed):
+        if op is sre_constants.LITERAL:
+            if av >= 0x80:
+                return False
+        elif op is sre_constants.IN:
+            for item_op, item_av in av:
+                if item_op is sre_constants.LITERAL and item_av < 0x80:
+                    continue
+                if item_op is sre_constants.RANGE and item_av[1] < 0x80:
+                    continue
+                return False
+        elif op is sre_constants.AT:
+            if av in _BOUNDARIES:
+                return False
+        elif op is sre_constants.SUBPATTERN:
+            if av[1] & re.IGNORECASE:
+                return False
+        elif op in (
+            sre_constants.ANY,
+            sre_constants.NOT_LITERAL,
+            sre_constants.CATEGORY,
+        ):
+            return False
+    return True
+
+
+def is_ascii_safe(data) -> bool:
+    """
+    Return whether every ``bytes`` pattern can scan a buffer in place of its
+    ``str`` version.
+
+    Args:
+        data (bytes | bytearray): The buffer to scan.
+
+    Returns:
+        bool: True if the buffer is ASCII without the ``\\x1c``-``\\x1f`` separators.
+    """
+    return _UNSAFE_BYTES.search(data) is None
+
+
+def decode_window(data, span: tuple, context: int, encoding: str = "utf-8") -> str:
+    """
+    Decode the part of a buffer around a match.
+
+    The window is widened so that it never starts or ends inside a multi-byte
+    UTF-8 character, and decoded from a memoryview slice without copying the
+    rest of the buffer.
+
+    Args:
+        data (bytes | bytearray): The scanned buffer.
+        span (tuple): Start and end offsets of the match in ``data``.
+        context (int): Bytes to include before and after the match.
+        encoding (str, optional): Encoding of the buffer. Defaults to UTF-8.
+
+    Returns:
+        str: The decoded window, with undecodable bytes replaced.
+    """
+    start = max(span[0] - context, 0)
+    end = min(span[1] + context, len(data))
+    while start > 0 and 0x80 <= data[start] < 0xC0:
+        start -= 1
+    while end < len(data) and 0x80 <= data[end] < 0xC0:
+        end += 1
+    return codecs.decode(memoryview(data)[start:end], encoding, "replace")
+
+
+class _Matcher:
+    def __init__(self, compiled: dict):
+        """
+        Hold the patterns of an engine compiled for one kind of subject, either
+        ``str`` or ``bytes``.
+
+        Args:
+            compiled (dict): Compiled patterns keyed by their index in the engine.
+        """
+        self.compiled = compiled
+        self.combinable = frozenset(
+            index for index, pattern in compiled.items() if is_combinable(pattern)
+        )
+        self.atoms = {
+            index: required_atoms(pattern) for index, pattern in compiled.items()
+        }
+        self._detector_cache = {}
+
+    def candidates(self, subject, indexes: frozenset) -> frozenset:
+        """
+        Return the indexes among ``indexes`` whose required atoms all occur in a
+        subject. Every atom is checked at most once.
+        """
+        present = {}
+
+        def occurs(atom):
+            found = present.get(atom)
+            if found is None:
+                if isinstance(atom, (str, bytes)):
+                    found = atom in subject
+                else:
+                    found = atom.search(subject) is not None
+                present[atom] = found
+            return found
+
+        return frozenset(
+            index
+            for index in indexes
+            if all(occurs(atom) for atom in self.atoms[index])
+        )
+
+    def _detector(self, indexes: frozenset) -> re.Pattern:
+        """
+        Return the detector for a subset of the combinable patterns.
+        """
+        detector = self._detector_cache.get(indexes)
+        if detector is None:
+            if len(self._detector_cache) >= DETECTOR_CACHE_SIZE:
+                self._detector_cache.clear()
+            sources = [self.compiled[index].pattern for index in sorted(indexes)]
+            if isinstance(sources[0], bytes):
+                source = b"|".join(b"(?:" + source + b")" for source in sources)
+            else:
+                source = "|".join(f"(?:{source})" for source in sources)
+            detector = re.compile(source)
+            self._detector_cache[indexes] = detector
+        return detector
+
+    def _search_combined(self, subject, indexes: frozenset, position: int = 0) -> dict:
+        """
+        Find every pattern of ``indexes`` that matches somewhere in ``subject``.
+
+        The detector stops at the leftmost position where any remaining pattern
+        matches. Only there are the remaining patterns tried one by one, anchored
+        at that position; the ones that match are removed and the walk resumes
+        right after it. Patterns that did not match cannot match earlier, so the
+        subject is still walked only once.
+        """
+        spans = {}
+        remaining = indexes
+        while remaining:
+            hit = self._detector(remaining).search(subject, position)
+            if hit is None:
+                break
+            start = hit.start()
+            for index in remaining:
+                match = self.compiled[index].match(subject, start)
+                if match:
+                    spans[index] = match.span()
+            remaining = remaining.difference(spans)
+            position = start + 1
+        return spans
+
+    def locate(self, subject, indexes: frozenset, pos: int, budget: float | None):
+        """
+        Find the first match of every pattern of ``indexes`` in a subject.
+
+        The detector gets ``budget`` seconds as a whole. If it runs out, every
+        candidate is searched on its own with its own ``budget`` so that the slow
+        patterns can be told apart from the rest.
+
+        Returns:
+            tuple: Spans of the first matches keyed by pattern index, and the set
+                of indexes of the patterns that were aborted.
+        """
+        candidates = self.candidates(subject, indexes)
+        combinable = candidates & self.combinable
+        spans = {}
+        individual = candidates
+        if len(combinable) >= DETECTOR_MIN_PATTERNS:
+            try:
+                with deadline(budget):
+                    spans = self._search_combined(subject, combinable, pos)
+                individual = candidates - combinable
+            except PatternTimeout:
+                spans = {}
+
+        timed_out = set()
+        for index in sorted(individual):
+            try:
+                with deadline(budget):
+                    match = self.compiled[index].search(subject, pos)
+                if match:
+                    spans[index] = match.span()
+            except PatternTimeout:
+                timed_out.add(index)
+        return spans, timed_out
+
+
+class ScanEngine:
+    def __init__(self, patterns):
+        """
+        Build a multi-pattern matcher for a set of compiled patterns.
+
+        Every pattern gets a list of required literals and character classes. A scan
+        first checks those atoms, each at most once, and skips the patterns that
+        cannot match. The candidates that are combinable are joined into a single
+        non-capturing alternation (the detector), which lets the regex compiler
+        merge common prefixes so the text is walked once for all of them. The rest
+        fall back to individual searches.
+
+        Patterns written in ASCII also get a ``bytes`` version, so that downloaded
+        buffers can be scanned without decoding them first.
+
+        Args:
+            patterns (Sequence[CompiledPattern]): The patterns to scan for.
+        """
+        self.patterns = tuple(patterns)
+        self._indexes = frozenset(range(len(self.patterns)))
+        self._text = _Matcher(
+            {index: pattern.compiled for index, pattern in enumerate(self.patterns)}
+        )
+        self._bytes = _Matcher(
+            {
+                index: compiled
+                for index, pattern in enumerate(self.patterns)
+                if (compiled := bytes_pattern(pattern.compiled)) is not None
+            }
+        )
+        self._byte_exact = frozenset(
+            index
+            for index, compiled in self._bytes.compiled.items()
+            if is_byte_exact(compiled)
+        )
+        # ASCII literals that the decoded text needs for a pattern to match, used
+        # to avoid decoding a buffer when no remaining pattern can match it
+        self._decode_atoms = {
+            index: tuple(
+                atom for atom in atoms if isinstance(atom, bytes) and atom.isascii()
+            )
+            for index, atoms in self._bytes.atoms.items()
+        }
+        self.max_width = max(
+            (max_width(pattern.compiled) for pattern in self.patterns), default=0
+        )
+
+    def candidates(self, text: str) -> frozenset:
+        """
+        Return the indexes of the patterns whose required atoms all occur in a text.
+
+        Args:
+            text (str): The text to scan.
+
+        Returns:
+            frozenset: Indexes of the patterns worth running on the text.
+        """
+        return self._text.candidates(text, self._indexes)
+
+    def scan(self, text, pos: int = 0) -> list:
+        """
+        Scan a text for all patterns.
+
+        Args:
+            text (str | bytes | bytearray): The text, or the UTF-8 buffer, to scan.
+            pos (int, optional): Index where matches may start. Text before it is
+                only used as context for anchors and lookbehinds.
+
+        Returns:
+            list: IDs of the patterns that matched, in pattern-set order.
+        """
+        return self.scan_within(text, pos)[0]
+
+    def scan_within(self, text, pos: int = 0, budget: float | None = None):
+        """
+        Scan a text for all patterns, giving up on patterns that run too long.
+
+        Args:
+            text (str | bytes | bytearray): The text, or the UTF-8 buffer, to scan.
+            pos (int, optional): Index where matches may start.
+            budget (float, optional): Seconds allowed per pattern. No limit if None.
+
+        Returns:
+            tuple: IDs of the patterns that matched and IDs of the patterns that
+                were aborted, both in pattern-set order.
+        """
+        spans, timed_out = self.locate_within(text, pos, budget)
+        return list(spans), timed_out
+
+    def locate_within(self, text, pos: int = 0, budget: float | None = None):
+        """
+        Find where every pattern first matches, giving up on patterns that run too
+        long.
+
+        A ``bytes`` buffer is scanned directly with the ``bytes`` patterns: all of
+        them if the buffer is ASCII, otherwise the byte-exact ones. The remaining
+        patterns need Unicode semantics; the buffer is only decoded for them if
+        their required literals occur in it, and their spans are mapped back to
+        byte offsets (approximately, if the buffer is not valid UTF-8).
+
+        Args:
+            text (str | bytes | bytearray): The text, or the UTF-8 buffer, to scan.
+            pos (int, optional): Index where matches may start.
+            budget (float, optional): Seconds allowed per pattern. No limit if None.
+
+        Returns:
+            tuple: Spans of the first matches keyed by pattern ID, and IDs of the
+                patterns that were aborted, both in pattern-set order.
+        """
+        if isinstance(text, str):
+            spans, timed_out = self._text.locate(text, self._indexes, pos, budget)
+        else:
+            spans, timed_out = self._locate_bytes(text, pos, budget)
+        return (
+            {self.patterns[index].id: spans[index] for index in sorted(spans)},
+            [self.patterns[index].id for index in sorted(timed_out)],
+        )
+
+    def _locate_bytes(self, data, pos: int, budget: float | None):
+        """
+        Locate the patterns in a UTF-8 buffer. See ``locate_within``.
+        """
+        if is_ascii_safe(data):
+            byte_indexes = frozenset(self._bytes.compiled)
+        else:
+            byte_indexes = self._byte_exact
+        spans, timed_out = self._bytes.locate(data, byte_indexes, pos, budget)
+
+        remaining = frozenset(
+            index
+            for index in self._indexes - byte_indexes
+            if all(atom in data for atom in self._decode_atoms.get(index, ()))
+        )
+        if remaining:
+            text = codecs.decode(data, "utf-8", "replace")
+            text_pos = len(codecs.decode(memoryview(data)[:pos], "utf-8", "replace"))
+            text_spans, text_timed_out = self._text.locate(
+                text, remaining, text_pos, budget
+            )
+            for index, (start, end) in text_spans.items():
+                byte_start = len(text[:start].encode("utf-8"))
+                spans[index] = (
+                    byte_start,
+                    byte_start + len(text[start:end].encode("utf-8")),
+                )
+            timed_out |= text_timed_out
+        return spans, timed_out
@@ -1,7 +1,5 @@
-import asyncio
-from manager import SQSManager
+from supervisor import Supervisor
 
 if __name__ == "__main__":
-    # Instantiate the SQSManager and start the event loop
-    manager = SQSManager()
-    asyncio.run(manager.main())
+    # Fork the worker processes and supervise them
+    Supervisor().run()
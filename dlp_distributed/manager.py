@@ -1,107 +1,463 @@
 import asyncio
+import contextlib
 import json
 import logging
+import time
 
-from aiobotocore.session import AioSession
-from slack_sdk.errors import SlackApiError
-
+from autoscaling import QueueStats, SlotLimiter
+from batching import BatchBuffer
 from constants import (
     AWS_SQS_QUEUE_URL,
-    AWS_REGION_NAME,
-    AWS_SQS_ENDPOINT_URL,
+    SQS_ACK_BATCH_SIZE,
+    SQS_ACK_INTERVAL,
+    SQS_ACK_MAX_ATTEMPTS,
+    SQS_HEARTBEAT_INTERVAL,
+    SQS_LANES,
+    SQS_POLLERS,
+    SQS_VISIBILITY_TIMEOUT,
+    WORKER_CONCURRENCY,
+    WORKER_SHUTDOWN_TIMEOUT,
+)
+from metrics import (
+    MESSAGE_LAG_SECONDS,
+    MESSAGES_RECEIVED,
+    QUEUE_OPERATION_ERRORS,
+    QUEUE_OPERATION_SECONDS,
+    TASK_SECONDS,
+    TASKS,
 )
-from tasks import process_message, process_file
+from sessions import SharedSession
+from tasks import detection_buffer, http_session, process_message, process_file
+from transports import QueueTransport, create_transport
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Maximum number of messages a single receive_message call can return
+SQS_MAX_MESSAGES = 10
+
+# Task names recorded in the task metrics
+KNOWN_TASKS = {"process_file", "process_message"}
+
+# Seconds a receive call waits for messages while the queue is empty
+POLL_WAIT_TIME = 10
+
+# Seconds a poller waits after a failed receive before polling again
+POLL_ERROR_BACKOFF = 1.0
+
 
 class SQSManager:
-    def __init__(self):
+    def __init__(
+        self,
+        queue_url: str = AWS_SQS_QUEUE_URL,
+        concurrency: int = WORKER_CONCURRENCY,
+        pollers: int = SQS_POLLERS,
+        autoscaler=None,
+        transport: QueueTransport | None = None,
+        name: str = "tasks",
+    ):
         """
-        Initialize the SQSManager with a session and queue URL.
+        Initialize the SQSManager of a queue.
+
+        The queue is SQS unless another transport is given. Processed messages
+        are acknowledged in batches.
+
+        Args:
+            queue_url (str): URL of the queue to consume.
+            concurrency (int): Number of messages processed at the same time.
+            pollers (int): Number of concurrent long polls feeding the workers.
+            autoscaler (Autoscaler, optional): Controller adjusting the
+                concurrency and pollers to the queue depth. Fixed if None.
+            transport (QueueTransport, optional): Transport shared with other
+                managers of the process. The manager creates and closes the
+                configured one if None.
+            name (str): Name of the queue used in log messages.
         """
-        self.session = AioSession()
-        self.queue_url = AWS_SQS_QUEUE_URL
+        self.autoscaler = autoscaler
+        if autoscaler is not None:
+            concurrency = min(
+                max(concurrency, autoscaler.min_slots), autoscaler.max_slots
+            )
+            pollers = min(max(pollers, autoscaler.min_pollers), autoscaler.max_pollers)
+        self.pollers = pollers
+        self.max_concurrency = autoscaler.max_slots if autoscaler else concurrency
+        self.max_pollers = autoscaler.max_pollers if autoscaler else pollers
+        self._slots = SlotLimiter(concurrency)
+        self._scaled = asyncio.Condition()
+        self._queue = asyncio.Queue(maxsize=self.max_concurrency)
+        # Age in seconds of the oldest message received since the last autoscaling
+        # decision
+        self._oldest_age = 0.0
+        # Receipt handles of the messages being processed, with the time they
+        # were received or last extended
+        self._in_flight = {}
+        self.name = name
+        self.queue_url = queue_url
+        self._owns_transport = transport is None
+        self.transport = transport if transport is not None else create_transport()
+        self._acks = BatchBuffer(
+            self._delete_messages,
+            max_size=SQS_ACK_BATCH_SIZE,
+            max_delay=SQS_ACK_INTERVAL,
+            max_attempts=SQS_ACK_MAX_ATTEMPTS,
+            name="acknowledgement",
+        )
 
-    async def _get_messages(self):
+    async def close(self):
+        """
+        Flush pending acknowledgements and close the transport if it is owned
+        by this manager.
         """
-        Fetch messages from the SQS queue.
+        await self._acks.close()
+        if self._owns_transport:
+            await self.transport.close()
+
+    @contextlib.contextmanager
+    def _measure(self, operation: str):
+        """
+        Time a queue operation and count it as an error if it raises.
+
+        Args:
+            operation (str): The name of the operation, e.g. ``receive``.
+        """
+        try:
+            with QUEUE_OPERATION_SECONDS.time(queue=self.name, operation=operation):
+                yield
+        except Exception:
+            QUEUE_OPERATION_ERRORS.inc(queue=self.name, operation=operation)
+            raise
+
+    async def _get_messages(self, max_messages: int = SQS_MAX_MESSAGES):
+        """
+        Fetch messages from the queue.
+
+        Args:
+            max_messages (int, optional): Maximum number of messages to receive.
 
         Returns:
             list: A list of messages retrieved from the queue.
         """
-        async with self.session.create_client(
-            "sqs",
-            region_name=AWS_REGION_NAME,
-            endpoint_url=AWS_SQS_ENDPOINT_URL,
-        ) as client:
-            response = await client.receive_message(
-                QueueUrl=self.queue_url,
-                MaxNumberOfMessages=10,
-                WaitTimeSeconds=10,
+        with self._measure("receive"):
+            messages = await self.transport.receive(
+                self.queue_url, max_messages, POLL_WAIT_TIME
             )
-            return response.get("Messages", [])
+        MESSAGES_RECEIVED.inc(len(messages), queue=self.name)
+        return messages
+
+    async def _queue_stats(self) -> QueueStats:
+        """
+        Read the depth of the queue and the age of the oldest message received
+        since the previous call.
+
+        Queues do not expose the age of their oldest message, so it is estimated
+        from the ``SentTimestamp`` of the received messages.
+
+        Returns:
+            QueueStats: The queue depth and the age of its oldest message.
+        """
+        with self._measure("queue_stats"):
+            visible, not_visible = await self.transport.queue_stats(self.queue_url)
+        oldest_age, self._oldest_age = self._oldest_age, 0.0
+        return QueueStats(
+            visible=visible, not_visible=not_visible, oldest_age=oldest_age
+        )
+
+    async def _scale(self, concurrency: int, pollers: int):
+        """
+        Change the number of task slots and active pollers.
+
+        Args:
+            concurrency (int): Number of messages processed at the same time.
+            pollers (int): Number of concurrent long polls.
+        """
+        if concurrency == self._slots.limit and pollers == self.pollers:
+            return
+        logger.info(
+            f"Scaling from {self._slots.limit} to {concurrency} slots and from "
+            f"{self.pollers} to {pollers} pollers."
+        )
+        self._slots.set_limit(concurrency)
+        async with self._scaled:
+            self.pollers = pollers
+            self._scaled.notify_all()
 
     async def _delete_message(self, receipt_handle):
         """
-        Delete a message from the SQS queue.
+        Acknowledge a message, deleting it from the queue with the next batch.
 
         Args:
             receipt_handle (str): The receipt handle of the message to delete.
         """
-        async with self.session.create_client(
-            "sqs",
-            region_name=AWS_REGION_NAME,
-            endpoint_url=AWS_SQS_ENDPOINT_URL,
-        ) as client:
-            try:
-                await client.delete_message(
-                    QueueUrl=self.queue_url,
-                    ReceiptHandle=receipt_handle,
-                )
-            except SlackApiError as e:
-                logger.error(f"Slack API Error: {e.response['error']}")
-            else:
-                logger.info(f"Deleted message with ReceiptHandle: {receipt_handle}")
+        await self._acks.add(receipt_handle)
+
+    async def _delete_messages(self, receipt_handles: list) -> list:
+        """
+        Delete a batch of messages from the queue.
+
+        Args:
+            receipt_handles (list): Receipt handles of at most 10 messages.
+
+        Returns:
+            list: The receipt handles whose deletion failed and may be retried.
+        """
+        with self._measure("delete"):
+            return await self.transport.delete_batch(self.queue_url, receipt_handles)
+
+    async def _extend_visibility(self, receipt_handles: list):
+        """
+        Extend the visibility timeout of a batch of messages being processed.
+
+        Messages whose receipt handle is rejected are no longer extended.
+
+        Args:
+            receipt_handles (list): Receipt handles of at most 10 messages.
+        """
+        with self._measure("change_visibility"):
+            rejected = await self.transport.change_visibility_batch(
+                self.queue_url, receipt_handles, SQS_VISIBILITY_TIMEOUT
+            )
+        for receipt_handle in rejected:
+            self._in_flight.pop(receipt_handle, None)
+
+    async def _heartbeat(self):
+        """
+        Periodically extend the visibility of the messages still in flight, so
+        that the queue does not redeliver them to another worker while a long task is
+        running.
+        """
+        while True:
+            await asyncio.sleep(SQS_HEARTBEAT_INTERVAL)
+            now = time.monotonic()
+            due = [
+                receipt_handle
+                for receipt_handle, since in self._in_flight.items()
+                if now - since >= SQS_HEARTBEAT_INTERVAL
+            ]
+            for start in range(0, len(due), SQS_MAX_MESSAGES):
+                batch = due[start : start + SQS_MAX_MESSAGES]
+                try:
+                    await self._extend_visibility(batch)
+                except Exception as e:
+                    logger.error(f"Failed to extend message visibility: {e}")
+                    continue
+                for receipt_handle in batch:
+                    if receipt_handle in self._in_flight:
+                        self._in_flight[receipt_handle] = now
 
     async def _process_message(self, message):
         """
-        Process a single message from the SQS queue.
+        Process a single message from the queue.
 
         Args:
             message (dict): The message to process.
         """
-        body = json.loads(message["Body"])
-        task_name = body.get("task")
-        kwargs = body.get("kwargs", {})
+        try:
+            body = json.loads(message["Body"])
+            task_name = body.get("task")
+            kwargs = body.get("kwargs", {})
+            if not isinstance(kwargs, dict):
+                raise ValueError(f"kwargs is not an object: {kwargs!r}")
+        except (ValueError, AttributeError) as e:
+            # A message that cannot be parsed would fail on every redelivery
+            TASKS.inc(task="unknown", outcome="invalid")
+            logger.error(f"Dropping invalid message {message['Body']!r}: {e}")
+            await self._delete_message(message["ReceiptHandle"])
+            return
 
         logger.info(f"Processing task: {task_name} with kwargs: {kwargs}")
 
+        # Unknown task names are not used as labels, to bound the series
+        task_label = task_name if task_name in KNOWN_TASKS else "unknown"
         try:
-            if task_name == "process_file":
-                await process_file(**kwargs)
-            elif task_name == "process_message":
-                await process_message(**kwargs)
-            else:
-                logger.error(f"Unknown task: {task_name}")
+            with TASK_SECONDS.time(task=task_label):
+                if task_name == "process_file":
+                    await process_file(**kwargs)
+                elif task_name == "process_message":
+                    await process_message(**kwargs)
+                else:
+                    logger.error(f"Unknown task: {task_name}")
 
             await self._delete_message(message["ReceiptHandle"])
         except Exception as e:
+            TASKS.inc(task=task_label, outcome="failure")
             logger.error(f"Failed to process message: {e}")
+            return
+
+        TASKS.inc(task=task_label, outcome="success")
+        sent = message.get("Attributes", {}).get("SentTimestamp")
+        if sent:
+            MESSAGE_LAG_SECONDS.observe(time.time() - int(sent) / 1000, queue=self.name)
+
+    async def _acquire_slots(self) -> int:
+        """
+        Wait for a free task slot, then take every other free slot up to the
+        receive limit.
+
+        Returns:
+            int: The number of slots taken.
+        """
+        await self._slots.acquire()
+        taken = 1
+        while taken < SQS_MAX_MESSAGES and not self._slots.locked():
+            await self._slots.acquire()
+            taken += 1
+        return taken
+
+    async def _poll(self, index: int = 0):
+        """
+        Receive messages into the internal queue while task slots are free.
+
+        A poll only asks for as many messages as there are free slots, and no
+        poll is made while all slots are busy, so that messages are not held
+        in the process while they could be handled by another worker.
+
+        Args:
+            index (int, optional): Position of the poller. Pollers beyond the
+                current number of pollers wait until they are scaled up.
+        """
+        while True:
+            if index >= self.pollers:
+                async with self._scaled:
+                    await self._scaled.wait_for(lambda: index < self.pollers)
+            slots = await self._acquire_slots()
+            messages = []
+            try:
+                messages = await self._get_messages(slots)
+            except Exception as e:
+                logger.error(f"Failed to receive messages: {e}")
+                await asyncio.sleep(POLL_ERROR_BACKOFF)
+            finally:
+                # Give back the slots that no message was received for
+                for _ in range(slots - len(messages)):
+                    self._slots.release()
+
+            now = time.time()
+            for message in messages:
+                sent = message.get("Attributes", {}).get("SentTimestamp")
+                if sent:
+                    self._oldest_age = max(self._oldest_age, now - int(sent) / 1000)
+                self._in_flight[message["ReceiptHandle"]] = time.monotonic()
+                await self._queue.put(message)
+
+    async def _work(self):
+        """
+        Process messages from the internal queue, one at a time.
+        """
+        while True:
+            message = await self._queue.get()
+            try:
+                await self._process_message(message)
+            except Exception as e:
+                logger.error(f"Unexpected error processing a message: {e}")
+            finally:
+                self._in_flight.pop(message["ReceiptHandle"], None)
+                self._queue.task_done()
+                self._slots.release()
 
     async def main(self):
         """
         Main loop to continuously process messages from the queue.
+
+        Pollers feed the received messages to a fixed number of workers, so a
+        slow message only holds its own slot and polling resumes as soon as
+        any slot frees up. A heartbeat keeps the messages in flight invisible
+        to other workers until they are done, and the autoscaler, if any,
+        resizes the slots and pollers to the queue depth.
         """
-        logger.info("Starting SQS task manager...")
+        logger.info(f"Starting SQS task manager for the {self.name} queue...")
+        workers = [
+            asyncio.create_task(self._work()) for _ in range(self.max_concurrency)
+        ]
+        pollers = [
+            asyncio.create_task(self._poll(index)) for index in range(self.max_pollers)
+        ]
+        heartbeat = asyncio.create_task(self._heartbeat())
+        if self.autoscaler is not None:
+            background = [heartbeat, asyncio.create_task(self.autoscaler.run(self))]
+        else:
+            background = [heartbeat]
         try:
-            while True:
-                messages = await self._get_messages()
-                if messages:
-                    tasks = [self._process_message(msg) for msg in messages]
-                    await asyncio.gather(*tasks)
+            await asyncio.gather(*pollers)
         except asyncio.CancelledError:
-            logger.info("SQS task manager shutting down...")
+            logger.info(f"SQS task manager for the {self.name} queue shutting down...")
         except Exception as e:
             logger.error(f"Unexpected error: {e}")
+        finally:
+            for poller in pollers:
+                poller.cancel()
+            try:
+                # Let the messages already received finish
+                await asyncio.wait_for(self._queue.join(), WORKER_SHUTDOWN_TIMEOUT)
+            except asyncio.TimeoutError:
+                logger.warning("Shutdown timeout reached with messages in flight.")
+            for task in background + workers:
+                task.cancel()
+            await asyncio.gather(
+                *pollers, *workers, *background, return_exceptions=True
+            )
+            await self.close()
+
+
+class LaneManager:
+    def __init__(
+        self,
+        lanes: list = SQS_LANES,
+        concurrency: int = WORKER_CONCURRENCY,
+        autoscaler_factory=None,
+        transport: QueueTransport | None = None,
+        session: SharedSession = http_session,
+        detections: BatchBuffer = detection_buffer,
+    ):
+        """
+        Initialize one SQSManager per lane, sharing a single transport.
+
+        Every lane gets a share of the concurrency proportional to its weight,
+        so that slow tasks on one queue cannot take the slots of another.
+
+        Args:
+            lanes (list): The lanes, as dicts with ``name``, ``queue_url`` and
+                ``weight`` keys.
+            concurrency (int): Number of messages processed at the same time
+                across all lanes.
+            autoscaler_factory (callable, optional): Called with a lane's weight
+                share (between 0 and 1) to build the autoscaler of that lane.
+                Lanes have a fixed concurrency if None.
+            transport (QueueTransport, optional): Transport of the lanes. The
+                configured one is created if None.
+            session (SharedSession): HTTP session of the tasks, closed once the
+                lanes have drained.
+            detections (BatchBuffer): Detected messages reported by the tasks,
+                flushed once the lanes have drained.
+        """
+        self.transport = transport if transport is not None else create_transport()
+        self.session = session
+        self.detections = detections
+        total_weight = sum(lane["weight"] for lane in lanes)
+        self.managers = []
+        for lane in lanes:
+            share = lane["weight"] / total_weight
+            self.managers.append(
+                SQSManager(
+                    queue_url=lane["queue_url"],
+                    concurrency=max(round(concurrency * share), 1),
+                    autoscaler=(
+                        autoscaler_factory(share) if autoscaler_factory else None
+                    ),
+                    transport=self.transport,
+                    name=lane["name"],
+                )
+            )
+
+    async def main(self):
+        """
+        Consume every lane until cancelled, then let all of them drain.
+        """
+        try:
+            await asyncio.gather(*(manager.main() for manager in self.managers))
+        except asyncio.CancelledError:
+            # Every lane has finished draining by the time gather reports it
+            pass
+        finally:
+            await self.transport.close()
+            await self.detections.close()
+            await self.session.close()
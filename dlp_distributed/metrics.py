@@ -0,0 +1,333 @@
+import bisect
+import contextlib
+import logging
+import math
+import threading
+import time
+
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds in seconds of the latency histogram buckets
+DEFAULT_BUCKETS = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+    math.inf,
+)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value))
+
+
+def _format_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    escaped = (
+        (name, str(value).replace("\\", r"\\").replace('"', r"\"").replace("\n", r"\n"))
+        for name, value in labels.items()
+    )
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+class _Metric:
+    type = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        """
+        Initialize a metric with one series per combination of label values.
+
+        Args:
+            name (str): The metric name.
+            documentation (str): The help text of the metric.
+            labelnames (tuple): The names of the labels every sample must have.
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(
+                f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}"
+            )
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def clear(self):
+        """
+        Drop every series of the metric.
+        """
+        with self._lock:
+            self._series.clear()
+
+    def render(self) -> list:
+        """
+        Render the metric in the Prometheus text format.
+
+        Returns:
+            list: The lines of the metric, including its HELP and TYPE lines.
+        """
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type}",
+        ]
+        with self._lock:
+            series = sorted(self._series.items())
+        for key, value in series:
+            lines.extend(self._render_series(dict(zip(self.labelnames, key)), value))
+        return lines
+
+    def _render_series(self, labels: dict, value) -> list:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        """
+        Increase the counter of a series.
+
+        Args:
+            amount (float): The increment.
+            **labels: The label values of the series.
+        """
+        key = self._key(labels)
+        with self._lock:
+            self._series[key] = self._series.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        """Return the current value of a series."""
+        return self._series.get(self._key(labels), 0)
+
+    def _render_series(self, labels: dict, value) -> list:
+        return [f"{self.name}_total{_format_labels(labels)} {_format_value(value)}"]
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple = (),
+        buckets: tuple = DEFAULT_BUCKETS,
+    ):
+        """
+        Initialize a histogram counting observations in cumulative buckets.
+
+        Args:
+            name (str): The metric name.
+            documentation (str): The help text of the metric.
+            labelnames (tuple): The names of the labels every sample must have.
+            buckets (tuple): Sorted upper bounds of the buckets. An infinite
+                bucket is added if missing.
+        """
+        super().__init__(name, documentation, labelnames)
+        buckets = tuple(sorted(buckets))
+        if buckets[-1] != math.inf:
+            buckets += (math.inf,)
+        self.buckets = buckets
+
+    def observe(self, value: float, **labels):
+        """
+        Record an observation in a series.
+
+        Args:
+            value (float): The observed value.
+            **labels: The label values of the series.
+        """
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._series.get(key) or ([0] * len(self.buckets), 0.0)
+            counts[index] += 1
+            self._series[key] = (counts, total + value)
+
+    @contextlib.contextmanager
+    def time(self, **labels):
+        """
+        Observe the seconds spent in a block, even if it raises.
+
+        Args:
+            **labels: The label values of the series.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels) -> int:
+        """Return the number of observations of a series."""
+        counts, _ = self._series.get(self._key(labels), ((), 0.0))
+        return sum(counts)
+
+    def _render_series(self, labels: dict, value) -> list:
+        counts, total = value
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, counts):
+            cumulative += count
+            bucket_labels = {**labels, "le": _format_value(bound)}
+            lines.append(
+                f"{self.name}_bucket{_format_labels(bucket_labels)} {cumulative}"
+            )
+        lines.append(f"{self.name}_sum{_format_labels(labels)} {_format_value(total)}")
+        lines.append(f"{self.name}_count{_format_labels(labels)} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        """
+        Initialize a collection of metrics rendered together.
+        """
+        self._metrics = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        """
+        Add a metric to the registry.
+
+        Returns:
+            _Metric: The metric, so that it can be registered where it is defined.
+        """
+        self._metrics.append(metric)
+        return metric
+
+    def clear(self):
+        """
+        Drop the series of every metric.
+        """
+        for metric in self._metrics:
+            metric.clear()
+
+    def render(self) -> str:
+        """
+        Render every metric in the Prometheus text format.
+        """
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+TASKS = REGISTRY.register(
+    Counter("dlp_tasks", "Tasks processed, by outcome.", ("task", "outcome"))
+)
+TASK_SECONDS = REGISTRY.register(
+    Histogram("dlp_task_seconds", "Time spent processing a task.", ("task",))
+)
+STAGE_SECONDS = REGISTRY.register(
+    Histogram(
+        "dlp_stage_seconds",
+        "Time spent in each stage of a task: pattern_fetch, file_info, "
+        "file_download, file_stream, scan, backend_post and slack.",
+        ("stage",),
+    )
+)
+QUEUE_OPERATION_SECONDS = REGISTRY.register(
+    Histogram(
+        "dlp_queue_operation_seconds",
+        "Time spent in each queue operation.",
+        ("queue", "operation"),
+    )
+)
+QUEUE_OPERATION_ERRORS = REGISTRY.register(
+    Counter(
+        "dlp_queue_operation_errors",
+        "Queue operations that raised.",
+        ("queue", "operation"),
+    )
+)
+MESSAGES_RECEIVED = REGISTRY.register(
+    Counter("dlp_messages_received", "Messages received from a queue.", ("queue",))
+)
+MESSAGE_LAG_SECONDS = REGISTRY.register(
+    Histogram(
+        "dlp_message_lag_seconds",
+        "Seconds from a message being sent to the queue to the end of its "
+        "processing.",
+        ("queue",),
+        buckets=(0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0),
+    )
+)
+
+PATTERNS_QUARANTINED = REGISTRY.register(
+    Counter(
+        "dlp_patterns_quarantined",
+        "Patterns quarantined for exceeding their scan time budget.",
+        ("pattern",),
+    )
+)
+
+SLACK_RATE_LIMITED = REGISTRY.register(
+    Counter(
+        "dlp_slack_rate_limited", "Slack calls that were rate limited.", ("method",)
+    )
+)
+
+
+class MetricsServer:
+    def __init__(self, port: int, host: str = "0.0.0.0", registry=REGISTRY):
+        """
+        Initialize an HTTP server exposing the metrics on ``/metrics``.
+
+        Args:
+            port (int): The port to listen on, or 0 for any free port.
+            host (str): The interface to listen on.
+            registry (Registry): The metrics to expose.
+        """
+        self.port = port
+        self.host = host
+        self.registry = registry
+        self._runner = None
+
+    async def _handle(self, request):
+        return web.Response(
+            body=self.registry.render().encode("utf-8"),
+            headers={"Content-Type": CONTENT_TYPE},
+        )
+
+    async def start(self):
+        """
+        Start listening, in the background of the running event loop.
+        """
+        app = web.Application()
+        app.router.add_get("/metrics", self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        # Report the actual port when any free port was asked for
+        self.port = self._runner.addresses[0][1]
+        logger.info(f"Serving metrics on port {self.port}.")
+
+    async def stop(self):
+        """
+        Stop listening.
+        """
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
@@ -0,0 +1,229 @@
+import asyncio
+import hashlib
+import json
+import logging
+import re
+import time
+from dataclasses import dataclass, field
+
+from constants import (
+    PATTERN_CACHE_TTL,
+    PATTERN_CACHE_RETRY_INTERVAL,
+    PATTERN_QUARANTINE_TTL,
+)
+from engine import ScanEngine
+from metrics import PATTERNS_QUARANTINED
+
+logger = logging.getLogger(__name__)
+
+
+class PatternFetchError(Exception):
+    """Raised when the pattern list cannot be retrieved from the backend."""
+
+
+@dataclass(frozen=True)
+class CompiledPattern:
+    id: str
+    name: str
+    regex: str
+    compiled: re.Pattern
+
+
+@dataclass(frozen=True)
+class PatternSet:
+    version: str
+    patterns: tuple = ()
+    engine: ScanEngine = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        object.__setattr__(self, "engine", ScanEngine(self.patterns))
+
+    def __len__(self):
+        return len(self.patterns)
+
+
+EMPTY_PATTERN_SET = PatternSet(version="")
+
+
+def pattern_set_version(raw_patterns: list) -> str:
+    """
+    Compute a stable version identifier for a list of patterns.
+
+    Args:
+        raw_patterns (list): Patterns as returned by the backend API.
+
+    Returns:
+        str: A SHA-256 digest over the pattern IDs and regexes.
+    """
+    payload = sorted((str(p["id"]), p["regex"]) for p in raw_patterns)
+    return hashlib.sha256(json.dumps(payload).encode("utf-8")).hexdigest()
+
+
+def compile_patterns(raw_patterns: list) -> PatternSet:
+    """
+    Compile the patterns returned by the backend API into a PatternSet.
+
+    Patterns whose regex does not compile are logged and skipped.
+
+    Args:
+        raw_patterns (list): Patterns as returned by the backend API.
+
+    Returns:
+        PatternSet: The compiled patterns keyed by their version.
+    """
+    compiled = []
+    for pattern in raw_patterns:
+        try:
+            regex = re.compile(pattern["regex"])
+        except re.error as e:
+            logger.error(f"Skipping invalid pattern {pattern['id']}: {e}")
+            continue
+        compiled.append(
+            CompiledPattern(
+                id=pattern["id"],
+                name=pattern.get("name", ""),
+                regex=pattern["regex"],
+                compiled=regex,
+            )
+        )
+    return PatternSet(
+        version=pattern_set_version(raw_patterns), patterns=tuple(compiled)
+    )
+
+
+class PatternCache:
+    def __init__(
+        self,
+        fetcher,
+        ttl: float = PATTERN_CACHE_TTL,
+        quarantine_ttl: float = PATTERN_QUARANTINE_TTL,
+    ):
+        """
+        Initialize a process-wide cache of compiled patterns.
+
+        Args:
+            fetcher (callable): Coroutine function returning the raw pattern list.
+                It must raise on failure so that the cache can fall back to the
+                last known good pattern set.
+            ttl (float): Seconds a fetched pattern set is considered fresh.
+            quarantine_ttl (float): Seconds a quarantined pattern stays out of
+                the pattern set.
+        """
+        self.fetcher = fetcher
+        self.ttl = ttl
+        self.quarantine_ttl = quarantine_ttl
+        self._pattern_set = None
+        self._raw_patterns = []
+        # Expiry time of each quarantined (id, regex)
+        self._quarantined = {}
+        self._expires_at = 0.0
+        self._lock = asyncio.Lock()
+
+    @property
+    def version(self) -> str:
+        """Return the version of the cached pattern set, if any."""
+        return self._pattern_set.version if self._pattern_set else ""
+
+    def _is_fresh(self) -> bool:
+        return time.monotonic() < self._expires_at
+
+    def clear(self):
+        """
+        Drop the cached pattern set so that the next access refreshes it.
+        """
+        self._pattern_set = None
+        self._raw_patterns = []
+        self._quarantined = {}
+        self._expires_at = 0.0
+
+    def _active(self, raw_patterns: list) -> list:
+        """
+        Return the patterns that are not quarantined, forgetting expired
+        quarantines.
+        """
+        now = time.monotonic()
+        self._quarantined = {
+            key: expires_at
+            for key, expires_at in self._quarantined.items()
+            if expires_at > now
+        }
+        return [
+            pattern
+            for pattern in raw_patterns
+            if (str(pattern["id"]), pattern["regex"]) not in self._quarantined
+        ]
+
+    def quarantine(self, pattern_ids: list):
+        """
+        Stop scanning with patterns that exceeded their time budget.
+
+        A quarantined pattern stays out of the pattern set for ``quarantine_ttl``
+        seconds, or until the pattern set changes in the backend.
+
+        Args:
+            pattern_ids (list): IDs of the patterns to quarantine.
+        """
+        pattern_ids = {str(pattern_id) for pattern_id in pattern_ids}
+        expires_at = time.monotonic() + self.quarantine_ttl
+        for pattern in self._raw_patterns:
+            if str(pattern["id"]) in pattern_ids:
+                self._quarantined[(str(pattern["id"]), pattern["regex"])] = expires_at
+                PATTERNS_QUARANTINED.inc(pattern=pattern["id"])
+                logger.error(
+                    f"Quarantined pattern {pattern['id']} ({pattern.get('name', '')}): "
+                    f"it exceeded its scan time budget."
+                )
+        if self._pattern_set is not None:
+            self._pattern_set = compile_patterns(self._active(self._raw_patterns))
+
+    async def get(self) -> PatternSet:
+        """
+        Return the current pattern set, refreshing it if the TTL has expired.
+
+        Only one refresh runs at a time; concurrent callers wait for it and
+        reuse its result instead of hitting the backend themselves.
+
+        Returns:
+            PatternSet: The cached pattern set, or an empty one if no pattern set
+                has ever been fetched successfully.
+        """
+        if not self._is_fresh():
+            async with self._lock:
+                # Another task may have refreshed while we were waiting.
+                if not self._is_fresh():
+                    await self.refresh()
+        if self._pattern_set is None:
+            return EMPTY_PATTERN_SET
+        return self._pattern_set
+
+    async def refresh(self):
+        """
+        Fetch and compile the pattern set, keeping the last known good one on failure.
+        """
+        try:
+            raw_patterns = await self.fetcher()
+        except Exception as e:
+            if self._pattern_set is not None:
+                logger.warning(
+                    f"Pattern refresh failed ({e}), using last known good "
+                    f"version {self._pattern_set.version[:12]}."
+                )
+            else:
+                logger.warning(f"Pattern refresh failed ({e}), no patterns cached.")
+            self._expires_at = time.monotonic() + PATTERN_CACHE_RETRY_INTERVAL
+            return
+
+        if pattern_set_version(raw_patterns) != pattern_set_version(self._raw_patterns):
+            # Give every pattern another chance on a new pattern set
+            self._quarantined = {}
+        self._raw_patterns = raw_patterns
+        active_patterns = self._active(raw_patterns)
+        if self._pattern_set is None or (
+            pattern_set_version(active_patterns) != self._pattern_set.version
+        ):
+            self._pattern_set = compile_patterns(active_patterns)
+            logger.info(
+                f"Loaded pattern set version {self._pattern_set.version[:12]} "
+                f"with {len(self._pattern_set)} patterns."
+            )
+        self._expires_at = time.monotonic() + self.ttl
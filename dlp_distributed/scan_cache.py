@@ -0,0 +1,84 @@
+import hashlib
+import logging
+from collections import OrderedDict
+
+from constants import SCAN_CACHE_SIZE
+
+logger = logging.getLogger(__name__)
+
+
+class ScanResultCache:
+    def __init__(self, max_entries: int = SCAN_CACHE_SIZE):
+        """
+        Initialize an LRU cache of scan results keyed by content hash.
+
+        Args:
+            max_entries (int): Maximum number of results kept. Zero disables caching.
+        """
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    @staticmethod
+    def key(content: str | bytes, version: str) -> str:
+        """
+        Build the cache key for a content and a pattern set version.
+
+        Args:
+            content (str | bytes): The scanned text or file content.
+            version (str): The version of the pattern set used for the scan.
+
+        Returns:
+            str: The SHA-256 digest of the content joined with the version.
+        """
+        if isinstance(content, str):
+            content = content.encode("utf-8")
+        return f"{hashlib.sha256(content).hexdigest()}:{version}"
+
+    def get(self, key: str):
+        """
+        Return the scan result cached for a key.
+
+        Args:
+            key (str): A key built with ``ScanResultCache.key``.
+
+        Returns:
+            tuple | None: The scan result, or None on a miss.
+        """
+        matches = self._entries.get(key)
+        if matches is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return matches
+
+    def put(self, key: str, matches):
+        """
+        Store the scan result for a key, evicting the least recently used.
+
+        Args:
+            key (str): A key built with ``ScanResultCache.key``.
+            matches (Iterable): The matched pattern IDs, or ``(id, span)`` pairs.
+        """
+        if self.max_entries <= 0:
+            return
+        self._entries[key] = tuple(matches)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        """
+        Drop all entries and reset the counters.
+        """
+        self._entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self) -> dict:
+        """
+        Return the hit and miss counters and the current size.
+        """
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._entries)}
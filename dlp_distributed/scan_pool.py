@@ -0,0 +1,159 @@
+import asyncio
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from constants import (
+    SCAN_INLINE_THRESHOLD,
+    SCAN_PROCESSES,
+    SCAN_TIME_BUDGET,
+    SCAN_TIME_BUDGET_PER_MB,
+)
+from patterns import compile_patterns
+
+logger = logging.getLogger(__name__)
+
+# Engine of the pattern set loaded in a pool process
+_engine = None
+
+
+def _load_patterns(raw_patterns: list):
+    """
+    Compile the pattern set once when a pool process starts.
+    """
+    global _engine
+    _engine = compile_patterns(raw_patterns).engine
+
+
+def _locate(text, pos: int, budget: float) -> tuple:
+    """
+    Locate the patterns in a text with the engine preloaded in this pool process.
+    """
+    return _engine.locate_within(text, pos, budget)
+
+
+class ScanPool:
+    def __init__(
+        self,
+        max_workers: int = SCAN_PROCESSES,
+        inline_threshold: int = SCAN_INLINE_THRESHOLD,
+        budget: float = SCAN_TIME_BUDGET,
+        budget_per_mb: float = SCAN_TIME_BUDGET_PER_MB,
+        on_timeout=None,
+    ):
+        """
+        Initialize a pool of processes that run the CPU-bound regex scans.
+
+        The pool is started lazily and restarted whenever the pattern set version
+        changes, so that every process has the compiled patterns preloaded.
+
+        Args:
+            max_workers (int): Number of scan processes. Zero scans everything inline.
+            inline_threshold (int): Texts shorter than this are scanned on the event
+                loop, where the round trip to a process would cost more than the scan.
+            budget (float): Seconds a single pattern may run on one text.
+            budget_per_mb (float): Seconds added to the budget for every MiB of
+                the text, so that large files do not quarantine sound patterns.
+            on_timeout (callable, optional): Called with the IDs of the patterns
+                that were aborted for exceeding the budget.
+        """
+        self.max_workers = max_workers
+        self.inline_threshold = inline_threshold
+        self.budget = budget
+        self.budget_per_mb = budget_per_mb
+        self.on_timeout = on_timeout
+        self._executor = None
+        self._version = None
+
+    def _executor_for(self, pattern_set) -> ProcessPoolExecutor:
+        """
+        Return an executor whose processes have ``pattern_set`` preloaded.
+        """
+        if self._executor is None or self._version != pattern_set.version:
+            self.shutdown()
+            raw_patterns = [
+                {"id": p.id, "name": p.name, "regex": p.regex}
+                for p in pattern_set.patterns
+            ]
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_load_patterns,
+                initargs=(raw_patterns,),
+            )
+            self._version = pattern_set.version
+            logger.info(
+                f"Started {self.max_workers} scan processes for pattern set "
+                f"version {pattern_set.version[:12]}."
+            )
+        return self._executor
+
+    def budget_for(self, text, pos: int = 0) -> float:
+        """
+        Return the seconds a single pattern may run on a text, from ``pos``.
+        """
+        return self.budget + self.budget_per_mb * (len(text) - pos) / (1024 * 1024)
+
+    async def scan(self, pattern_set, text, pos: int = 0) -> list:
+        """
+        Scan a text with a pattern set, in a pool process if the text is large.
+
+        Args:
+            pattern_set (PatternSet): The pattern set to scan with.
+            text (str | bytes | bytearray): The text, or the UTF-8 buffer, to scan.
+            pos (int, optional): Index where matches may start.
+
+        Returns:
+            list: IDs of the patterns that matched.
+        """
+        return list(await self.locate(pattern_set, text, pos))
+
+    async def locate(self, pattern_set, text, pos: int = 0) -> dict:
+        """
+        Find where each pattern first matches a text, in a pool process if the
+        text is large.
+
+        Patterns that exceed the time budget of the text are aborted, logged and passed to
+        ``on_timeout``; they count as not matching.
+
+        Args:
+            pattern_set (PatternSet): The pattern set to scan with.
+            text (str | bytes | bytearray): The text, or the UTF-8 buffer, to scan.
+            pos (int, optional): Index where matches may start.
+
+        Returns:
+            dict: Spans of the first matches keyed by pattern ID.
+        """
+        budget = self.budget_for(text, pos)
+        if (
+            self.max_workers <= 0
+            or not pattern_set.patterns
+            or len(text) - pos < self.inline_threshold
+        ):
+            spans, timed_out = pattern_set.engine.locate_within(text, pos, budget)
+        else:
+            loop = asyncio.get_running_loop()
+            try:
+                spans, timed_out = await loop.run_in_executor(
+                    self._executor_for(pattern_set), _locate, text, pos, budget
+                )
+            except BrokenProcessPool as e:
+                logger.error(f"Scan process pool broke, scanning inline: {e}")
+                self.shutdown()
+                spans, timed_out = pattern_set.engine.locate_within(text, pos, budget)
+
+        if timed_out:
+            logger.error(f"Patterns {timed_out} exceeded the {budget:.3g}s budget.")
+            if self.on_timeout is not None:
+                self.on_timeout(timed_out)
+        return spans
+
+    def shutdown(self):
+        """
+        Stop the scan processes without waiting for running scans.
+        """
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+            self._version = None
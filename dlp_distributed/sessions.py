@@ -0,0 +1,83 @@
+import asyncio
+import logging
+
+import aiohttp
+
+from constants import (
+    HTTP_CONNECT_TIMEOUT,
+    HTTP_DNS_CACHE_TTL,
+    HTTP_KEEPALIVE_TIMEOUT,
+    HTTP_POOL_PER_HOST,
+    HTTP_POOL_SIZE,
+    HTTP_READ_TIMEOUT,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class SharedSession:
+    def __init__(
+        self,
+        limit: int = HTTP_POOL_SIZE,
+        limit_per_host: int = HTTP_POOL_PER_HOST,
+        dns_cache_ttl: int = HTTP_DNS_CACHE_TTL,
+        keepalive_timeout: float = HTTP_KEEPALIVE_TIMEOUT,
+        connect_timeout: float = HTTP_CONNECT_TIMEOUT,
+        read_timeout: float = HTTP_READ_TIMEOUT,
+    ):
+        """
+        Initialize a process-wide aiohttp session, so that HTTP calls reuse
+        pooled keep-alive connections and cached DNS answers.
+
+        The session is created on first use, on the running event loop, and
+        again if it was closed or the loop changed.
+
+        Args:
+            limit (int): Maximum number of connections.
+            limit_per_host (int): Maximum number of connections to one host.
+            dns_cache_ttl (int): Seconds DNS answers are cached.
+            keepalive_timeout (float): Seconds an idle connection is kept open.
+            connect_timeout (float): Seconds to wait for a connection.
+            read_timeout (float): Seconds to wait for data on a connection. There
+                is no total timeout, so that large downloads can be streamed.
+        """
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.dns_cache_ttl = dns_cache_ttl
+        self.keepalive_timeout = keepalive_timeout
+        self.timeout = aiohttp.ClientTimeout(
+            total=None, sock_connect=connect_timeout, sock_read=read_timeout
+        )
+        self._session = None
+        self._loop = None
+
+    def get(self) -> aiohttp.ClientSession:
+        """
+        Return the shared session, creating it if needed.
+
+        Returns:
+            aiohttp.ClientSession: The session.
+        """
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._loop is not loop:
+            connector = aiohttp.TCPConnector(
+                limit=self.limit,
+                limit_per_host=self.limit_per_host,
+                ttl_dns_cache=self.dns_cache_ttl,
+                keepalive_timeout=self.keepalive_timeout,
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector, timeout=self.timeout
+            )
+            self._loop = loop
+            logger.info("Created shared HTTP session.")
+        return self._session
+
+    async def close(self):
+        """
+        Close the session and its connections.
+        """
+        session, self._session = self._session, None
+        self._loop = None
+        if session is not None and not session.closed:
+            await session.close()
@@ -0,0 +1,281 @@
+import asyncio
+import logging
+import time
+
+from slack_sdk.errors import SlackApiError
+from slack_sdk.web.async_client import AsyncWebClient
+
+from autoscaling import SlotLimiter
+from constants import (
+    SLACK_DEFAULT_RATE,
+    SLACK_DEFAULT_RETRY_AFTER,
+    SLACK_MAX_CONCURRENCY,
+    SLACK_MAX_RETRIES,
+    SLACK_METHOD_RATES,
+    SLACK_MIN_CONCURRENCY,
+    SLACK_RETRY_QUEUE_SIZE,
+)
+from metrics import SLACK_RATE_LIMITED
+
+logger = logging.getLogger(__name__)
+
+
+class SlackRateLimitedError(Exception):
+    """Raised when a Slack call is still rate limited after its retries."""
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float):
+        """
+        Initialize a token bucket allowing ``rate`` calls per second on average,
+        with bursts of up to ``capacity`` calls.
+
+        Args:
+            rate (float): Tokens added per second.
+            capacity (float): Maximum number of tokens.
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float):
+        self.tokens = min(
+            self.capacity, self.tokens + (now - self._updated) * self.rate
+        )
+        self._updated = now
+
+    async def acquire(self):
+        """
+        Take a token, waiting for one to be added or for a pause to end.
+
+        Waiters are served in order.
+        """
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._refill(now)
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def pause(self, seconds: float):
+        """
+        Stop handing out tokens for ``seconds``, then start again with an empty
+        bucket, as asked by a ``Retry-After`` header.
+
+        Args:
+            seconds (float): Seconds to pause.
+        """
+        now = time.monotonic()
+        self._paused_until = max(self._paused_until, now + seconds)
+        self.tokens = 0
+        self._updated = self._paused_until
+
+
+def is_rate_limited(error: SlackApiError) -> bool:
+    """Return whether a Slack error is a rate limit response."""
+    response = error.response
+    return getattr(response, "status_code", None) == 429 or (
+        response.get("error") == "ratelimited"
+    )
+
+
+def retry_after(error: SlackApiError) -> float:
+    """
+    Return the seconds to wait before retrying a rate limited call.
+
+    Args:
+        error (SlackApiError): The rate limit error.
+
+    Returns:
+        float: The ``Retry-After`` header, or ``SLACK_DEFAULT_RETRY_AFTER`` if it
+            is missing or invalid.
+    """
+    headers = getattr(error.response, "headers", None) or {}
+    value = headers.get("Retry-After", headers.get("retry-after"))
+    try:
+        return max(float(value), 0.0)
+    except (TypeError, ValueError):
+        return SLACK_DEFAULT_RETRY_AFTER
+
+
+class SlackDispatcher:
+    def __init__(
+        self,
+        client,
+        rates: dict = SLACK_METHOD_RATES,
+        min_concurrency: int = SLACK_MIN_CONCURRENCY,
+        max_concurrency: int = SLACK_MAX_CONCURRENCY,
+        max_retries: int = SLACK_MAX_RETRIES,
+        retry_queue_size: int = SLACK_RETRY_QUEUE_SIZE,
+        session=None,
+    ):
+        """
+        Initialize a dispatcher that calls Slack within its rate limits.
+
+        Every method has its own token bucket, paused for the ``Retry-After``
+        of a rate limited response. The number of concurrent calls grows by one
+        after a full round of successful calls and halves on a rate limit. At
+        most ``retry_queue_size`` rate limited calls wait for a retry at once;
+        beyond that, or after ``max_retries``, the call fails with
+        SlackRateLimitedError, so that the task is retried from the queue
+        instead of the action being lost.
+
+        Args:
+            client (AsyncWebClient): The Slack client.
+            rates (dict): Calls per second and burst size by method name.
+            min_concurrency (int): Fewest concurrent calls.
+            max_concurrency (int): Most concurrent calls.
+            max_retries (int): Times a rate limited call is retried.
+            retry_queue_size (int): Rate limited calls that may wait at once.
+            session (SharedSession, optional): HTTP session to call Slack with,
+                through a copy of ``client`` built for the session of each event
+                loop. ``client`` opens a session per call if None.
+        """
+        self.client = client
+        self.session = session
+        self._session_client = None
+        self.rates = rates
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max(max_concurrency, min_concurrency)
+        self.max_retries = max_retries
+        self.retry_queue_size = retry_queue_size
+        # Share of the rates used by this process, lowered when several worker
+        # processes call Slack with the same token
+        self.rate_share = 1.0
+        self._buckets = {}
+        self._slots = SlotLimiter(self.max_concurrency)
+        self._successes = 0
+        self._backoff_until = 0.0
+        self._retrying = 0
+
+    @property
+    def concurrency(self) -> int:
+        """Return the current number of concurrent calls allowed."""
+        return self._slots.limit
+
+    def clear(self):
+        """
+        Forget the token buckets and concurrency learned so far.
+        """
+        self._buckets = {}
+        self._slots = SlotLimiter(self.max_concurrency)
+        self._successes = 0
+        self._backoff_until = 0.0
+
+    def _client(self) -> AsyncWebClient:
+        """
+        Return the client to call Slack with, bound to the shared session of
+        the running event loop if there is one.
+        """
+        if self.session is None:
+            return self.client
+        session = self.session.get()
+        if self._session_client is None or self._session_client.session is not session:
+            self._session_client = AsyncWebClient(
+                token=self.client.token,
+                base_url=self.client.base_url,
+                timeout=self.client.timeout,
+                ssl=self.client.ssl,
+                proxy=self.client.proxy,
+                session=session,
+                headers=self.client.headers,
+                retry_handlers=self.client.retry_handlers,
+            )
+        return self._session_client
+
+    def _bucket(self, method: str) -> TokenBucket:
+        if method not in self._buckets:
+            rate, burst = self.rates.get(method, SLACK_DEFAULT_RATE)
+            self._buckets[method] = TokenBucket(
+                rate * self.rate_share, max(burst * self.rate_share, 1)
+            )
+        return self._buckets[method]
+
+    def _on_success(self):
+        """
+        Allow one more concurrent call after a full round of successful calls.
+        """
+        self._successes += 1
+        if self._successes >= self._slots.limit:
+            self._successes = 0
+            if self._slots.limit < self.max_concurrency:
+                self._slots.set_limit(self._slots.limit + 1)
+
+    def _on_rate_limited(self, delay: float):
+        """
+        Halve the concurrent calls, once per ``Retry-After`` window.
+        """
+        self._successes = 0
+        now = time.monotonic()
+        if now < self._backoff_until:
+            return
+        self._backoff_until = now + delay
+        limit = max(self._slots.limit // 2, self.min_concurrency)
+        if limit != self._slots.limit:
+            logger.warning(
+                f"Slack rate limited, lowering concurrency to {limit} calls."
+            )
+            self._slots.set_limit(limit)
+
+    async def call(self, method: str, **kwargs):
+        """
+        Call a Slack Web API method within its rate limit.
+
+        Args:
+            method (str): The name of the client method, e.g. ``chat_update``.
+            **kwargs: The arguments of the method.
+
+        Returns:
+            AsyncSlackResponse: The response of the call.
+
+        Raises:
+            SlackRateLimitedError: If the call is still rate limited after its
+                retries, or the retry queue is full.
+            SlackApiError: If Slack returns any other error.
+        """
+        client = self._client()
+        bucket = self._bucket(method)
+        queued = False
+        try:
+            for attempt in range(self.max_retries + 1):
+                await bucket.acquire()
+                await self._slots.acquire()
+                try:
+                    response = await getattr(client, method)(**kwargs)
+                except SlackApiError as e:
+                    if not is_rate_limited(e):
+                        raise
+                    delay = retry_after(e)
+                else:
+                    self._on_success()
+                    return response
+                finally:
+                    self._slots.release()
+
+                SLACK_RATE_LIMITED.inc(method=method)
+                bucket.pause(delay)
+                self._on_rate_limited(delay)
+                if attempt == self.max_retries:
+                    break
+                if not queued:
+                    if self._retrying >= self.retry_queue_size:
+                        raise SlackRateLimitedError(
+                            f"{method} rate limited and the retry queue is full"
+                        )
+                    self._retrying += 1
+                    queued = True
+                logger.warning(f"Slack {method} rate limited, retrying in {delay}s.")
+            raise SlackRateLimitedError(
+                f"{method} still rate limited after {self.max_retries} retries"
+            )
+        finally:
+            if queued:
+                self._retrying -= 1
@@ -0,0 +1,93 @@
+import codecs
+import logging
+
+from constants import SCAN_CHUNK_SIZE, SCAN_OVERLAP_LIMIT
+
+logger = logging.getLogger(__name__)
+
+# Characters kept before the overlap so that anchors and lookbehinds at the start
+# of a window see the real preceding text
+SCAN_CONTEXT = 64
+
+
+async def scan_stream(chunks, engine, charset: str | None = None, scanner=None):
+    """
+    Scan a byte stream with bounded memory.
+
+    Every window holds the newly decoded text plus a tail of the previous window
+    sized to the longest possible match (capped at ``SCAN_OVERLAP_LIMIT``), so
+    matches crossing a chunk boundary are still found. Scanning stops at the
+    first window with a match since the verdict is already certain.
+
+    The last ``overlap`` characters of a window are unconfirmed: a match there
+    may only exist because the window ends in the middle of a token, where a
+    trailing ``\\b`` or ``$`` matches. Matches ending in them are ignored and
+    that text is scanned again at the start of the next window.
+
+    Args:
+        chunks (AsyncIterator[bytes]): The byte chunks of the file.
+        engine (ScanEngine): The engine of the current pattern set.
+        charset (str, optional): The charset of the stream. Defaults to UTF-8.
+        scanner (callable, optional): Coroutine function ``(text, pos)`` returning
+            the spans of the first matches keyed by pattern ID. Defaults to
+            locating them inline with ``engine``.
+
+    Returns:
+        tuple: The matched pattern IDs and the window they were found in, or an
+            empty list and an empty string if nothing matched.
+    """
+    if scanner is None:
+
+        async def scanner(text, pos):
+            return engine.locate_within(text, pos)[0]
+
+    overlap = min(engine.max_width, SCAN_OVERLAP_LIMIT)
+    decoder = codecs.getincrementaldecoder(charset or "utf-8")(errors="replace")
+    window = ""
+    pos = 0
+
+    async def scan(confirmed_end: int) -> list:
+        spans = await scanner(window, pos)
+        return [
+            pattern_id for pattern_id, (_, end) in spans.items() if end <= confirmed_end
+        ]
+
+    async for chunk in chunks:
+        window += decoder.decode(chunk)
+        confirmed_end = len(window) - overlap
+        if confirmed_end > pos:
+            matches = await scan(confirmed_end)
+            if matches:
+                return matches, window
+        # Matches that end after confirmed_end start after carry_from
+        carry_from = max(confirmed_end - overlap, pos)
+        keep_from = max(carry_from - SCAN_CONTEXT, 0)
+        window = window[keep_from:]
+        pos = carry_from - keep_from
+
+    window += decoder.decode(b"", final=True)
+    if len(window) > pos:
+        matches = await scan(len(window))
+        if matches:
+            return matches, window
+    return [], ""
+
+
+async def scan_response(response, engine, scanner=None):
+    """
+    Scan an aiohttp response body in chunks of ``SCAN_CHUNK_SIZE`` bytes.
+
+    Args:
+        response (aiohttp.ClientResponse): The file download response.
+        engine (ScanEngine): The engine of the current pattern set.
+        scanner (callable, optional): See ``scan_stream``.
+
+    Returns:
+        tuple: The matched pattern IDs and the window they were found in.
+    """
+    return await scan_stream(
+        response.content.iter_chunked(SCAN_CHUNK_SIZE),
+        engine,
+        response.charset,
+        scanner,
+    )
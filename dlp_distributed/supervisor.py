@@ -0,0 +1,245 @@
+import asyncio
+import gc
+import logging
+import multiprocessing
+import signal
+import time
+from multiprocessing.connection import wait
+
+from autoscaling import Autoscaler
+from constants import (
+    METRICS_PORT,
+    SQS_MAX_POLLERS,
+    SQS_MIN_POLLERS,
+    WORKER_MAX_CONCURRENCY,
+    WORKER_MIN_CONCURRENCY,
+    WORKER_PROCESSES,
+    WORKER_RESTART_DELAY,
+    WORKER_SHUTDOWN_TIMEOUT,
+)
+from manager import LaneManager
+from metrics import MetricsServer
+from tasks import http_session, pattern_cache, scan_pool, slack_dispatcher
+
+logger = logging.getLogger(__name__)
+
+# Extra seconds a worker gets after its drain timeout before it is killed
+SHUTDOWN_MARGIN = 5.0
+
+# Slot of the current worker process, set when it is forked
+worker_slot = 0
+
+
+async def serve(manager, metrics_server: MetricsServer | None = None):
+    """
+    Run a manager until SIGTERM or SIGINT, then let it drain.
+
+    The first signal cancels the manager, which finishes the messages it has
+    already received; further signals are ignored so they cannot interrupt
+    the drain.
+
+    Args:
+        manager (SQSManager | LaneManager): The manager to run.
+        metrics_server (MetricsServer, optional): Server exposing the metrics
+            while the manager runs.
+    """
+    if metrics_server is not None:
+        await metrics_server.start()
+    loop = asyncio.get_running_loop()
+    task = asyncio.ensure_future(manager.main())
+    stopping = False
+
+    def stop():
+        nonlocal stopping
+        if not stopping:
+            stopping = True
+            logger.info("Received shutdown signal, draining...")
+            task.cancel()
+
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(signum, stop)
+    try:
+        await task
+    finally:
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            loop.remove_signal_handler(signum)
+        if metrics_server is not None:
+            await metrics_server.stop()
+
+
+def lane_autoscaler(share: float) -> Autoscaler:
+    """
+    Build the autoscaler of a lane, with its share of the concurrency bounds.
+
+    Args:
+        share (float): The weight share of the lane, between 0 and 1.
+
+    Returns:
+        Autoscaler: The autoscaler of the lane.
+    """
+    return Autoscaler(
+        min_slots=max(round(WORKER_MIN_CONCURRENCY * share), 1),
+        max_slots=max(round(WORKER_MAX_CONCURRENCY * share), 1),
+        min_pollers=SQS_MIN_POLLERS,
+        max_pollers=SQS_MAX_POLLERS,
+    )
+
+
+def run_worker():
+    """
+    Entry point of a worker process: consume the queues on a new event loop.
+
+    Every worker process serves its own metrics, on ``METRICS_PORT`` plus its
+    slot.
+    """
+    manager = LaneManager(autoscaler_factory=lane_autoscaler)
+    metrics_server = MetricsServer(METRICS_PORT + worker_slot) if METRICS_PORT else None
+    try:
+        asyncio.run(serve(manager, metrics_server))
+    finally:
+        scan_pool.shutdown()
+
+
+class Supervisor:
+    def __init__(
+        self,
+        target=run_worker,
+        processes: int = WORKER_PROCESSES,
+        restart_delay: float = WORKER_RESTART_DELAY,
+    ):
+        """
+        Initialize a supervisor that runs worker processes forked from itself.
+
+        Args:
+            target (callable): Function run by every worker process.
+            processes (int): Number of worker processes.
+            restart_delay (float): Seconds to wait before restarting a worker
+                that exited.
+        """
+        self.target = target
+        self.processes = max(processes, 1)
+        self.restart_delay = restart_delay
+        self._context = multiprocessing.get_context("fork")
+        self._children = {}
+        self._stopping = False
+
+    def warm(self):
+        """
+        Prepare the state the workers inherit when they are forked.
+
+        The pattern set is fetched and compiled once here, so every worker
+        starts with it in copy-on-write memory instead of compiling its own.
+        The scan processes and the Slack rate limits are shared out between
+        the workers.
+        """
+
+        async def _warm():
+            try:
+                return await pattern_cache.get()
+            finally:
+                # The session is bound to this event loop and must not be
+                # inherited with its open connections by the workers
+                await http_session.close()
+
+        pattern_set = asyncio.run(_warm())
+        logger.info(f"Warmed {len(pattern_set)} patterns before forking.")
+        scan_pool.max_workers = max(scan_pool.max_workers // self.processes, 1)
+        slack_dispatcher.rate_share = 1 / self.processes
+        # Keep the warmed objects out of the garbage collector, whose
+        # bookkeeping would otherwise copy their pages in every worker.
+        gc.freeze()
+
+    def _run_child(self, slot: int):
+        """
+        Run the target in a freshly forked worker process.
+        """
+        global worker_slot
+        worker_slot = slot
+        # The supervisor's handlers and children were inherited by the fork
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        self._children.clear()
+        self.target()
+
+    def _start(self, slot: int):
+        """
+        Fork the worker process of a slot.
+        """
+        process = self._context.Process(
+            target=self._run_child,
+            args=(slot,),
+            name=f"dlp-worker-{slot}",
+            daemon=False,
+        )
+        process.start()
+        self._children[slot] = process
+        logger.info(f"Started worker {slot} with pid {process.pid}.")
+
+    def start(self):
+        """
+        Fork all worker processes.
+        """
+        for slot in range(self.processes):
+            self._start(slot)
+
+    def monitor(self, timeout: float | None = None):
+        """
+        Wait for workers to exit and restart them, unless stopping.
+
+        Args:
+            timeout (float, optional): Seconds to wait for a worker to exit.
+        """
+        sentinels = {process.sentinel: slot for slot, process in self._children.items()}
+        for sentinel in wait(list(sentinels), timeout):
+            slot = sentinels[sentinel]
+            process = self._children[slot]
+            process.join()
+            if self._stopping:
+                continue
+            logger.error(
+                f"Worker {slot} (pid {process.pid}) exited with code "
+                f"{process.exitcode}, restarting in {self.restart_delay}s."
+            )
+            time.sleep(self.restart_delay)
+            self._start(slot)
+
+    def stop(self, signum=signal.SIGTERM, frame=None):
+        """
+        Stop restarting workers and forward SIGTERM so they drain.
+        """
+        if not self._stopping:
+            logger.info("Stopping workers...")
+        self._stopping = True
+        for process in self._children.values():
+            if process.is_alive():
+                process.terminate()
+
+    def shutdown(self, timeout: float = WORKER_SHUTDOWN_TIMEOUT + SHUTDOWN_MARGIN):
+        """
+        Stop the workers, waiting for them to drain and killing the stragglers.
+
+        Args:
+            timeout (float): Seconds the workers get to exit.
+        """
+        self.stop()
+        deadline = time.monotonic() + timeout
+        for slot, process in self._children.items():
+            process.join(max(deadline - time.monotonic(), 0))
+            if process.is_alive():
+                logger.error(f"Worker {slot} did not drain in time, killing it.")
+                process.kill()
+                process.join()
+        self._children.clear()
+
+    def run(self):
+        """
+        Warm up, fork the workers and supervise them until SIGTERM or SIGINT.
+        """
+        self.warm()
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        self.start()
+        while not self._stopping:
+            self.monitor(timeout=1.0)
+        self.shutdown()
+        logger.info("All workers stopped.")
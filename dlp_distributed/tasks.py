@@ -1,102 +1,309 @@
+import hashlib
 import logging
 import os
-import re
+import time
+from functools import partial
 from urllib.parse import urljoin
 
 import aiohttp
 from slack_sdk.errors import SlackApiError
 from slack_sdk.web.async_client import AsyncWebClient
 
+from batching import BatchBuffer
+from constants import (
+    DETECTION_BATCH_INTERVAL,
+    DETECTION_BATCH_SIZE,
+    DETECTION_MAX_ATTEMPTS,
+    SCAN_REPORT_CONTEXT,
+    SCAN_STREAM_THRESHOLD,
+)
+from engine import decode_window
+from metrics import STAGE_SECONDS
+from patterns import PatternCache, PatternFetchError
+from scan_cache import ScanResultCache
+from scan_pool import ScanPool
+from sessions import SharedSession
+from slack import SlackDispatcher
+from streaming import scan_response
+
 SLACK_BLOCKING_MESSAGE = "Message was blocked due to containing sensitive information."
 SLACK_BLOCKING_FILE = "File was deleted for containing sensitive information."
 
 logger = logging.getLogger(__name__)
 
+# Charsets whose files are scanned as bytes instead of being decoded first
+BYTE_SCAN_CHARSETS = {"utf-8", "utf8", "ascii", "us-ascii"}
+
 SLACK_TOKEN = os.getenv("SLACK_USER_TOKEN")
 BASE_URL = os.getenv("BASE_URL", "")
 
 # Construct URLs for backend API endpoints
-detected_messages_url = urljoin(BASE_URL, "/api/detected-messages/")
+detected_messages_bulk_url = urljoin(BASE_URL, "/api/detected-messages/bulk/")
+content_blobs_missing_url = urljoin(BASE_URL, "/api/content-blobs/missing/")
 pattern_url = urljoin(BASE_URL, "/api/patterns/")
 
 slack_client = AsyncWebClient(token=SLACK_TOKEN)
 
+# Process-wide HTTP session, so that all calls share pooled keep-alive
+# connections; it is closed by the manager on shutdown
+http_session = SharedSession()
+
+# Calls to Slack go through the dispatcher, which keeps them within the rate limits
+slack_dispatcher = SlackDispatcher(slack_client, session=http_session)
+
+
+# The last pattern list fetched and its ETag, to revalidate it with If-None-Match
+last_patterns = {}
+
 
 async def fetch_patterns():
+    """
+    Fetch the pattern list from the backend API.
+
+    The list fetched before is revalidated, so that the backend answers with an
+    empty 304 response when it has not changed.
+
+    Raises:
+        PatternFetchError: If the patterns could not be retrieved.
+    """
     headers = {"Host": "backend"}
+    if "etag" in last_patterns:
+        headers["If-None-Match"] = last_patterns["etag"]
     try:
-        async with aiohttp.ClientSession(headers=headers) as session:
-            async with session.get(f"{BASE_URL}/api/patterns/") as response:
-                if response.status == 200:
-                    logger.info("Found fetch patterns.")
-                    return await response.json()
-                else:
-                    logger.error(f"Failed to fetch patterns. Status: {response.status}")
-                    return []
+        async with http_session.get().get(
+            f"{BASE_URL}/api/patterns/", headers=headers
+        ) as response:
+            if response.status == 304 and "patterns" in last_patterns:
+                logger.info("Patterns not modified.")
+                return last_patterns["patterns"]
+            elif response.status == 200:
+                logger.info("Found fetch patterns.")
+                patterns = await response.json()
+                last_patterns.clear()
+                etag = response.headers.get("ETag")
+                if etag:
+                    last_patterns.update(etag=etag, patterns=patterns)
+                return patterns
+            else:
+                logger.error(f"Failed to fetch patterns. Status: {response.status}")
+                raise PatternFetchError(f"Unexpected status {response.status}")
+    except PatternFetchError:
+        raise
     except Exception as e:
         logger.error(f"Failed to fetch patterns: {e}")
-        return []
+        raise PatternFetchError(str(e)) from e
+
+
+# Process-wide cache of compiled patterns shared by all tasks
+pattern_cache = PatternCache(fetcher=fetch_patterns)
+
+# Process pool running the CPU-bound scans off the event loop
+scan_pool = ScanPool(on_timeout=pattern_cache.quarantine)
 
+# Results of recent scans, so that duplicated content is not scanned again
+scan_cache = ScanResultCache()
 
-async def send_detected_message(content: str, pattern_id: str):
+
+async def get_pattern_set():
+    """
+    Return the cached pattern set, timing the wait when it has to be refreshed.
+
+    Returns:
+        PatternSet: The current pattern set.
+    """
+    with STAGE_SECONDS.time(stage="pattern_fetch"):
+        return await pattern_cache.get()
+
+
+async def scan_content(pattern_set, content) -> dict:
+    """
+    Scan a text, reusing the result of a previous scan of the same content.
+
+    Args:
+        pattern_set (PatternSet): The pattern set to scan with.
+        content (str | bytes): The text, or the UTF-8 buffer, to scan.
+
+    Returns:
+        dict: Spans of the first matches keyed by pattern ID.
+    """
+    with STAGE_SECONDS.time(stage="scan"):
+        key = scan_cache.key(content, pattern_set.version)
+        matches = scan_cache.get(key)
+        if matches is not None:
+            logger.info("Reusing cached scan result.")
+            return dict(matches)
+        matches = await scan_pool.locate(pattern_set, content)
+        scan_cache.put(key, matches.items())
+        return matches
+
+
+async def send_detected_messages(detections: list):
     """
-    Send detected message to the backend API.
+    Send a batch of detected messages to the backend bulk API.
+
+    Content is sent by SHA-256 digest first: the backend is asked which
+    contents it does not have yet and only those are uploaded, once each, so
+    that a file matching several patterns or shared again is not sent again.
+
+    The backend saves all detected messages or none. When some are rejected as
+    invalid, e.g. because their pattern was deleted, only the others are sent
+    again.
+
+    Args:
+        detections (list): Payloads with ``content`` and ``pattern`` keys.
+
+    Returns:
+        list | None: The detections to send again, or None if there are none.
     """
-    payload = {"content": content, "pattern": pattern_id}
-    async with aiohttp.ClientSession() as session:
+    digests = [
+        hashlib.sha256(detection["content"].encode("utf-8")).hexdigest()
+        for detection in detections
+    ]
+    with STAGE_SECONDS.time(stage="backend_post"):
         try:
-            async with session.post(detected_messages_url, json=payload) as response:
+            session = http_session.get()
+            async with session.post(
+                content_blobs_missing_url,
+                json={"digests": list(dict.fromkeys(digests))},
+            ) as response:
+                response.raise_for_status()
+                missing = set((await response.json())["missing"])
+
+            payload = []
+            for detection, digest in zip(detections, digests):
+                item = {"content_digest": digest, "pattern": detection["pattern"]}
+                if digest in missing:
+                    # Later detections of the same content refer to it by digest
+                    item["content"] = detection["content"]
+                    missing.discard(digest)
+                payload.append(item)
+
+            async with session.post(
+                detected_messages_bulk_url, json=payload
+            ) as response:
+                if response.status == 400:
+                    errors = await response.json()
+                    logger.error(f"Detected messages rejected: {errors}")
+                    if isinstance(errors, list) and len(errors) == len(detections):
+                        # Detections whose content went with a rejected one are
+                        # sent again, with their content this time
+                        return [
+                            detection
+                            for detection, error in zip(detections, errors)
+                            if set(error) <= {"content_digest"}
+                        ]
+                    return None
                 response.raise_for_status()
         except aiohttp.ClientError as e:
-            logger.error(f"Failed to send detected message: {e}")
-            raise e
-        logger.info("Detected message sent successfully.")
+            logger.error(f"Failed to send detected messages: {e}")
+            return detections
+    logger.info(f"Sent {len(detections)} detected messages.")
+
+
+# Detected messages buffered across tasks and sent in bulk, so that reporting
+# does not hold up the Slack action; flushed by the manager on shutdown
+detection_buffer = BatchBuffer(
+    send_detected_messages,
+    max_size=DETECTION_BATCH_SIZE,
+    max_delay=DETECTION_BATCH_INTERVAL,
+    max_attempts=DETECTION_MAX_ATTEMPTS,
+    name="detected message",
+)
+
+
+async def report_detection(content: str, pattern_id: str):
+    """
+    Buffer a detected message for the next batch sent to the backend.
+
+    Args:
+        content (str): The content that matched.
+        pattern_id (str): The ID of the pattern that matched.
+    """
+    await detection_buffer.add({"content": content, "pattern": pattern_id})
 
 
 async def process_file(file_id: str, channel_id: str):
     """
     Process a file, detect patterns, and notify Slack if needed.
 
+    Files larger than ``SCAN_STREAM_THRESHOLD``, or of unknown size, are scanned
+    as a stream with bounded memory; for those only the window where the match
+    was found is reported as content. Smaller UTF-8 files are scanned as bytes and only the
+    bytes around each match are decoded for the report.
+
     Args:
         file_id (str): The ID of the Slack file to process.
         channel_id (str): The ID of the Slack channel.
     """
     try:
         # Fetch file info from Slack
-        file_info = await slack_client.files_info(file=file_id)
+        with STAGE_SECONDS.time(stage="file_info"):
+            file_info = await slack_dispatcher.call("files_info", file=file_id)
         file_url = file_info["file"]["url_private_download"]
 
         headers = {"Authorization": f"Bearer {os.getenv('SLACK_USER_TOKEN')}"}
-        async with aiohttp.ClientSession() as session:
-            async with session.get(file_url, headers=headers) as file_response:
-                if file_response.status == 200:
+        download_started = time.perf_counter()
+        async with http_session.get().get(file_url, headers=headers) as file_response:
+            if file_response.status == 200:
+                charset = file_response.charset
+                # The downloaded size, or the size Slack reported if the download
+                # is chunked. A file of unknown size is streamed.
+                file_size = file_response.content_length or file_info["file"].get(
+                    "size"
+                )
+                if file_size is None or file_size > SCAN_STREAM_THRESHOLD:
+                    logger.info(f"Streaming file content ({file_size} bytes)")
+
+                    # Scan the download chunk by chunk with bounded memory
+                    pattern_set = await get_pattern_set()
+                    with STAGE_SECONDS.time(stage="file_stream"):
+                        matches, file_content = await scan_response(
+                            file_response,
+                            pattern_set.engine,
+                            scanner=partial(scan_pool.locate, pattern_set),
+                        )
+                    reports = {pattern_id: file_content for pattern_id in matches}
+                elif (charset or "utf-8").lower() in BYTE_SCAN_CHARSETS:
+                    file_data = await file_response.read()
+                    STAGE_SECONDS.observe(
+                        time.perf_counter() - download_started,
+                        stage="file_download",
+                    )
+                    logger.info(f"Processing file content")
+
+                    # Scan the raw bytes and decode only around the matches
+                    pattern_set = await get_pattern_set()
+                    matches = await scan_content(pattern_set, file_data)
+                    reports = {
+                        pattern_id: decode_window(file_data, span, SCAN_REPORT_CONTEXT)
+                        for pattern_id, span in matches.items()
+                    }
+                else:
                     file_content = await file_response.text()
+                    STAGE_SECONDS.observe(
+                        time.perf_counter() - download_started,
+                        stage="file_download",
+                    )
                     logger.info(f"Processing file content")
 
-                    # Fetch patterns and scan the file
-                    patterns = await fetch_patterns()
-                    matches = [
-                        pattern
-                        for pattern in patterns
-                        if re.search(pattern["regex"], file_content)
-                    ]
-
-                    if matches:
-                        # Notify detected patterns
-                        for match in matches:
-                            await send_detected_message(
-                                content=file_content, pattern_id=match["id"]
-                            )
-                        logger.info(
-                            f"File processed with {len(matches)} matches found."
-                        )
+                    # Get the cached patterns and scan the file
+                    pattern_set = await get_pattern_set()
+                    matches = await scan_content(pattern_set, file_content)
+                    reports = {pattern_id: file_content for pattern_id in matches}
 
-                        # Delete file and notify channel
-                        await delete_file_and_notify(file_id, channel_id)
-                    else:
-                        logger.info("No matches found in the file.")
+                if matches:
+                    logger.info(f"File processed with {len(matches)} matches found.")
+
+                    # Delete file and notify channel
+                    await delete_file_and_notify(file_id, channel_id)
+
+                    # Report detected patterns
+                    for pattern_id, content in reports.items():
+                        await report_detection(content=content, pattern_id=pattern_id)
                 else:
-                    logger.error(f"Failed to download file: {file_response.status}")
+                    logger.info("No matches found in the file.")
+            else:
+                logger.error(f"Failed to download file: {file_response.status}")
     except SlackApiError as e:
         logger.error(f"Slack API error: {e.response['error']}")
 
@@ -118,20 +325,20 @@ async def process_message(
     if ts:
         logger.info(f"Message timestamp: {ts}")
 
-    # Fetch patterns from the API
-    patterns = await fetch_patterns()
-    matches = [pattern for pattern in patterns if re.search(pattern["regex"], message)]
+    # Get the cached patterns
+    pattern_set = await get_pattern_set()
+    matches = await scan_content(pattern_set, message)
 
     if matches:
-        # Notify detected patterns
-        for match in matches:
-            await send_detected_message(content=message, pattern_id=match["id"])
-
         logger.info(f"Message processed with {len(matches)} matches found.")
 
         # Replace the message in Slack
         if channel_id and ts:
             await replace_message(channel_id, ts, SLACK_BLOCKING_MESSAGE)
+
+        # Report detected patterns
+        for pattern_id in matches:
+            await report_detection(content=message, pattern_id=pattern_id)
     else:
         logger.info("No matches found in the message.")
 
@@ -149,11 +356,13 @@ async def replace_message(channel_id: str, ts: str, new_message: str):
         f"Attempting to replace message in channel {channel_id} at {ts}. Token: {SLACK_TOKEN}"
     )
     try:
-        response = await slack_client.chat_update(
-            channel=channel_id,
-            ts=ts,
-            text=new_message,
-        )
+        with STAGE_SECONDS.time(stage="slack"):
+            response = await slack_dispatcher.call(
+                "chat_update",
+                channel=channel_id,
+                ts=ts,
+                text=new_message,
+            )
         logger.info(f"Message replaced successfully. Response: {response}")
         return response
     except SlackApiError as e:
@@ -170,12 +379,15 @@ async def delete_file_and_notify(file_id: str, channel_id: str):
     """
     logger.info(f"Attempting to delete file {file_id} in channel {channel_id}.")
     try:
-        response = await slack_client.files_delete(file=file_id)
+        with STAGE_SECONDS.time(stage="slack"):
+            response = await slack_dispatcher.call("files_delete", file=file_id)
         if response.get("ok"):
-            notify_response = await slack_client.chat_postMessage(
-                channel=channel_id,
-                text=SLACK_BLOCKING_FILE,
-            )
+            with STAGE_SECONDS.time(stage="slack"):
+                notify_response = await slack_dispatcher.call(
+                    "chat_postMessage",
+                    channel=channel_id,
+                    text=SLACK_BLOCKING_FILE,
+                )
             if not notify_response.get("ok"):
                 logger.error(
                     f"Failed to send notification to channel {channel_id}: {notify_response.get('error')}"
@@ -0,0 +1,40 @@
+import pytest
+import pytest_asyncio
+
+from metrics import REGISTRY
+from tasks import (
+    detection_buffer,
+    http_session,
+    last_patterns,
+    pattern_cache,
+    scan_cache,
+    slack_dispatcher,
+)
+
+
+@pytest.fixture(autouse=True)
+def clear_pattern_cache():
+    """
+    Make every test start with empty pattern and scan result caches, fresh
+    Slack rate limits, no buffered detections and without recorded metrics.
+    """
+    pattern_cache.clear()
+    last_patterns.clear()
+    scan_cache.clear()
+    slack_dispatcher.clear()
+    detection_buffer.clear()
+    REGISTRY.clear()
+    yield
+    pattern_cache.clear()
+    last_patterns.clear()
+    scan_cache.clear()
+    detection_buffer.clear()
+
+
+@pytest_asyncio.fixture(autouse=True)
+async def close_http_session():
+    """
+    Close the shared HTTP session opened by a test on its event loop.
+    """
+    yield
+    await http_session.close()
@@ -0,0 +1,128 @@
+import asyncio
+
+import pytest
+
+from autoscaling import Autoscaler, QueueStats, SlotLimiter
+
+
+@pytest.mark.asyncio
+class TestSlotLimiter:
+    async def test_acquire_waits_for_release(self):
+        """
+        Test that acquiring beyond the limit waits until a slot is released.
+        """
+        slots = SlotLimiter(1)
+        await slots.acquire()
+
+        waiter = asyncio.create_task(slots.acquire())
+        await asyncio.sleep(0)
+        assert not waiter.done()
+
+        slots.release()
+        await asyncio.sleep(0)
+        assert waiter.done()
+        assert slots.in_use == 1
+
+    async def test_raising_limit_wakes_waiters(self):
+        """
+        Test that raising the limit lets waiting acquisitions through at once.
+        """
+        slots = SlotLimiter(1)
+        await slots.acquire()
+        waiters = [asyncio.create_task(slots.acquire()) for _ in range(2)]
+        await asyncio.sleep(0)
+
+        slots.set_limit(3)
+        await asyncio.sleep(0)
+
+        assert all(waiter.done() for waiter in waiters)
+        assert slots.in_use == 3
+
+    async def test_lowering_limit_keeps_holders(self):
+        """
+        Test that lowering the limit blocks new acquisitions until enough slots
+        have been released.
+        """
+        slots = SlotLimiter(3)
+        for _ in range(3):
+            await slots.acquire()
+
+        slots.set_limit(2)
+        assert slots.locked()
+        slots.release()
+        assert slots.locked()
+        slots.release()
+        assert not slots.locked()
+
+    async def test_cancelled_waiter_passes_wake_up(self):
+        """
+        Test that a waiter cancelled after being woken does not lose the slot.
+        """
+        slots = SlotLimiter(1)
+        await slots.acquire()
+        first = asyncio.create_task(slots.acquire())
+        second = asyncio.create_task(slots.acquire())
+        await asyncio.sleep(0)
+
+        slots.release()
+        first.cancel()
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)
+
+        assert first.cancelled()
+        assert second.done()
+
+
+class TestAutoscaler:
+    def slots(self, limit, in_use=0):
+        slots = SlotLimiter(limit)
+        slots.in_use = in_use
+        return slots
+
+    def test_backlog_doubles_slots_and_adds_pollers(self):
+        """
+        Test that a backlog larger than the slots doubles them and adds pollers.
+        """
+        autoscaler = Autoscaler(min_slots=4, max_slots=100, max_pollers=4)
+        stats = QueueStats(visible=500, not_visible=20, oldest_age=5)
+
+        assert autoscaler.decide(stats, self.slots(20, in_use=20)) == (40, 4)
+
+    def test_old_messages_scale_up(self):
+        """
+        Test that a few messages waiting longer than the target age scale up.
+        """
+        autoscaler = Autoscaler(min_slots=4, max_slots=100, target_age=30)
+        stats = QueueStats(visible=3, not_visible=20, oldest_age=45)
+
+        assert autoscaler.decide(stats, self.slots(20, in_use=20)) == (40, 4)
+
+    def test_bounds(self):
+        """
+        Test that the slots and pollers stay within the configured bounds.
+        """
+        autoscaler = Autoscaler(min_slots=4, max_slots=30, max_pollers=2)
+        backlog = QueueStats(visible=500, not_visible=0, oldest_age=100)
+        idle = QueueStats(visible=0, not_visible=0, oldest_age=0)
+
+        assert autoscaler.decide(backlog, self.slots(20)) == (30, 2)
+        assert autoscaler.decide(idle, self.slots(5)) == (4, 1)
+
+    def test_idle_queue_shrinks_slots(self):
+        """
+        Test that an empty queue with mostly idle slots shrinks them gradually and
+        keeps a single poller.
+        """
+        autoscaler = Autoscaler(min_slots=4, max_slots=100, min_pollers=1)
+        idle = QueueStats(visible=0, not_visible=2, oldest_age=0)
+
+        assert autoscaler.decide(idle, self.slots(40, in_use=2)) == (30, 1)
+
+    def test_busy_slots_are_kept(self):
+        """
+        Test that slots are not shrunk while most of them are busy.
+        """
+        autoscaler = Autoscaler(min_slots=4, max_slots=100)
+        stats = QueueStats(visible=0, not_visible=30, oldest_age=0)
+
+        assert autoscaler.decide(stats, self.slots(40, in_use=30))[0] == 40
@@ -0,0 +1,79 @@
+import asyncio
+from unittest.mock import AsyncMock
+
+import pytest
+
+from batching import BatchBuffer
+
+
+@pytest.mark.asyncio
+class TestBatchBuffer:
+    async def test_flush_on_size(self):
+        """
+        Test that a full batch is flushed immediately.
+        """
+        flush = AsyncMock(return_value=None)
+        buffer = BatchBuffer(flush, max_size=3, max_delay=60)
+
+        for item in range(4):
+            await buffer.add(item)
+
+        flush.assert_called_once_with([0, 1, 2])
+        assert len(buffer) == 1
+        await buffer.close()
+
+    async def test_flush_on_time(self):
+        """
+        Test that a partial batch is flushed once the delay has passed.
+        """
+        flush = AsyncMock(return_value=None)
+        buffer = BatchBuffer(flush, max_size=10, max_delay=0.01)
+
+        await buffer.add("a")
+        await buffer.add("b")
+        flush.assert_not_called()
+        await asyncio.sleep(0.05)
+
+        flush.assert_called_once_with(["a", "b"])
+        assert len(buffer) == 0
+
+    async def test_failed_items_are_retried(self):
+        """
+        Test that the items returned by the flush callback are flushed again.
+        """
+        flush = AsyncMock(side_effect=[["b"], None])
+        buffer = BatchBuffer(flush, max_size=10, max_delay=60)
+
+        await buffer.add("a")
+        await buffer.add("b")
+        await buffer.close()
+
+        assert flush.call_args_list[0].args == (["a", "b"],)
+        assert flush.call_args_list[1].args == (["b"],)
+
+    async def test_items_are_dropped_after_max_attempts(self):
+        """
+        Test that an item failing every time is dropped after ``max_attempts``.
+        """
+        flush = AsyncMock(side_effect=Exception("unavailable"))
+        buffer = BatchBuffer(flush, max_size=10, max_delay=60, max_attempts=3)
+
+        await buffer.add("a")
+        await buffer.close()
+
+        assert flush.call_count == 3
+        assert len(buffer) == 0
+
+    async def test_clear(self):
+        """
+        Test that cleared items are never flushed.
+        """
+        flush = AsyncMock(return_value=None)
+        buffer = BatchBuffer(flush, max_size=10, max_delay=0.01)
+
+        await buffer.add("a")
+        buffer.clear()
+        await asyncio.sleep(0.05)
+        await buffer.close()
+
+        flush.assert_not_called()
@@ -0,0 +1,310 @@
+import random
+import re
+from unittest.mock import patch
+
+import pytest
+
+from engine import (
+    ScanEngine,
+    bytes_pattern,
+    decode_window,
+    is_byte_exact,
+    is_combinable,
+    required_atoms,
+)
+from patterns import compile_patterns
+
+FIXTURE_PATTERNS = [
+    {
+        "id": "phone-2",
+        "name": "Phone Number 2",
+        "regex": r"\+?\d{1,3}[-.\s]?\(?\d{1,4}\)?[-.\s]?\d{1,4}[-.\s]?\d{1,9}",
+    },
+    {
+        "id": "phone",
+        "name": "Phone Number",
+        "regex": r"\b\+?[1-9]\d{0,2}[-.\s]?\(?\d{2,3}\)?[-.\s]\d{3}[-.\s]\d{4}\b",
+    },
+    {
+        "id": "credit-card",
+        "name": "Credit Card",
+        "regex": r"\b\d{4}-\d{4}-\d{4}-\d{4}\b",
+    },
+    {
+        "id": "email",
+        "name": "Email Address",
+        "regex": r"\b[a-zA-Z0-9_.+-]+@[a-zA-Z0-9-]+\.[a-zA-Z0-9-.]+\b",
+    },
+]
+
+SAMPLE_TEXTS = [
+    "",
+    "hello there, no secrets here",
+    "card 1234-5678-9012-3456 please",
+    "mail me at john.doe@example.com",
+    "call +1 (555) 123-4567 now",
+    "12",
+    "1234-5678-9012-3456 and a@b.co",
+]
+
+
+def reference_scan(raw_patterns, text):
+    """
+    The original per-pattern scan the engine has to agree with.
+    """
+    return [p["id"] for p in raw_patterns if re.search(p["regex"], text)]
+
+
+def engine_for(raw_patterns):
+    return compile_patterns(raw_patterns).engine
+
+
+class TestIsCombinable:
+    @pytest.mark.parametrize(
+        "regex",
+        [r"\d+", r"(a|b)c", r"(?i:abc)", r"\b[a-z]+@[a-z]+\b", r"a(?=b)"],
+    )
+    def test_combinable(self, regex):
+        """
+        Test that plain regexes are embedded in the combined matcher.
+        """
+        assert is_combinable(re.compile(regex))
+
+    @pytest.mark.parametrize(
+        "regex",
+        [r"(a)\1", r"(?P<x>a)b", r"(?i)abc", r"(a)?(?(1)b|c)"],
+    )
+    def test_not_combinable(self, regex):
+        """
+        Test that regexes depending on group numbering or global flags fall back.
+        """
+        assert not is_combinable(re.compile(regex))
+
+
+class TestRequiredAtoms:
+    def test_email_needs_at_sign(self):
+        """
+        Test that the email fixture requires an "@" literal.
+        """
+        atoms = required_atoms(re.compile(FIXTURE_PATTERNS[3]["regex"]))
+
+        assert "@" in atoms
+
+    def test_credit_card_needs_digits_and_dash(self):
+        """
+        Test that the credit card fixture requires digits and a dash.
+        """
+        atoms = required_atoms(re.compile(FIXTURE_PATTERNS[2]["regex"]))
+
+        assert atoms == ("-", re.compile(r"[\d]"))
+
+    def test_literal_runs(self):
+        """
+        Test that consecutive literals are merged into a single substring check.
+        """
+        assert required_atoms(re.compile(r"token=\w+")) == (
+            "token=",
+            re.compile(r"[\w]"),
+        )
+
+    def test_ignorecase_literals(self):
+        """
+        Test that case-insensitive literals are checked with a case-insensitive regex.
+        """
+        assert required_atoms(re.compile(r"(?i)secret")) == (
+            re.compile("secret", re.IGNORECASE),
+        )
+
+    @pytest.mark.parametrize("regex", [r"ab|cd", r"x?", r"\d*", r"[^a]", r"(?i:ab)"])
+    def test_nothing_required(self, regex):
+        """
+        Test that optional or alternative parts never become requirements.
+        """
+        assert required_atoms(re.compile(regex)) == ()
+
+
+class TestScanEngine:
+    @pytest.mark.parametrize("text", SAMPLE_TEXTS)
+    def test_matches_reference_scan(self, text):
+        """
+        Test that the engine reports the same patterns as one re.search per pattern.
+        """
+        engine = engine_for(FIXTURE_PATTERNS)
+
+        assert engine.scan(text) == reference_scan(FIXTURE_PATTERNS, text)
+
+    @patch("engine.DETECTOR_MIN_PATTERNS", 1)
+    def test_finds_shadowed_patterns(self):
+        """
+        Test that a pattern is found even if an earlier branch matches at the same spot.
+        """
+        raw_patterns = [
+            {"id": "digits", "regex": r"\d+"},
+            {"id": "card", "regex": r"\d{4}-\d{4}"},
+        ]
+
+        assert engine_for(raw_patterns).scan("x 1234-5678 y") == ["digits", "card"]
+
+    def test_fallback_patterns(self):
+        """
+        Test that non-combinable patterns are still scanned.
+        """
+        raw_patterns = [
+            {"id": "repeat", "regex": r"(\w)\1\1"},
+            {"id": "upper", "regex": r"(?i)secret"},
+            {"id": "digits", "regex": r"\d"},
+        ]
+
+        assert engine_for(raw_patterns).scan("SECRET aaa") == ["repeat", "upper"]
+
+    def test_inner_groups(self):
+        """
+        Test that capturing groups inside a pattern do not confuse the reporting.
+        """
+        raw_patterns = [
+            {"id": "groups", "regex": r"(a)(b)?"},
+            {"id": "digits", "regex": r"(\d)(\d)"},
+        ]
+
+        assert engine_for(raw_patterns).scan("12 a") == ["groups", "digits"]
+
+    def test_prefilter_skips_chat_messages(self):
+        """
+        Test that messages without digits or "@" leave no fixture pattern to run.
+        """
+        engine = engine_for(FIXTURE_PATTERNS)
+
+        assert engine.candidates("see you at the standup, thanks!") == frozenset()
+        assert engine.candidates("mail a@b.co") == frozenset({3})
+
+    def test_empty_engine(self):
+        """
+        Test that an engine without patterns never matches.
+        """
+        assert ScanEngine(()).scan("anything") == []
+
+    def test_many_patterns(self):
+        """
+        Test that hundreds of patterns agree with the reference scan.
+        """
+        rng = random.Random(42)
+        raw_patterns = FIXTURE_PATTERNS + [
+            {"id": f"word-{i}", "regex": rf"\bword{i}\b"} for i in range(300)
+        ]
+        engine = engine_for(raw_patterns)
+        words = ["word%d" % rng.randrange(250, 2000) for _ in range(2000)]
+        text = " ".join(words) + " 1234-5678-9012-3456"
+
+        assert engine.scan(text) == reference_scan(raw_patterns, text)
+
+
+class TestBytesScan:
+    UNICODE_TEXTS = [
+        "café 1234-5678-9012-3456",
+        "correo josé@example.com",
+        "tarjeta ١٢٣٤-١٢٣٤-١٢٣٤-١٢٣٤",
+        "naïve text without secrets",
+        "sep\x1carated 12",
+    ]
+
+    @pytest.mark.parametrize("regex", [r"[0-9]{4}-[0-9]{4}", r"^abc$", r"(?<=x)y|z+"])
+    def test_byte_exact(self, regex):
+        """
+        Test that ASCII-only patterns without Unicode semantics are byte-exact.
+        """
+        assert is_byte_exact(bytes_pattern(re.compile(regex)))
+
+    @pytest.mark.parametrize(
+        "regex", [r"\d+", r"a.b", r"[^a]", r"\bword", r"(?i)secret", r"\xe9"]
+    )
+    def test_not_byte_exact(self, regex):
+        """
+        Test that patterns depending on what a character is are not byte-exact.
+        """
+        assert not is_byte_exact(bytes_pattern(re.compile(regex)))
+
+    def test_non_ascii_pattern_has_no_bytes_version(self):
+        """
+        Test that patterns written with non-ASCII characters stay ``str`` only.
+        """
+        assert bytes_pattern(re.compile("josé")) is None
+
+    @pytest.mark.parametrize("text", SAMPLE_TEXTS + UNICODE_TEXTS)
+    def test_matches_reference_scan(self, text):
+        """
+        Test that scanning the UTF-8 bytes agrees with scanning the decoded text.
+        """
+        raw_patterns = FIXTURE_PATTERNS + [
+            {"id": "exact-card", "regex": r"[0-9]{4}-[0-9]{4}"},
+            {"id": "word", "regex": r"\w+é"},
+            {"id": "space", "regex": r"p\sa"},
+        ]
+        engine = engine_for(raw_patterns)
+
+        assert engine.scan(text.encode("utf-8")) == reference_scan(raw_patterns, text)
+
+    def test_spans_are_byte_offsets(self):
+        """
+        Test that spans found in a non-ASCII buffer are byte offsets, whichever
+        version of the pattern found them.
+        """
+        engine = engine_for(
+            [
+                {"id": "exact", "regex": r"[0-9]{2}"},
+                {"id": "unicode", "regex": r"\w+é"},
+            ]
+        )
+        data = "ñ 42 josé".encode("utf-8")
+
+        spans, _ = engine.locate_within(data)
+
+        assert data[slice(*spans["exact"])] == b"42"
+        assert data[slice(*spans["unicode"])] == "josé".encode("utf-8")
+
+    def test_decode_window(self):
+        """
+        Test that a report window never cuts a multi-byte character in half.
+        """
+        data = "ééé 42 ééé".encode("utf-8")
+        start = data.index(b"42")
+
+        assert decode_window(data, (start, start + 2), 2) == "é 42 é"
+        assert decode_window(data, (start, start + 2), 100) == "ééé 42 ééé"
+
+
+class TestScanWithin:
+    SLOW = {"id": "slow", "regex": r"^(a+)+$"}
+    TEXT = "a" * 40 + "! 1234-5678-9012-3456"
+
+    def test_aborts_slow_pattern(self):
+        """
+        Test that a catastrophically backtracking pattern is aborted and reported.
+        """
+        engine = engine_for([self.SLOW, FIXTURE_PATTERNS[2]])
+
+        matches, timed_out = engine.scan_within(self.TEXT, budget=0.1)
+
+        assert matches == ["credit-card"]
+        assert timed_out == ["slow"]
+
+    def test_detector_timeout_isolates_slow_pattern(self):
+        """
+        Test that a detector timeout falls back to per-pattern budgets.
+        """
+        engine = engine_for([self.SLOW] + FIXTURE_PATTERNS)
+
+        matches, timed_out = engine.scan_within(self.TEXT, budget=0.1)
+
+        assert matches == reference_scan(FIXTURE_PATTERNS, self.TEXT)
+        assert timed_out == ["slow"]
+
+    def test_without_budget(self):
+        """
+        Test that scan_within without a budget behaves like scan.
+        """
+        engine = engine_for(FIXTURE_PATTERNS)
+
+        assert engine.scan_within(SAMPLE_TEXTS[-1]) == (
+            engine.scan(SAMPLE_TEXTS[-1]),
+            [],
+        )
@@ -1,7 +1,20 @@
+import asyncio
+import json
+import time
+
 import pytest
 from unittest.mock import AsyncMock, patch
-from manager import SQSManager
-from constants import AWS_SQS_QUEUE_URL
+from botocore.exceptions import EndpointConnectionError
+from autoscaling import Autoscaler, QueueStats
+from manager import LaneManager, SQSManager
+from metrics import (
+    MESSAGE_LAG_SECONDS,
+    QUEUE_OPERATION_ERRORS,
+    QUEUE_OPERATION_SECONDS,
+    TASK_SECONDS,
+    TASKS,
+)
+from constants import AWS_SQS_QUEUE_URL, SQS_VISIBILITY_TIMEOUT
 
 
 @pytest.mark.asyncio
@@ -25,6 +38,7 @@ class TestSQSManager:
         ]
         mock_client.receive_message.assert_called_once_with(
             QueueUrl=AWS_SQS_QUEUE_URL,
+            AttributeNames=["SentTimestamp"],
             MaxNumberOfMessages=10,
             WaitTimeSeconds=10,
         )
@@ -32,16 +46,501 @@ class TestSQSManager:
     @patch("aiobotocore.session.AioSession.create_client")
     async def test_delete_message(self, mock_create_client):
         """
-        Test that _delete_message deletes a message from the SQS queue.
+        Test that _delete_message deletes a message from the SQS queue in a batch.
         """
         mock_client = AsyncMock()
         mock_create_client.return_value.__aenter__.return_value = mock_client
+        mock_client.delete_message_batch.return_value = {"Successful": [{"Id": "0"}]}
 
         receipt_handle = "abc123"
         manager = SQSManager()
         await manager._delete_message(receipt_handle)
 
-        mock_client.delete_message.assert_called_once_with(
+        # Verify that nothing is sent until the batch is flushed
+        mock_client.delete_message_batch.assert_not_called()
+        await manager._acks.flush()
+
+        mock_client.delete_message_batch.assert_called_once_with(
+            QueueUrl=AWS_SQS_QUEUE_URL,
+            Entries=[{"Id": "0", "ReceiptHandle": receipt_handle}],
+        )
+
+    @patch("aiobotocore.session.AioSession.create_client")
+    async def test_delete_messages_in_batches_of_ten(self, mock_create_client):
+        """
+        Test that ten acknowledgements are flushed together without waiting.
+        """
+        mock_client = AsyncMock()
+        mock_create_client.return_value.__aenter__.return_value = mock_client
+        mock_client.delete_message_batch.return_value = {}
+
+        manager = SQSManager()
+        for index in range(10):
+            await manager._delete_message(f"handle-{index}")
+
+        mock_client.delete_message_batch.assert_called_once()
+        entries = mock_client.delete_message_batch.call_args.kwargs["Entries"]
+        assert [entry["ReceiptHandle"] for entry in entries] == [
+            f"handle-{index}" for index in range(10)
+        ]
+        assert len(manager._acks) == 0
+
+    @patch("aiobotocore.session.AioSession.create_client")
+    async def test_delete_messages_retries_failed_entries(self, mock_create_client):
+        """
+        Test that entries failing on the server side are retried, while sender
+        faults are not.
+        """
+        mock_client = AsyncMock()
+        mock_create_client.return_value.__aenter__.return_value = mock_client
+        mock_client.delete_message_batch.return_value = {
+            "Successful": [{"Id": "0"}],
+            "Failed": [
+                {"Id": "1", "SenderFault": False, "Code": "InternalError"},
+                {"Id": "2", "SenderFault": True, "Code": "ReceiptHandleIsInvalid"},
+            ],
+        }
+
+        manager = SQSManager()
+        retry = await manager._delete_messages(["a", "b", "c"])
+
+        assert retry == ["b"]
+
+    @patch("aiobotocore.session.AioSession.create_client")
+    async def test_queue_stats(self, mock_create_client):
+        """
+        Test that the queue depth is read from the queue attributes and the age
+        of the oldest message from the messages received since the last call.
+        """
+        mock_client = AsyncMock()
+        mock_create_client.return_value.__aenter__.return_value = mock_client
+        mock_client.get_queue_attributes.return_value = {
+            "Attributes": {
+                "ApproximateNumberOfMessages": "42",
+                "ApproximateNumberOfMessagesNotVisible": "7",
+            }
+        }
+
+        manager = SQSManager()
+        manager._oldest_age = 12.5
+        stats = await manager._queue_stats()
+
+        assert stats == QueueStats(visible=42, not_visible=7, oldest_age=12.5)
+        assert manager._oldest_age == 0.0
+
+    @patch("aiobotocore.session.AioSession.create_client")
+    async def test_client_is_reused(self, mock_create_client):
+        """
+        Test that all queue operations share a single SQS client.
+        """
+        mock_client = AsyncMock()
+        mock_create_client.return_value.__aenter__.return_value = mock_client
+        mock_client.receive_message.return_value = {}
+        mock_client.delete_message_batch.return_value = {}
+
+        manager = SQSManager()
+        await manager._get_messages()
+        await manager._delete_messages(["abc123"])
+        await manager._delete_messages(["def456"])
+
+        mock_create_client.assert_called_once()
+        assert mock_client.delete_message_batch.call_count == 2
+
+    @patch("aiobotocore.session.AioSession.create_client")
+    async def test_client_recreated_on_connection_error(self, mock_create_client):
+        """
+        Test that a connection error closes the client and retries with a new one.
+        """
+        broken_client = AsyncMock()
+        broken_client.receive_message.side_effect = EndpointConnectionError(
+            endpoint_url="http://sqs:9324"
+        )
+        new_client = AsyncMock()
+        new_client.receive_message.return_value = {"Messages": [{"Body": "{}"}]}
+        mock_create_client.return_value.__aenter__.side_effect = [
+            broken_client,
+            new_client,
+        ]
+
+        manager = SQSManager()
+        messages = await manager._get_messages()
+
+        assert messages == [{"Body": "{}"}]
+        assert mock_create_client.call_count == 2
+        mock_create_client.return_value.__aexit__.assert_called_once_with(
+            None, None, None
+        )
+
+    @patch("aiobotocore.session.AioSession.create_client")
+    async def test_close(self, mock_create_client):
+        """
+        Test that close releases the client and the next call creates a new one.
+        """
+        mock_client = AsyncMock()
+        mock_create_client.return_value.__aenter__.return_value = mock_client
+        mock_client.receive_message.return_value = {}
+
+        manager = SQSManager()
+        await manager._get_messages()
+        await manager.close()
+        await manager.close()
+
+        mock_create_client.return_value.__aexit__.assert_called_once()
+        assert manager.transport._client is None
+
+    @patch("manager.process_message")
+    async def test_process_message_records_metrics(self, mock_process_message):
+        """
+        Test that a processed message is counted and its end-to-end lag is
+        observed from its SentTimestamp.
+        """
+        manager = SQSManager(name="messages")
+        manager._delete_message = AsyncMock()
+        sent = int((time.time() - 3) * 1000)
+
+        await manager._process_message(
+            {
+                "Body": json.dumps({"task": "process_message", "kwargs": {}}),
+                "ReceiptHandle": "abc123",
+                "Attributes": {"SentTimestamp": str(sent)},
+            }
+        )
+
+        assert TASKS.value(task="process_message", outcome="success") == 1
+        assert TASK_SECONDS.count(task="process_message") == 1
+        lag_buckets = MESSAGE_LAG_SECONDS.render()
+        assert 'dlp_message_lag_seconds_bucket{queue="messages",le="2.5"} 0' in (
+            lag_buckets
+        )
+        assert 'dlp_message_lag_seconds_bucket{queue="messages",le="5.0"} 1' in (
+            lag_buckets
+        )
+
+    @pytest.mark.parametrize("body", ["{not json", "[]", '{"kwargs": []}'])
+    async def test_invalid_message_is_dropped(self, body):
+        """
+        Test that a message whose body cannot be parsed is counted and deleted
+        instead of being redelivered forever.
+        """
+        manager = SQSManager(name="messages")
+        manager._delete_message = AsyncMock()
+
+        await manager._process_message({"Body": body, "ReceiptHandle": "abc123"})
+
+        assert TASKS.value(task="unknown", outcome="invalid") == 1
+        manager._delete_message.assert_awaited_once_with("abc123")
+
+    async def test_failed_queue_operation_is_counted(self):
+        """
+        Test that queue operations are timed and their errors counted.
+        """
+        transport = AsyncMock()
+        transport.receive.side_effect = RuntimeError("boom")
+        manager = SQSManager(transport=transport, name="files")
+
+        with pytest.raises(RuntimeError):
+            await manager._get_messages()
+
+        assert QUEUE_OPERATION_SECONDS.count(queue="files", operation="receive") == 1
+        assert QUEUE_OPERATION_ERRORS.value(queue="files", operation="receive") == 1
+
+
+@pytest.mark.asyncio
+class TestConsumerPipeline:
+    @staticmethod
+    def receiver(*batches):
+        """
+        Build a _get_messages replacement returning messages named after
+        ``batches`` and then long-polling forever.
+        """
+        calls = []
+
+        async def get_messages(max_messages=10):
+            calls.append(max_messages)
+            if len(calls) <= len(batches):
+                return [
+                    {"Body": name, "ReceiptHandle": f"handle-{name}"}
+                    for name in batches[len(calls) - 1]
+                ]
+            await asyncio.Event().wait()
+
+        return get_messages, calls
+
+    async def test_slow_message_does_not_block_polling(self):
+        """
+        Test that a slow message holds only its own slot while the next
+        messages are received and processed.
+        """
+        release_slow = asyncio.Event()
+        processed = []
+
+        async def process_message(message):
+            if message["Body"] == "slow":
+                await release_slow.wait()
+            processed.append(message["Body"])
+
+        manager = SQSManager(concurrency=2)
+        manager._get_messages, calls = self.receiver(["slow"], ["fast"])
+        manager._process_message = process_message
+        manager.close = AsyncMock()
+
+        main = asyncio.create_task(manager.main())
+        await asyncio.sleep(0.01)
+
+        assert processed == ["fast"]
+        assert calls == [2, 1, 1]
+
+        release_slow.set()
+        main.cancel()
+        await main
+        assert processed == ["fast", "slow"]
+
+    async def test_no_polling_while_all_slots_are_busy(self):
+        """
+        Test that polling stops while every slot is busy and resumes as soon as
+        one frees up.
+        """
+        release = asyncio.Event()
+
+        async def process_message(message):
+            await release.wait()
+
+        manager = SQSManager(concurrency=1)
+        manager._get_messages, calls = self.receiver(["first"])
+        manager._process_message = process_message
+        manager.close = AsyncMock()
+
+        main = asyncio.create_task(manager.main())
+        await asyncio.sleep(0.01)
+        assert calls == [1]
+
+        release.set()
+        await asyncio.sleep(0.01)
+        assert calls == [1, 1]
+
+        main.cancel()
+        await main
+
+    async def test_worker_survives_failed_message(self):
+        """
+        Test that a message raising out of _process_message frees its slot and
+        the worker goes on with the next message.
+        """
+        processed = []
+
+        async def process_message(message):
+            if message["Body"] == "bad":
+                raise RuntimeError("boom")
+            processed.append(message["Body"])
+
+        manager = SQSManager(concurrency=1)
+        manager._get_messages, calls = self.receiver(["bad"], ["good"])
+        manager._process_message = process_message
+        manager.close = AsyncMock()
+
+        main = asyncio.create_task(manager.main())
+        await asyncio.sleep(0.01)
+
+        assert processed == ["good"]
+        assert calls == [1, 1, 1]
+
+        main.cancel()
+        await main
+
+    async def test_shutdown_waits_for_messages_in_flight(self):
+        """
+        Test that cancelling the manager lets received messages finish before
+        the client is closed.
+        """
+        processed = []
+
+        async def process_message(message):
+            await asyncio.sleep(0.01)
+            processed.append(message["Body"])
+
+        manager = SQSManager(concurrency=3)
+        manager._get_messages, _ = self.receiver(["a", "b", "c"])
+        manager._process_message = process_message
+        manager.close = AsyncMock()
+
+        main = asyncio.create_task(manager.main())
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)
+        main.cancel()
+        await main
+
+        assert sorted(processed) == ["a", "b", "c"]
+        manager.close.assert_called_once()
+
+    @patch("manager.SQS_HEARTBEAT_INTERVAL", 0.02)
+    async def test_heartbeat_extends_long_running_messages(self):
+        """
+        Test that messages in flight get their visibility extended in batches
+        until they are done, and short ones are left alone.
+        """
+        release = asyncio.Event()
+
+        async def process_message(message):
+            if message["Body"] == "long":
+                await release.wait()
+
+        manager = SQSManager(concurrency=2)
+        manager._get_messages, _ = self.receiver(["long", "short"])
+        manager._process_message = process_message
+        manager._extend_visibility = AsyncMock()
+        manager.close = AsyncMock()
+
+        main = asyncio.create_task(manager.main())
+        await asyncio.sleep(0.1)
+
+        extended = manager._extend_visibility.call_args_list
+        assert len(extended) >= 2
+        assert all(call.args == (["handle-long"],) for call in extended)
+
+        release.set()
+        await asyncio.sleep(0.01)
+        assert manager._in_flight == {}
+        calls_after_release = manager._extend_visibility.call_count
+        await asyncio.sleep(0.05)
+        assert manager._extend_visibility.call_count == calls_after_release
+
+        main.cancel()
+        await main
+
+    @patch("aiobotocore.session.AioSession.create_client")
+    async def test_extend_visibility(self, mock_create_client):
+        """
+        Test that visibility is extended with one batch call and rejected receipt
+        handles stop being tracked.
+        """
+        mock_client = AsyncMock()
+        mock_create_client.return_value.__aenter__.return_value = mock_client
+        mock_client.change_message_visibility_batch.return_value = {
+            "Failed": [{"Id": "1", "SenderFault": True, "Code": "MessageNotInflight"}]
+        }
+
+        manager = SQSManager()
+        manager._in_flight = {"a": 0.0, "b": 0.0}
+        await manager._extend_visibility(["a", "b"])
+
+        mock_client.change_message_visibility_batch.assert_called_once_with(
             QueueUrl=AWS_SQS_QUEUE_URL,
-            ReceiptHandle=receipt_handle,
+            Entries=[
+                {
+                    "Id": "0",
+                    "ReceiptHandle": "a",
+                    "VisibilityTimeout": SQS_VISIBILITY_TIMEOUT,
+                },
+                {
+                    "Id": "1",
+                    "ReceiptHandle": "b",
+                    "VisibilityTimeout": SQS_VISIBILITY_TIMEOUT,
+                },
+            ],
+        )
+        assert list(manager._in_flight) == ["a"]
+
+    async def test_scaling_up_activates_pollers(self):
+        """
+        Test that pollers beyond the current count idle until they are scaled up.
+        """
+        manager = SQSManager(
+            concurrency=10,
+            pollers=1,
+            autoscaler=Autoscaler(min_slots=10, max_slots=40, max_pollers=4),
+        )
+        manager._get_messages, calls = self.receiver()
+        manager.close = AsyncMock()
+
+        main = asyncio.create_task(manager.main())
+        await asyncio.sleep(0.01)
+        assert calls == [10]
+
+        await manager._scale(40, 4)
+        await asyncio.sleep(0.01)
+        assert calls == [10, 10, 10, 10]
+        assert manager._slots.limit == 40
+
+        main.cancel()
+        await main
+
+
+@pytest.mark.asyncio
+class TestLaneManager:
+    LANES = [
+        {"name": "messages", "queue_url": "http://sqs/messages", "weight": 3},
+        {"name": "files", "queue_url": "http://sqs/files", "weight": 1},
+    ]
+
+    async def test_concurrency_is_shared_by_weight(self):
+        """
+        Test that every lane consumes its own queue with its weighted share of
+        the slots, through a single transport.
+        """
+        lanes = LaneManager(lanes=self.LANES, concurrency=20)
+
+        messages, files = lanes.managers
+        assert (messages.queue_url, messages._slots.limit) == (
+            "http://sqs/messages",
+            15,
         )
+        assert (files.queue_url, files._slots.limit) == ("http://sqs/files", 5)
+        assert messages.transport is files.transport is lanes.transport
+
+    async def test_lane_autoscalers(self):
+        """
+        Test that each lane gets an autoscaler built from its weight share.
+        """
+        shares = []
+
+        def autoscaler_factory(share):
+            shares.append(share)
+            return Autoscaler(min_slots=1, max_slots=round(40 * share))
+
+        lanes = LaneManager(
+            lanes=self.LANES, concurrency=20, autoscaler_factory=autoscaler_factory
+        )
+
+        assert shares == [0.75, 0.25]
+        assert [manager.max_concurrency for manager in lanes.managers] == [30, 10]
+
+    @patch("transports.SQSTransport.close")
+    async def test_slow_file_does_not_delay_messages(self, mock_close):
+        """
+        Test that messages keep flowing while every file slot is busy, and that
+        cancelling drains all lanes before closing the shared transport,
+        flushing the detected messages and closing the HTTP session.
+        """
+        release_file = asyncio.Event()
+        processed = []
+
+        async def process_file(message):
+            await release_file.wait()
+            processed.append(message["Body"])
+
+        async def process_message(message):
+            processed.append(message["Body"])
+
+        session, detections = AsyncMock(), AsyncMock()
+        lanes = LaneManager(
+            lanes=self.LANES, concurrency=4, session=session, detections=detections
+        )
+        messages, files = lanes.managers
+        files._get_messages, _ = TestConsumerPipeline.receiver(["file"])
+        files._process_message = process_file
+        messages._get_messages, _ = TestConsumerPipeline.receiver(["m1"], ["m2"])
+        messages._process_message = process_message
+
+        main = asyncio.create_task(lanes.main())
+        await asyncio.sleep(0.01)
+        assert processed == ["m1", "m2"]
+
+        main.cancel()
+        await asyncio.sleep(0.01)
+        release_file.set()
+        await main
+
+        assert processed == ["m1", "m2", "file"]
+        mock_close.assert_awaited_once()
+        detections.close.assert_awaited_once()
+        session.close.assert_awaited_once()
@@ -0,0 +1,100 @@
+import aiohttp
+import pytest
+
+from metrics import Counter, Histogram, MetricsServer, Registry
+
+
+class TestCounter:
+    def test_render(self):
+        """
+        Test that a counter renders one sample per label combination.
+        """
+        counter = Counter("dlp_tasks", "Tasks processed.", ("task", "outcome"))
+        counter.inc(task="process_message", outcome="success")
+        counter.inc(2, task="process_message", outcome="success")
+        counter.inc(task="process_file", outcome="failure")
+
+        assert counter.render() == [
+            "# HELP dlp_tasks Tasks processed.",
+            "# TYPE dlp_tasks counter",
+            'dlp_tasks_total{task="process_file",outcome="failure"} 1.0',
+            'dlp_tasks_total{task="process_message",outcome="success"} 3.0',
+        ]
+
+    def test_labels_are_checked(self):
+        """
+        Test that samples must have exactly the label names of the metric.
+        """
+        counter = Counter("dlp_tasks", "Tasks processed.", ("task",))
+
+        with pytest.raises(ValueError):
+            counter.inc(stage="scan")
+
+    def test_label_values_are_escaped(self):
+        """
+        Test that quotes, backslashes and newlines in label values are escaped.
+        """
+        counter = Counter("dlp_tasks", "Tasks processed.", ("task",))
+        counter.inc(task='a"b\\c\nd')
+
+        assert counter.render()[-1] == r'dlp_tasks_total{task="a\"b\\c\nd"} 1.0'
+
+
+class TestHistogram:
+    def test_render_cumulative_buckets(self):
+        """
+        Test that a histogram renders cumulative buckets, sum and count.
+        """
+        histogram = Histogram(
+            "dlp_stage_seconds", "Stage time.", ("stage",), buckets=(0.1, 1.0)
+        )
+        histogram.observe(0.05, stage="scan")
+        histogram.observe(0.1, stage="scan")
+        histogram.observe(5, stage="scan")
+
+        assert histogram.render()[2:] == [
+            'dlp_stage_seconds_bucket{stage="scan",le="0.1"} 2',
+            'dlp_stage_seconds_bucket{stage="scan",le="1.0"} 2',
+            'dlp_stage_seconds_bucket{stage="scan",le="+Inf"} 3',
+            'dlp_stage_seconds_sum{stage="scan"} 5.15',
+            'dlp_stage_seconds_count{stage="scan"} 3',
+        ]
+        assert histogram.count(stage="scan") == 3
+
+    def test_time_observes_failures(self):
+        """
+        Test that a timed block is observed even when it raises.
+        """
+        histogram = Histogram("dlp_stage_seconds", "Stage time.", ("stage",))
+
+        with pytest.raises(RuntimeError):
+            with histogram.time(stage="slack"):
+                raise RuntimeError("boom")
+
+        assert histogram.count(stage="slack") == 1
+
+
+@pytest.mark.asyncio
+class TestMetricsServer:
+    async def test_serves_prometheus_text(self):
+        """
+        Test that the registry is served on /metrics in the Prometheus format.
+        """
+        registry = Registry()
+        counter = registry.register(Counter("dlp_tasks", "Tasks.", ("task",)))
+        counter.inc(task="process_message")
+        server = MetricsServer(port=0, host="127.0.0.1", registry=registry)
+
+        await server.start()
+        try:
+            async with aiohttp.ClientSession() as session:
+                async with session.get(
+                    f"http://127.0.0.1:{server.port}/metrics"
+                ) as response:
+                    body = await response.text()
+                    content_type = response.headers["Content-Type"]
+        finally:
+            await server.stop()
+
+        assert content_type.startswith("text/plain; version=0.0.4")
+        assert body.endswith('dlp_tasks_total{task="process_message"} 1.0\n')
@@ -0,0 +1,173 @@
+import asyncio
+import time
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+from metrics import PATTERNS_QUARANTINED
+from patterns import (
+    EMPTY_PATTERN_SET,
+    PatternCache,
+    PatternFetchError,
+    compile_patterns,
+    pattern_set_version,
+)
+
+RAW_PATTERNS = [
+    {"id": "1", "name": "Digits", "regex": r"\d+"},
+    {"id": "2", "name": "Email", "regex": r"[\w.]+@[\w.]+"},
+]
+
+
+class TestCompilePatterns:
+    def test_compiles_patterns(self):
+        """
+        Test that compile_patterns pre-compiles every regex.
+        """
+        pattern_set = compile_patterns(RAW_PATTERNS)
+
+        assert [p.id for p in pattern_set.patterns] == ["1", "2"]
+        assert pattern_set.patterns[0].compiled.search("abc 123")
+        assert pattern_set.version == pattern_set_version(RAW_PATTERNS)
+
+    def test_skips_invalid_regex(self):
+        """
+        Test that compile_patterns skips patterns whose regex does not compile.
+        """
+        pattern_set = compile_patterns(
+            RAW_PATTERNS + [{"id": "3", "name": "Broken", "regex": "(unclosed"}]
+        )
+
+        assert [p.id for p in pattern_set.patterns] == ["1", "2"]
+
+    def test_version_ignores_order(self):
+        """
+        Test that the pattern set version does not depend on the API ordering.
+        """
+        assert pattern_set_version(RAW_PATTERNS) == pattern_set_version(
+            list(reversed(RAW_PATTERNS))
+        )
+        assert pattern_set_version(RAW_PATTERNS) != pattern_set_version(
+            RAW_PATTERNS[:1]
+        )
+
+
+@pytest.mark.asyncio
+class TestPatternCache:
+    async def test_reuses_fresh_pattern_set(self):
+        """
+        Test that the cache only fetches once while the pattern set is fresh.
+        """
+        fetcher = AsyncMock(return_value=RAW_PATTERNS)
+        cache = PatternCache(fetcher=fetcher, ttl=60)
+
+        first = await cache.get()
+        second = await cache.get()
+
+        assert first is second
+        fetcher.assert_awaited_once()
+
+    async def test_single_flight_refresh(self):
+        """
+        Test that concurrent callers share a single refresh.
+        """
+
+        async def slow_fetch():
+            await asyncio.sleep(0.01)
+            return RAW_PATTERNS
+
+        fetcher = AsyncMock(side_effect=slow_fetch)
+        cache = PatternCache(fetcher=fetcher, ttl=60)
+
+        results = await asyncio.gather(*[cache.get() for _ in range(10)])
+
+        assert all(result is results[0] for result in results)
+        fetcher.assert_awaited_once()
+
+    async def test_refreshes_after_ttl(self):
+        """
+        Test that an expired pattern set is fetched and recompiled on change.
+        """
+        fetcher = AsyncMock(side_effect=[RAW_PATTERNS, RAW_PATTERNS[:1]])
+        cache = PatternCache(fetcher=fetcher, ttl=0)
+
+        first = await cache.get()
+        second = await cache.get()
+
+        assert len(first) == 2
+        assert len(second) == 1
+        assert first.version != second.version
+
+    @patch("patterns.PATTERN_CACHE_RETRY_INTERVAL", 0)
+    async def test_falls_back_to_last_known_good(self):
+        """
+        Test that a failed refresh keeps serving the last known good pattern set.
+        """
+        fetcher = AsyncMock(side_effect=[RAW_PATTERNS, PatternFetchError("down")])
+        cache = PatternCache(fetcher=fetcher, ttl=0)
+
+        first = await cache.get()
+        second = await cache.get()
+
+        assert second is first
+        assert fetcher.await_count == 2
+
+    async def test_empty_without_successful_fetch(self):
+        """
+        Test that the cache returns an empty pattern set if nothing was ever fetched.
+        """
+        fetcher = AsyncMock(side_effect=PatternFetchError("down"))
+        cache = PatternCache(fetcher=fetcher, ttl=60)
+
+        assert await cache.get() is EMPTY_PATTERN_SET
+        # The failure is remembered for the retry interval
+        assert await cache.get() is EMPTY_PATTERN_SET
+        fetcher.assert_awaited_once()
+
+    async def test_quarantine(self):
+        """
+        Test that quarantined patterns leave the pattern set until their regex changes.
+        """
+        fixed = [RAW_PATTERNS[0], dict(RAW_PATTERNS[1], regex=r"\w+@\w+")]
+        fetcher = AsyncMock(side_effect=[RAW_PATTERNS, RAW_PATTERNS, fixed])
+        cache = PatternCache(fetcher=fetcher, ttl=0)
+        await cache.get()
+
+        cache.quarantine(["2"])
+        quarantined = await cache.get()
+        readmitted = await cache.get()
+
+        assert [p.id for p in quarantined.patterns] == ["1"]
+        assert [p.id for p in readmitted.patterns] == ["1", "2"]
+        assert PATTERNS_QUARANTINED.value(pattern="2") == 1
+
+    async def test_quarantine_expires(self):
+        """
+        Test that a quarantined pattern is scanned with again after the quarantine
+        TTL, even though the pattern set did not change.
+        """
+        fetcher = AsyncMock(return_value=RAW_PATTERNS)
+        cache = PatternCache(fetcher=fetcher, ttl=0, quarantine_ttl=60)
+        await cache.get()
+
+        cache.quarantine(["2"])
+        quarantined = await cache.get()
+        with patch("patterns.time.monotonic", return_value=time.monotonic() + 61):
+            readmitted = await cache.get()
+
+        assert [p.id for p in quarantined.patterns] == ["1"]
+        assert [p.id for p in readmitted.patterns] == ["1", "2"]
+
+    async def test_quarantine_ends_on_pattern_set_change(self):
+        """
+        Test that a change to any pattern of the set ends every quarantine.
+        """
+        changed = RAW_PATTERNS + [{"id": "3", "name": "Word", "regex": r"secret"}]
+        fetcher = AsyncMock(side_effect=[RAW_PATTERNS, changed])
+        cache = PatternCache(fetcher=fetcher, ttl=0)
+        await cache.get()
+
+        cache.quarantine(["2"])
+        readmitted = await cache.get()
+
+        assert [p.id for p in readmitted.patterns] == ["1", "2", "3"]
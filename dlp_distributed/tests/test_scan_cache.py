@@ -0,0 +1,62 @@
+from scan_cache import ScanResultCache
+
+
+class TestScanResultCache:
+    def test_miss_then_hit(self):
+        """
+        Test that a stored result is returned for the same content and version.
+        """
+        cache = ScanResultCache(max_entries=10)
+        key = cache.key("card 1234", "v1")
+
+        assert cache.get(key) is None
+        cache.put(key, ["card"])
+
+        assert cache.get(cache.key("card 1234", "v1")) == ("card",)
+        assert cache.stats() == {"hits": 1, "misses": 1, "size": 1}
+
+    def test_key_depends_on_content_and_version(self):
+        """
+        Test that different content or a new pattern set version never share a key.
+        """
+        key = ScanResultCache.key("card 1234", "v1")
+
+        assert key == ScanResultCache.key(b"card 1234", "v1")
+        assert key != ScanResultCache.key("card 1235", "v1")
+        assert key != ScanResultCache.key("card 1234", "v2")
+
+    def test_empty_result_is_cached(self):
+        """
+        Test that a scan without matches is cached as well.
+        """
+        cache = ScanResultCache(max_entries=10)
+        cache.put("key", [])
+
+        assert cache.get("key") == ()
+        assert cache.hits == 1
+
+    def test_least_recently_used_is_evicted(self):
+        """
+        Test that the cache keeps at most ``max_entries`` results, dropping the
+        least recently used one first.
+        """
+        cache = ScanResultCache(max_entries=2)
+        cache.put("a", ["1"])
+        cache.put("b", ["2"])
+        cache.get("a")
+        cache.put("c", ["3"])
+
+        assert cache.get("b") is None
+        assert cache.get("a") == ("1",)
+        assert cache.get("c") == ("3",)
+        assert cache.stats()["size"] == 2
+
+    def test_disabled(self):
+        """
+        Test that a cache without entries never stores anything.
+        """
+        cache = ScanResultCache(max_entries=0)
+        cache.put("key", ["1"])
+
+        assert cache.get("key") is None
+        assert cache.stats() == {"hits": 0, "misses": 1, "size": 0}
@@ -0,0 +1,104 @@
+from unittest.mock import MagicMock
+
+import pytest
+
+from patterns import compile_patterns
+from scan_pool import ScanPool
+
+RAW_PATTERNS = [
+    {"id": "card", "name": "Credit Card", "regex": r"\b\d{4}-\d{4}-\d{4}-\d{4}\b"},
+    {"id": "email", "name": "Email", "regex": r"[\w.]+@[\w.]+\.\w+"},
+]
+
+
+@pytest.fixture
+def scan_pool():
+    pool = ScanPool(max_workers=1, inline_threshold=100)
+    yield pool
+    pool.shutdown()
+
+
+@pytest.mark.asyncio
+class TestScanPool:
+    async def test_small_text_is_scanned_inline(self, scan_pool):
+        """
+        Test that texts under the inline threshold never start the process pool.
+        """
+        pattern_set = compile_patterns(RAW_PATTERNS)
+
+        matches = await scan_pool.scan(pattern_set, "mail a@b.co")
+
+        assert matches == ["email"]
+        assert scan_pool._executor is None
+
+    async def test_large_text_is_scanned_in_pool(self, scan_pool):
+        """
+        Test that large texts are scanned by a pool process with the same verdict.
+        """
+        pattern_set = compile_patterns(RAW_PATTERNS)
+        text = "filler " * 100 + "card 1234-5678-9012-3456"
+
+        matches = await scan_pool.scan(pattern_set, text)
+
+        assert matches == pattern_set.engine.scan(text) == ["card"]
+        assert scan_pool._executor is not None
+
+    async def test_locate_bytes_in_pool(self, scan_pool):
+        """
+        Test that a pool process locates the patterns in a UTF-8 buffer.
+        """
+        pattern_set = compile_patterns(RAW_PATTERNS)
+        data = ("filler " * 100 + "né mail a@b.co").encode("utf-8")
+
+        spans = await scan_pool.locate(pattern_set, data)
+
+        assert list(spans) == ["email"]
+        assert data[slice(*spans["email"])] == b"a@b.co"
+
+    async def test_pool_restarts_on_new_version(self, scan_pool):
+        """
+        Test that a new pattern set version restarts the pool with its patterns.
+        """
+        text = "filler " * 100 + "mail a@b.co"
+        first = compile_patterns(RAW_PATTERNS[:1])
+        second = compile_patterns(RAW_PATTERNS)
+
+        assert await scan_pool.scan(first, text) == []
+        first_executor = scan_pool._executor
+        assert await scan_pool.scan(second, text) == ["email"]
+        assert scan_pool._executor is not first_executor
+
+    async def test_disabled_pool(self):
+        """
+        Test that a pool without workers scans everything inline.
+        """
+        pool = ScanPool(max_workers=0, inline_threshold=0)
+        pattern_set = compile_patterns(RAW_PATTERNS)
+
+        assert await pool.scan(pattern_set, "x" * 1000 + " a@b.co") == ["email"]
+        assert pool._executor is None
+
+    async def test_reports_timed_out_patterns(self):
+        """
+        Test that patterns exceeding the budget are reported and count as no match.
+        """
+        on_timeout = MagicMock()
+        pool = ScanPool(max_workers=0, budget=0.1, on_timeout=on_timeout)
+        pattern_set = compile_patterns(
+            RAW_PATTERNS + [{"id": "slow", "name": "Slow", "regex": r"^(a+)+$"}]
+        )
+
+        matches = await pool.scan(pattern_set, "a" * 40 + "! a@b.co")
+
+        assert matches == ["email"]
+        on_timeout.assert_called_once_with(["slow"])
+
+    async def test_budget_scales_with_text_size(self):
+        """
+        Test that the budget grows with the size of the text to scan.
+        """
+        pool = ScanPool(max_workers=0, budget=1.0, budget_per_mb=2.0)
+
+        assert pool.budget_for("x" * 10) == pytest.approx(1.0, abs=1e-4)
+        assert pool.budget_for(b"x" * 3 * 1024 * 1024) == 7.0
+        assert pool.budget_for(b"x" * 3 * 1024 * 1024, 1024 * 1024) == 5.0
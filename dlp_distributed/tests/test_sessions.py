@@ -0,0 +1,68 @@
+import pytest
+from aiohttp import web
+
+from sessions import SharedSession
+
+
+@pytest.mark.asyncio
+class TestSharedSession:
+    async def test_reused_until_closed(self):
+        """
+        Test that the same session is returned until it is closed.
+        """
+        shared = SharedSession()
+
+        session = shared.get()
+        assert shared.get() is session
+
+        await shared.close()
+        assert session.closed
+        reopened = shared.get()
+        assert reopened is not session
+        await shared.close()
+
+    async def test_connector_settings(self):
+        """
+        Test that the session pools connections with the configured limits.
+        """
+        shared = SharedSession(
+            limit=8, limit_per_host=2, dns_cache_ttl=60, read_timeout=5
+        )
+
+        session = shared.get()
+        try:
+            assert session.connector.limit == 8
+            assert session.connector.limit_per_host == 2
+            assert session.connector.use_dns_cache
+            assert session.timeout.total is None
+            assert session.timeout.sock_read == 5
+        finally:
+            await shared.close()
+
+    async def test_connections_are_kept_alive(self):
+        """
+        Test that sequential requests to a host go over a single connection.
+        """
+        peers = set()
+
+        async def handle(request):
+            peers.add(request.transport.get_extra_info("peername"))
+            return web.Response(text="ok")
+
+        app = web.Application()
+        app.router.add_get("/", handle)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        port = runner.addresses[0][1]
+        shared = SharedSession()
+        try:
+            for _ in range(3):
+                async with shared.get().get(f"http://127.0.0.1:{port}/") as response:
+                    assert await response.text() == "ok"
+        finally:
+            await shared.close()
+            await runner.cleanup()
+
+        assert len(peers) == 1
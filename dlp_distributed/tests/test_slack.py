@@ -0,0 +1,205 @@
+import asyncio
+import time
+
+import pytest
+from aiohttp import web
+from slack_sdk.errors import SlackApiError
+from slack_sdk.web.async_client import AsyncWebClient
+
+from metrics import SLACK_RATE_LIMITED
+from sessions import SharedSession
+from slack import SlackDispatcher, SlackRateLimitedError, TokenBucket
+
+RATES = {"chat_update": (100.0, 100)}
+
+
+class FakeSlack:
+    def __init__(self, *responses):
+        """
+        A local Slack Web API answering with ``responses`` in order, as
+        ``(status, body, headers)`` tuples, and with ``ok`` afterwards.
+        """
+        self.responses = list(responses)
+        self.calls = []
+        self._runner = None
+
+    async def _handle(self, request):
+        self.calls.append((request.match_info["method"], time.monotonic()))
+        if self.responses:
+            status, body, headers = self.responses.pop(0)
+        else:
+            status, body, headers = 200, {"ok": True}, {}
+        return web.json_response(body, status=status, headers=headers)
+
+    async def __aenter__(self):
+        app = web.Application()
+        app.router.add_post("/api/{method}", self._handle)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        port = self._runner.addresses[0][1]
+        return AsyncWebClient(
+            token="xoxb-test", base_url=f"http://127.0.0.1:{port}/api/"
+        )
+
+    async def __aexit__(self, *exc_info):
+        await self._runner.cleanup()
+
+
+RATE_LIMITED = (429, {"ok": False, "error": "ratelimited"}, {"Retry-After": "0.2"})
+
+
+@pytest.mark.asyncio
+class TestSlackDispatcher:
+    async def test_retry_after_is_honored(self):
+        """
+        Test that a rate limited call is retried once its Retry-After has passed,
+        and that the concurrency is halved.
+        """
+        fake = FakeSlack(RATE_LIMITED)
+        async with fake as client:
+            dispatcher = SlackDispatcher(client, rates=RATES, max_concurrency=4)
+
+            response = await dispatcher.call(
+                "chat_update", channel="C1", ts="1.2", text="blocked"
+            )
+
+        assert response["ok"] is True
+        (_, first), (_, second) = fake.calls
+        assert second - first >= 0.2
+        assert dispatcher.concurrency == 2
+        assert SLACK_RATE_LIMITED.value(method="chat_update") == 1
+
+    async def test_gives_up_after_max_retries(self):
+        """
+        Test that a call still rate limited after its retries raises, so that
+        the task is not acknowledged.
+        """
+        limited = (429, {"ok": False, "error": "ratelimited"}, {"Retry-After": "0"})
+        fake = FakeSlack(limited, limited, limited)
+        async with fake as client:
+            dispatcher = SlackDispatcher(client, rates=RATES, max_retries=2)
+
+            with pytest.raises(SlackRateLimitedError):
+                await dispatcher.call("chat_update", channel="C1", ts="1.2", text="x")
+
+        assert len(fake.calls) == 3
+        assert dispatcher._retrying == 0
+
+    async def test_full_retry_queue_fails_fast(self):
+        """
+        Test that a rate limited call is not retried while the retry queue is full.
+        """
+        fake = FakeSlack(RATE_LIMITED)
+        async with fake as client:
+            dispatcher = SlackDispatcher(client, rates=RATES, retry_queue_size=0)
+
+            with pytest.raises(SlackRateLimitedError):
+                await dispatcher.call("chat_update", channel="C1", ts="1.2", text="x")
+
+        assert len(fake.calls) == 1
+
+    async def test_other_errors_are_raised(self):
+        """
+        Test that errors other than rate limits are raised without retrying.
+        """
+        fake = FakeSlack((200, {"ok": False, "error": "channel_not_found"}, {}))
+        async with fake as client:
+            dispatcher = SlackDispatcher(client, rates=RATES)
+
+            with pytest.raises(SlackApiError):
+                await dispatcher.call("chat_update", channel="C1", ts="1.2", text="x")
+
+        assert len(fake.calls) == 1
+        assert dispatcher.concurrency == dispatcher.max_concurrency
+
+    async def test_concurrency_recovers_after_successes(self):
+        """
+        Test that the concurrency grows by one after a round of successful calls.
+        """
+        fake = FakeSlack(RATE_LIMITED)
+        async with fake as client:
+            dispatcher = SlackDispatcher(client, rates=RATES, max_concurrency=4)
+            await dispatcher.call("chat_update", channel="C1", ts="1.2", text="x")
+            assert dispatcher.concurrency == 2
+
+            await dispatcher.call("chat_update", channel="C1", ts="1.2", text="x")
+
+        assert dispatcher.concurrency == 3
+
+    async def test_calls_share_the_session(self):
+        """
+        Test that calls go through one client bound to the shared HTTP session,
+        without touching the client the dispatcher was given.
+        """
+        shared = SharedSession()
+        fake = FakeSlack()
+        async with fake as client:
+            dispatcher = SlackDispatcher(client, rates=RATES, session=shared)
+            try:
+                await dispatcher.call("chat_update", channel="C1", ts="1.2", text="x")
+                session_client = dispatcher._client()
+                await dispatcher.call("chat_update", channel="C1", ts="1.2", text="y")
+
+                assert dispatcher._client() is session_client
+                assert session_client.session is shared.get()
+                assert session_client.base_url == client.base_url
+                assert client.session is None
+            finally:
+                await shared.close()
+
+        assert len(fake.calls) == 2
+
+    async def test_client_follows_a_new_session(self):
+        """
+        Test that a new client is built when the shared session is replaced,
+        e.g. on another event loop.
+        """
+        shared = SharedSession()
+        fake = FakeSlack()
+        async with fake as client:
+            dispatcher = SlackDispatcher(client, rates=RATES, session=shared)
+            try:
+                first = dispatcher._client()
+                await shared.close()
+                second = dispatcher._client()
+                await dispatcher.call("chat_update", channel="C1", ts="1.2", text="x")
+
+                assert second is not first
+                assert second.session is shared.get()
+            finally:
+                await shared.close()
+
+        assert len(fake.calls) == 1
+
+
+@pytest.mark.asyncio
+class TestTokenBucket:
+    async def test_rate_after_burst(self):
+        """
+        Test that a burst is served right away and further calls at the rate.
+        """
+        bucket = TokenBucket(rate=20, capacity=2)
+        start = time.monotonic()
+
+        await bucket.acquire()
+        await bucket.acquire()
+        burst = time.monotonic() - start
+        await bucket.acquire()
+        await bucket.acquire()
+
+        assert burst < 0.05
+        assert time.monotonic() - start >= 0.09
+
+    async def test_pause(self):
+        """
+        Test that a paused bucket hands out no token until the pause has passed.
+        """
+        bucket = TokenBucket(rate=1000, capacity=10)
+        bucket.pause(0.1)
+        start = time.monotonic()
+
+        await asyncio.wait_for(bucket.acquire(), 1)
+
+        assert time.monotonic() - start >= 0.09
@@ -0,0 +1,118 @@
+import pytest
+from unittest.mock import patch
+
+from patterns import compile_patterns
+from streaming import scan_stream
+
+CARD = {"id": "card", "regex": r"\b\d{4}-\d{4}-\d{4}-\d{4}\b"}
+EMAIL = {"id": "email", "regex": r"\b[a-zA-Z0-9_.+-]+@[a-zA-Z0-9-]+\.[a-zA-Z0-9-.]+\b"}
+
+
+async def iterate(chunks, consumed=None):
+    """
+    Yield byte chunks like aiohttp's iter_chunked, recording how many were read.
+    """
+    for chunk in chunks:
+        if consumed is not None:
+            consumed.append(chunk)
+        yield chunk
+
+
+def engine_for(*raw_patterns):
+    return compile_patterns(list(raw_patterns)).engine
+
+
+@pytest.mark.asyncio
+class TestScanStream:
+    async def test_match_across_chunks(self):
+        """
+        Test that a match split over two chunks is found thanks to the overlap.
+        """
+        chunks = [b"filler text card 1234-56", b"78-9012-3456 end\n", b"more"]
+
+        matches, window = await scan_stream(iterate(chunks), engine_for(CARD))
+
+        assert matches == ["card"]
+        assert "1234-5678-9012-3456" in window
+
+    async def test_stops_at_first_match(self):
+        """
+        Test that the stream is not read further once a match is certain, i.e.
+        ends before the unconfirmed overlap at the end of the window.
+        """
+        consumed = []
+        chunks = [b"contact a@b.co now\n" + b" " * 4096, b"nothing\n", b"else\n"]
+
+        matches, _ = await scan_stream(iterate(chunks, consumed), engine_for(EMAIL))
+
+        assert matches == ["email"]
+        assert len(consumed) == 1
+
+    async def test_no_match(self):
+        """
+        Test that a clean stream returns no matches.
+        """
+        chunks = [b"nothing to see\n"] * 10
+
+        assert await scan_stream(iterate(chunks), engine_for(CARD, EMAIL)) == ([], "")
+
+    async def test_no_partial_token_match(self):
+        """
+        Test that a number cut at a chunk boundary is not matched by a trailing \\b.
+        """
+        chunks = [b"id 1234-5678-9012-3456", b"7 end\n"]
+
+        assert await scan_stream(iterate(chunks), engine_for(CARD)) == ([], "")
+
+    async def test_anchors_do_not_match_at_window_start(self):
+        """
+        Test that ^ only matches at the real start of the stream.
+        """
+        engine = engine_for({"id": "start", "regex": r"^secret"})
+
+        matches, _ = await scan_stream(
+            iterate([b"public\n", b"secret\n"]), engine, "utf-8"
+        )
+
+        assert matches == []
+
+    async def test_multibyte_character_split(self):
+        """
+        Test that a UTF-8 character split across chunks is decoded correctly.
+        """
+        engine = engine_for({"id": "word", "regex": r"café"})
+        encoded = "un café\n".encode("utf-8")
+
+        matches, _ = await scan_stream(iterate([encoded[:6], encoded[6:]]), engine)
+
+        assert matches == ["word"]
+
+    @patch("streaming.SCAN_OVERLAP_LIMIT", 8)
+    async def test_window_memory_is_bounded(self):
+        """
+        Test that the carried tail never exceeds the overlap limit plus context.
+        """
+        windows = []
+        engine = engine_for(EMAIL)
+        original_locate = engine.locate_within
+
+        def recording_locate(text, pos=0, budget=None):
+            windows.append(len(text))
+            return original_locate(text, pos, budget)
+
+        engine.locate_within = recording_locate
+        chunks = [b"x" * 100 + b"\n"] * 20
+
+        await scan_stream(iterate(chunks), engine)
+
+        assert max(windows) <= 101 + 2 * 8 + 64
+
+    async def test_no_match_cut_by_chunk_without_whitespace(self):
+        """
+        Test that a number cut at the end of a chunk without whitespace is not
+        matched by a trailing \\b.
+        """
+        data = b"," * (1024 * 1024 - 19) + b"1234-5678-1234-5678" + b"9" * 100
+        chunks = [data[i : i + 65536] for i in range(0, len(data), 65536)]
+
+        assert await scan_stream(iterate(chunks), engine_for(CARD)) == ([], "")
@@ -0,0 +1,160 @@
+import asyncio
+import os
+import signal
+import time
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+from supervisor import Supervisor, serve
+
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "condition not met in time"
+        time.sleep(0.01)
+
+
+def read_lines(path):
+    return path.read_text().splitlines() if path.exists() else []
+
+
+class TestSupervisor:
+    def test_starts_one_worker_per_process(self, tmp_path):
+        """
+        Test that every worker process runs the target.
+        """
+        log = tmp_path / "started"
+
+        def target():
+            with log.open("a") as f:
+                f.write(f"{os.getpid()}\n")
+
+        supervisor = Supervisor(target=target, processes=3, restart_delay=0)
+        supervisor.start()
+        wait_until(lambda: len(read_lines(log)) == 3)
+        supervisor.shutdown(timeout=5)
+
+        assert len(set(read_lines(log))) == 3
+
+    def test_restarts_crashed_worker(self, tmp_path):
+        """
+        Test that a worker that crashes is started again.
+        """
+        log = tmp_path / "started"
+
+        def target():
+            with log.open("a") as f:
+                f.write("started\n")
+            if len(read_lines(log)) == 1:
+                raise SystemExit(1)
+            time.sleep(60)
+
+        supervisor = Supervisor(target=target, processes=1, restart_delay=0)
+        supervisor.start()
+        first = supervisor._children[0]
+        supervisor.monitor(timeout=5)
+
+        assert first.exitcode == 1
+        wait_until(lambda: len(read_lines(log)) == 2)
+        assert supervisor._children[0] is not first
+        supervisor.shutdown(timeout=5)
+
+    def test_sigterm_is_forwarded_for_a_graceful_drain(self, tmp_path):
+        """
+        Test that stopping sends SIGTERM to the workers and waits for them.
+        """
+        log = tmp_path / "drained"
+
+        def target():
+            def drain(signum, frame):
+                log.write_text("drained")
+                raise SystemExit(0)
+
+            signal.signal(signal.SIGTERM, drain)
+            time.sleep(60)
+
+        supervisor = Supervisor(target=target, processes=2, restart_delay=0)
+        supervisor.start()
+        time.sleep(0.2)
+        processes = list(supervisor._children.values())
+        supervisor.shutdown(timeout=5)
+
+        assert log.read_text() == "drained"
+        assert [process.exitcode for process in processes] == [0, 0]
+
+    def test_stuck_worker_is_killed(self):
+        """
+        Test that a worker ignoring SIGTERM is killed after the timeout.
+        """
+
+        def target():
+            signal.signal(signal.SIGTERM, signal.SIG_IGN)
+            time.sleep(60)
+
+        supervisor = Supervisor(target=target, processes=1, restart_delay=0)
+        supervisor.start()
+        time.sleep(0.2)
+        process = supervisor._children[0]
+        supervisor.shutdown(timeout=0.2)
+
+        assert process.exitcode == -signal.SIGKILL
+
+    @patch("supervisor.gc.freeze")
+    @patch("supervisor.slack_dispatcher")
+    @patch("supervisor.scan_pool")
+    @patch("supervisor.http_session")
+    @patch("supervisor.pattern_cache")
+    def test_warm(
+        self,
+        mock_pattern_cache,
+        mock_http_session,
+        mock_scan_pool,
+        mock_slack_dispatcher,
+        mock_freeze,
+    ):
+        """
+        Test that patterns are loaded, the HTTP session used to fetch them is
+        closed, and scan processes and Slack rate limits shared out before forking.
+        """
+        mock_pattern_cache.get = AsyncMock(return_value=[])
+        mock_http_session.close = AsyncMock()
+        mock_scan_pool.max_workers = 8
+
+        Supervisor(processes=4).warm()
+
+        mock_pattern_cache.get.assert_awaited_once()
+        mock_http_session.close.assert_awaited_once()
+        assert mock_scan_pool.max_workers == 2
+        assert mock_slack_dispatcher.rate_share == 0.25
+        mock_freeze.assert_called_once()
+
+
+@pytest.mark.asyncio
+class TestServe:
+    async def test_signal_drains_manager_once(self):
+        """
+        Test that SIGTERM cancels the manager once and lets it finish draining,
+        even if another signal arrives meanwhile.
+        """
+        events = []
+
+        class Manager:
+            async def main(self):
+                try:
+                    await asyncio.sleep(60)
+                except asyncio.CancelledError:
+                    events.append("cancelled")
+                    os.kill(os.getpid(), signal.SIGINT)
+                    await asyncio.sleep(0.05)
+                    events.append("drained")
+
+        async def send_sigterm():
+            await asyncio.sleep(0.05)
+            os.kill(os.getpid(), signal.SIGTERM)
+
+        asyncio.ensure_future(send_sigterm())
+        await serve(Manager())
+
+        assert events == ["cancelled", "drained"]
@@ -1,14 +1,18 @@
+import hashlib
 import os
-from unittest.mock import AsyncMock, patch
+from unittest.mock import AsyncMock, MagicMock, patch
 from urllib.parse import urljoin
 
 import aiohttp
 import pytest
 from slack_sdk.errors import SlackApiError
 
+from metrics import STAGE_SECONDS
+from patterns import PatternFetchError
 from tasks import (
     fetch_patterns,
-    send_detected_message,
+    detection_buffer,
+    send_detected_messages,
     process_file,
     process_message,
     replace_message,
@@ -16,15 +20,66 @@ from tasks import (
     SLACK_BLOCKING_MESSAGE,
     SLACK_BLOCKING_FILE,
     logger,
+    scan_cache,
+    scan_pool,
 )
 
 SLACK_TOKEN = os.getenv("SLACK_USER_TOKEN")
 BASE_URL = os.getenv("BASE_URL", "")
 
-detected_messages_url = urljoin(BASE_URL, "/api/detected-messages/")
+detected_messages_url = urljoin(BASE_URL, "/api/detected-messages/bulk/")
+content_blobs_missing_url = urljoin(BASE_URL, "/api/content-blobs/missing/")
 pattern_url = urljoin(BASE_URL, "/api/patterns/")
 
 
+def digest(content: str) -> str:
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def detection(content: str, pattern_id: str) -> dict:
+    """Return a detected message as posted with its content."""
+    return {
+        "content_digest": digest(content),
+        "pattern": pattern_id,
+        "content": content,
+    }
+
+
+def mock_backend(mock_session_post, stored=(), rejected=None):
+    """
+    Make the mocked backend report every content digest but ``stored`` as
+    missing, and answer detected messages as created, or with the ``rejected``
+    validation errors.
+    """
+
+    def post(url, json):
+        response = MagicMock()
+        if url == content_blobs_missing_url:
+            response.status = 200
+            missing = [item for item in json["digests"] if item not in stored]
+            response.json = AsyncMock(return_value={"missing": missing})
+        elif rejected is not None:
+            response.status = 400
+            response.json = AsyncMock(return_value=rejected)
+        else:
+            response.status = 201
+        context = MagicMock()
+        context.__aenter__.return_value = response
+        return context
+
+    mock_session_post.side_effect = post
+
+
+def posted_detections(mock_session_post) -> list:
+    """Return the detected messages posted to the bulk API, in order."""
+    return [
+        item
+        for call in mock_session_post.call_args_list
+        if call.args[0] == detected_messages_url
+        for item in call.kwargs["json"]
+    ]
+
+
 @pytest.mark.asyncio
 @patch("aiohttp.ClientSession.get")
 class TestFetchPatterns:
@@ -37,6 +92,7 @@ class TestFetchPatterns:
         mock_response = AsyncMock()
         mock_response.status = 200
         mock_response.json.return_value = [{"id": 1, "regex": r"\d+"}]
+        mock_response.headers = {}
         mock_get.return_value.__aenter__.return_value = mock_response
 
         # Call the function being tested
@@ -45,12 +101,39 @@ class TestFetchPatterns:
         # Verify the response
         assert result == [{"id": 1, "regex": r"\d+"}]
         mock_logger_info.assert_called_once_with("Found fetch patterns.")
-        mock_get.assert_called_once_with(f"{BASE_URL}/api/patterns/")
+        mock_get.assert_called_once_with(
+            f"{BASE_URL}/api/patterns/", headers={"Host": "backend"}
+        )
+
+    @patch.object(logger, "info")
+    async def test_not_modified(self, mock_logger_info, mock_get):
+        """
+        Test that fetch_patterns revalidates the list it fetched before with its
+        ETag, and reuses it when the backend answers 304.
+        """
+        patterns = [{"id": 1, "regex": r"\d+"}]
+        fetched = AsyncMock()
+        fetched.status = 200
+        fetched.headers = {"ETag": '"patterns-1"'}
+        fetched.json.return_value = patterns
+        not_modified = AsyncMock()
+        not_modified.status = 304
+        mock_get.return_value.__aenter__.side_effect = [fetched, not_modified]
+
+        assert await fetch_patterns() == patterns
+        assert await fetch_patterns() == patterns
+
+        mock_get.assert_called_with(
+            f"{BASE_URL}/api/patterns/",
+            headers={"Host": "backend", "If-None-Match": '"patterns-1"'},
+        )
+        not_modified.json.assert_not_called()
+        mock_logger_info.assert_called_with("Patterns not modified.")
 
     @patch.object(logger, "error")
     async def test_failure(self, mock_logger_error, mock_get):
         """
-        Test that fetch_patterns logs an error if the response status is not 200.
+        Test that fetch_patterns logs and raises an error if the response status is not 200.
         """
         # Mock the asynchronous response object
         mock_response = AsyncMock()
@@ -58,78 +141,147 @@ class TestFetchPatterns:
         mock_get.return_value.__aenter__.return_value = mock_response
 
         # Call the function being tested
-        result = await fetch_patterns()
+        with pytest.raises(PatternFetchError):
+            await fetch_patterns()
 
-        # Verify the response
-        assert result == []
+        # Verify logger calls
         mock_logger_error.assert_called_once_with(
             "Failed to fetch patterns. Status: 500"
         )
-        mock_get.assert_called_once_with(f"{BASE_URL}/api/patterns/")
+        mock_get.assert_called_once_with(
+            f"{BASE_URL}/api/patterns/", headers={"Host": "backend"}
+        )
 
     @patch.object(logger, "error")
     async def test_exception(self, mock_logger_error, mock_get):
         """
-        Test that fetch_patterns logs an error if an exception occurs.
+        Test that fetch_patterns logs and raises an error if an exception occurs.
         """
         # Mock an exception being raised
         mock_get.side_effect = Exception("Network error")
 
         # Call the function being tested
-        result = await fetch_patterns()
+        with pytest.raises(PatternFetchError, match="Network error"):
+            await fetch_patterns()
 
-        # Verify the response
-        assert result == []
+        # Verify logger calls
         mock_logger_error.assert_called_once_with(
             "Failed to fetch patterns: Network error"
         )
-        mock_get.assert_called_once_with(f"{BASE_URL}/api/patterns/")
+        mock_get.assert_called_once_with(
+            f"{BASE_URL}/api/patterns/", headers={"Host": "backend"}
+        )
 
 
 @pytest.mark.asyncio
 @patch("aiohttp.client.ClientSession.post")
-class TestSendDetectedMessage:
+class TestSendDetectedMessages:
+    DETECTIONS = [
+        {"content": "Test content", "pattern": "1"},
+        {"content": "Other content", "pattern": "2"},
+    ]
+
     @patch.object(logger, "info")
     async def test_success(self, mock_logger_info, mock_session_post):
         """
-        Test that send_detected_message sends a detected message successfully.
+        Test that send_detected_messages sends a batch in a single request, with
+        only the content the backend does not have yet.
         """
-        # Mock the asynchronous response object
-        mock_response = AsyncMock()
-        mock_response.raise_for_status.return_value = None
-        mock_session_post.return_value = mock_response
+        mock_backend(mock_session_post, stored={digest("Other content")})
 
         # Call the function being tested
-        await send_detected_message(content="Test content", pattern_id="1")
+        failed = await send_detected_messages(self.DETECTIONS)
 
-        # Verify that the post method was called with the expected arguments
-        mock_session_post.assert_called_once_with(
-            detected_messages_url,
-            json={"content": "Test content", "pattern": "1"},
+        # Verify that the digests were looked up and the batch posted once
+        assert failed is None
+        mock_session_post.assert_any_call(
+            content_blobs_missing_url,
+            json={"digests": [digest("Test content"), digest("Other content")]},
         )
-        mock_logger_info.assert_called_once_with("Detected message sent successfully.")
+        assert posted_detections(mock_session_post) == [
+            detection("Test content", "1"),
+            {"content_digest": digest("Other content"), "pattern": "2"},
+        ]
+        assert mock_session_post.call_count == 2
+        mock_logger_info.assert_called_once_with("Sent 2 detected messages.")
+
+    async def test_same_content_is_sent_once(self, mock_session_post):
+        """
+        Test that content matching several patterns is uploaded once.
+        """
+        mock_backend(mock_session_post)
+        detections = [
+            {"content": "Shared file", "pattern": "1"},
+            {"content": "Shared file", "pattern": "2"},
+        ]
+
+        await send_detected_messages(detections)
+
+        assert posted_detections(mock_session_post) == [
+            detection("Shared file", "1"),
+            {"content_digest": digest("Shared file"), "pattern": "2"},
+        ]
 
     @patch.object(logger, "error")
     async def test_failure(self, mock_logger_error, mock_session_post):
         """
-        Test that send_detected_message raises an exception when sending fails.
+        Test that send_detected_messages returns the batch to retry when sending fails.
         """
-        # Mock the asynchronous response object to simulate an error
+        # Mock the post to simulate an error
         mock_session_post.side_effect = aiohttp.ClientError("Failed to send message")
 
-        # Verify that the function raises the expected exception
-        with pytest.raises(aiohttp.ClientError, match="Failed to send message"):
-            await send_detected_message(content="Test content", pattern_id="1")
+        # Call the function being tested
+        failed = await send_detected_messages(self.DETECTIONS)
 
-        # Verify that the post method was called with the expected arguments
-        mock_session_post.assert_called_once_with(
-            detected_messages_url,
-            json={"content": "Test content", "pattern": "1"},
-        )
+        # Verify that every detection is retried
+        assert failed == self.DETECTIONS
         mock_logger_error.assert_called_once_with(
-            "Failed to send detected message: Failed to send message"
+            "Failed to send detected messages: Failed to send message"
         )
 
+    async def test_rejected_items_are_dropped(self, mock_session_post):
+        """
+        Test that only the valid detections of a rejected batch are retried.
+        """
+        # Mock a validation error on the second detection
+        mock_backend(mock_session_post, rejected=[{}, {"pattern": ["Invalid pk"]}])
+
+        failed = await send_detected_messages(self.DETECTIONS)
+
+        assert failed == self.DETECTIONS[:1]
+
+    async def test_unknown_content_is_retried(self, mock_session_post):
+        """
+        Test that a detection whose content went with a rejected one is retried.
+        """
+        mock_backend(
+            mock_session_post,
+            rejected=[
+                {"pattern": ["Invalid pk"]},
+                {"content_digest": ["Unknown content, send it as content."]},
+            ],
+        )
+
+        failed = await send_detected_messages(self.DETECTIONS)
+
+        assert failed == self.DETECTIONS[1:]
+
+    async def test_buffered_across_tasks(self, mock_session_post):
+        """
+        Test that detections reported by several tasks are sent in one batch.
+        """
+        mock_backend(mock_session_post)
+        for item in self.DETECTIONS:
+            await detection_buffer.add(item)
+        mock_session_post.assert_not_called()
+
+        await detection_buffer.flush()
+
+        assert posted_detections(mock_session_post) == [
+            detection("Test content", "1"),
+            detection("Other content", "2"),
+        ]
+
 
 @pytest.mark.asyncio
 @patch("slack_sdk.web.async_client.AsyncWebClient.chat_update")
@@ -350,12 +502,11 @@ class TestProcessMessage:
         mock_response_get = AsyncMock()
         mock_response_get.status = 200
         mock_response_get.json.return_value = [detected_pattern]
+        mock_response_get.headers = {}
         mock_session_get.return_value.__aenter__.return_value = mock_response_get
 
-        # Mock send_detected_message response
-        mock_response_post = AsyncMock()
-        mock_response_post.raise_for_status.return_value = None
-        mock_session_post.return_value.__aenter__.return_value = mock_response_post
+        # Mock send_detected_messages response
+        mock_backend(mock_session_post)
 
         # Mock replace_message response
         mock_slack_update.return_value = {"ok": True}
@@ -368,14 +519,16 @@ class TestProcessMessage:
         )
 
         # Verify that the GET request for fetch_patterns was called
-        mock_session_get.assert_called_once_with(f"{BASE_URL}/api/patterns/")
-
-        # Verify that the POST request for send_detected_message was called
-        mock_session_post.assert_called_once_with(
-            detected_messages_url,
-            json={"content": message, "pattern": detected_pattern["id"]},
+        mock_session_get.assert_called_once_with(
+            f"{BASE_URL}/api/patterns/", headers={"Host": "backend"}
         )
 
+        # Verify that the POST request for send_detected_messages was called
+        await detection_buffer.flush()
+        assert posted_detections(mock_session_post) == [
+            detection(message, detected_pattern["id"])
+        ]
+
         # Verify that the Slack message update was called
         mock_slack_update.assert_called_once_with(
             channel=channel_id,
@@ -387,6 +540,30 @@ class TestProcessMessage:
         mock_logger_info.assert_any_call(f"Processing message: {message}")
         mock_logger_info.assert_any_call("Message processed with 1 matches found.")
 
+    async def test_records_stage_latencies(
+        self,
+        mock_session_post,
+        mock_session_get,
+        mock_slack_update,
+    ):
+        """
+        Test that every stage of a message with matches is timed.
+        """
+        # Mock fetch_patterns and send_detected_message responses
+        mock_response_get = AsyncMock()
+        mock_response_get.status = 200
+        mock_response_get.json.return_value = [{"id": "1", "regex": r"\d+"}]
+        mock_response_get.headers = {}
+        mock_session_get.return_value.__aenter__.return_value = mock_response_get
+        mock_backend(mock_session_post)
+        mock_slack_update.return_value = {"ok": True}
+
+        await process_message(message="card 123", channel_id="C1", ts="1.2")
+        await detection_buffer.flush()
+
+        for stage in ("pattern_fetch", "scan", "backend_post", "slack"):
+            assert STAGE_SECONDS.count(stage=stage) == 1
+
     @patch.object(logger, "info")
     async def test_success_no_matches(
         self,
@@ -408,6 +585,7 @@ class TestProcessMessage:
         mock_response_get = AsyncMock()
         mock_response_get.status = 200
         mock_response_get.json.return_value = [unmatched_pattern]
+        mock_response_get.headers = {}
         mock_session_get.return_value.__aenter__.return_value = mock_response_get
 
         # Call the function being tested
@@ -425,6 +603,53 @@ class TestProcessMessage:
         mock_logger_info.assert_any_call(f"Processing message: {message}")
         mock_logger_info.assert_any_call("No matches found in the message.")
 
+    @patch.object(logger, "info")
+    async def test_duplicate_message_uses_scan_cache(
+        self,
+        mock_logger_info,
+        mock_session_post,
+        mock_session_get,
+        mock_slack_update,
+    ):
+        """
+        Test that a repeated message is reported again without being rescanned.
+        """
+        # Test variables
+        message = "Test message with 123"
+        channel_id = "C123456"
+        detected_pattern = {"id": "1", "regex": r"\d+"}
+
+        # Mock fetch_patterns response
+        mock_response_get = AsyncMock()
+        mock_response_get.status = 200
+        mock_response_get.json.return_value = [detected_pattern]
+        mock_response_get.headers = {}
+        mock_session_get.return_value.__aenter__.return_value = mock_response_get
+
+        # Mock send_detected_messages response
+        mock_backend(mock_session_post)
+
+        # Mock replace_message response
+        mock_slack_update.return_value = {"ok": True}
+
+        # Call the function being tested twice with the same content
+        with patch.object(scan_pool, "locate", wraps=scan_pool.locate) as mock_scan:
+            await process_message(message=message, channel_id=channel_id, ts="1.1")
+            await process_message(message=message, channel_id=channel_id, ts="2.2")
+
+        # Verify that only the first message was scanned
+        mock_scan.assert_called_once()
+        assert scan_cache.stats() == {"hits": 1, "misses": 1, "size": 1}
+
+        # Verify that both messages were reported in one batch and replaced
+        await detection_buffer.flush()
+        assert posted_detections(mock_session_post) == [
+            detection(message, "1"),
+            {"content_digest": digest(message), "pattern": "1"},
+        ]
+        assert mock_slack_update.call_count == 2
+        mock_logger_info.assert_any_call("Reusing cached scan result.")
+
     @patch.object(logger, "error")
     async def test_failure_fetch_patterns(
         self,
@@ -469,12 +694,10 @@ class TestProcessMessage:
 @patch("slack_sdk.web.async_client.AsyncWebClient.chat_postMessage")
 @patch("slack_sdk.web.async_client.AsyncWebClient.files_delete")
 class TestProcessFile:
-    @patch("re.search")
     @patch.object(logger, "info")
     async def test_success_with_matches(
         self,
         mock_logger_info,
-        mock_re_search,
         mock_files_delete,
         mock_chat_postMessage,
         mock_session_post,
@@ -496,25 +719,23 @@ class TestProcessFile:
         # Mock file content download
         mock_response_get_file = AsyncMock()
         mock_response_get_file.status = 200
-        mock_response_get_file.text.return_value = file_content
+        mock_response_get_file.charset = None
+        mock_response_get_file.content_length = len(file_content.encode("utf-8"))
+        mock_response_get_file.read.return_value = file_content.encode("utf-8")
         mock_session_get.return_value.__aenter__.return_value = mock_response_get_file
 
         # Mock fetch_patterns response
         mock_response_get_patterns = AsyncMock()
         mock_response_get_patterns.status = 200
         mock_response_get_patterns.json.return_value = [detected_pattern]
+        mock_response_get_patterns.headers = {}
         mock_session_get.return_value.__aenter__.side_effect = [
             mock_response_get_file,
             mock_response_get_patterns,
         ]
 
-        # Mock re.search to return a match
-        mock_re_search.return_value = True
-
-        # Mock send_detected_message response
-        mock_response_post = AsyncMock()
-        mock_response_post.raise_for_status.return_value = None
-        mock_session_post.return_value.__aenter__.return_value = mock_response_post
+        # Mock send_detected_messages response
+        mock_backend(mock_session_post)
 
         # Mock files_delete and chat_postMessage responses
         mock_files_delete.return_value = {"ok": True}
@@ -526,18 +747,16 @@ class TestProcessFile:
         # Verify API calls
         mock_files_info.assert_called_once_with(file=file_id)
         mock_session_get.assert_any_call("https://example.com/file", headers=headers)
-        mock_session_post.assert_called_once_with(
-            detected_messages_url,
-            json={"content": file_content, "pattern": detected_pattern["id"]},
-        )
+        mock_response_get_file.text.assert_not_called()
+        await detection_buffer.flush()
+        assert posted_detections(mock_session_post) == [
+            detection(file_content, detected_pattern["id"])
+        ]
         mock_files_delete.assert_called_once_with(file=file_id)
         mock_chat_postMessage.assert_called_once_with(
             channel=channel_id, text=blocked_file_message
         )
 
-        # Verify re.search was called with the expected arguments
-        mock_re_search.assert_called_once_with(detected_pattern["regex"], file_content)
-
         # Verify logger calls
         mock_logger_info.assert_any_call(f"Processing file content")
         mock_logger_info.assert_any_call("File processed with 1 matches found.")
@@ -545,6 +764,202 @@ class TestProcessFile:
             f"File {file_id} deleted successfully. Notification sent to channel {channel_id}."
         )
 
+    @patch("tasks.SCAN_REPORT_CONTEXT", 4)
+    async def test_bytes_scan_reports_window(
+        self,
+        mock_files_delete,
+        mock_chat_postMessage,
+        mock_session_post,
+        mock_session_get,
+        mock_files_info,
+    ):
+        """
+        Test that a UTF-8 file is scanned as bytes and only the text around each
+        match is reported.
+        """
+        file_id = "F123456"
+        channel_id = "C123456"
+        file_content = "Ünïcödé header, card 1234-5678-9012-3456, mail josé@example.com"
+        detected_patterns = [
+            {"id": "1", "regex": r"\d{4}-\d{4}-\d{4}-\d{4}"},
+            {"id": "2", "regex": r"\w+@\w+\.com"},
+        ]
+
+        # Mock files_info response
+        mock_files_info.return_value = {
+            "file": {"url_private_download": "https://example.com/file"}
+        }
+
+        # Mock file content download
+        mock_response_get_file = AsyncMock()
+        mock_response_get_file.status = 200
+        mock_response_get_file.charset = "utf-8"
+        mock_response_get_file.content_length = len(file_content.encode("utf-8"))
+        mock_response_get_file.read.return_value = file_content.encode("utf-8")
+
+        # Mock fetch_patterns response
+        mock_response_get_patterns = AsyncMock()
+        mock_response_get_patterns.status = 200
+        mock_response_get_patterns.json.return_value = detected_patterns
+        mock_session_get.return_value.__aenter__.side_effect = [
+            mock_response_get_file,
+            mock_response_get_patterns,
+        ]
+
+        # Mock send_detected_messages, files_delete and chat_postMessage responses
+        mock_backend(mock_session_post)
+        mock_files_delete.return_value = {"ok": True}
+        mock_chat_postMessage.return_value = {"ok": True}
+
+        # Call the function being tested
+        await process_file(file_id=file_id, channel_id=channel_id)
+
+        # Verify that the file was never decoded as a whole
+        mock_response_get_file.text.assert_not_called()
+        await detection_buffer.flush()
+        assert posted_detections(mock_session_post) == [
+            detection("ard 1234-5678-9012-3456, ma", "1"),
+            detection("ail josé@example.com", "2"),
+        ]
+        mock_files_delete.assert_called_once_with(file=file_id)
+
+    @patch.object(logger, "info")
+    async def test_other_charset_is_decoded(
+        self,
+        mock_logger_info,
+        mock_files_delete,
+        mock_chat_postMessage,
+        mock_session_post,
+        mock_session_get,
+        mock_files_info,
+    ):
+        """
+        Test that files in a charset other than UTF-8 are decoded before scanning.
+        """
+        file_id = "F123456"
+        channel_id = "C123456"
+        file_content = "Sensitive information with 123"
+        detected_pattern = {"id": "1", "regex": r"\d+"}
+
+        # Mock files_info response
+        mock_files_info.return_value = {
+            "file": {"url_private_download": "https://example.com/file"}
+        }
+
+        # Mock file content download
+        mock_response_get_file = AsyncMock()
+        mock_response_get_file.status = 200
+        mock_response_get_file.charset = "UTF-16"
+        mock_response_get_file.content_length = len(file_content.encode("utf-16"))
+        mock_response_get_file.text.return_value = file_content
+
+        # Mock fetch_patterns response
+        mock_response_get_patterns = AsyncMock()
+        mock_response_get_patterns.status = 200
+        mock_response_get_patterns.json.return_value = [detected_pattern]
+        mock_response_get_patterns.headers = {}
+        mock_session_get.return_value.__aenter__.side_effect = [
+            mock_response_get_file,
+            mock_response_get_patterns,
+        ]
+
+        # Mock send_detected_messages, files_delete and chat_postMessage responses
+        mock_backend(mock_session_post)
+        mock_files_delete.return_value = {"ok": True}
+        mock_chat_postMessage.return_value = {"ok": True}
+
+        # Call the function being tested
+        await process_file(file_id=file_id, channel_id=channel_id)
+
+        # Verify that the decoded file was scanned and reported
+        mock_response_get_file.read.assert_not_called()
+        await detection_buffer.flush()
+        assert posted_detections(mock_session_post) == [
+            detection(file_content, detected_pattern["id"])
+        ]
+        mock_logger_info.assert_any_call("File processed with 1 matches found.")
+
+    @pytest.mark.parametrize(
+        "content_length, size",
+        [(None, 1024), (1024, 1), (None, None)],
+        ids=["chunked", "understated", "unknown"],
+    )
+    @patch("tasks.SCAN_STREAM_THRESHOLD", 10)
+    @patch.object(logger, "info")
+    async def test_streaming_with_matches(
+        self,
+        mock_logger_info,
+        mock_files_delete,
+        mock_chat_postMessage,
+        mock_session_post,
+        mock_session_get,
+        mock_files_info,
+        content_length,
+        size,
+    ):
+        file_id = "F123456"
+        channel_id = "C123456"
+        chunks = [
+            b"first line\n",
+            b"card 1234-5678-9012-3456\n",
+            b"text after the card\n",
+            b"never read\n",
+        ]
+        detected_pattern = {"id": "1", "regex": r"\d{4}-\d{4}-\d{4}-\d{4}"}
+
+        async def iter_chunked(size):
+            for chunk in chunks:
+                yield chunk
+
+        # Mock files_info response, with the size Slack reports if any
+        file = {"url_private_download": "https://example.com/file"}
+        if size is not None:
+            file["size"] = size
+        mock_files_info.return_value = {"file": file}
+
+        # Mock the streamed file download, above the threshold or of unknown size
+        mock_response_get_file = AsyncMock()
+        mock_response_get_file.status = 200
+        mock_response_get_file.charset = "utf-8"
+        mock_response_get_file.content_length = content_length
+        mock_response_get_file.content = MagicMock()
+        mock_response_get_file.content.iter_chunked.side_effect = iter_chunked
+
+        # Mock fetch_patterns response
+        mock_response_get_patterns = AsyncMock()
+        mock_response_get_patterns.status = 200
+        mock_response_get_patterns.json.return_value = [detected_pattern]
+        mock_response_get_patterns.headers = {}
+        mock_session_get.return_value.__aenter__.side_effect = [
+            mock_response_get_file,
+            mock_response_get_patterns,
+        ]
+
+        # Mock send_detected_messages, files_delete and chat_postMessage responses
+        mock_backend(mock_session_post)
+        mock_files_delete.return_value = {"ok": True}
+        mock_chat_postMessage.return_value = {"ok": True}
+
+        # Call the function being tested
+        await process_file(file_id=file_id, channel_id=channel_id)
+
+        # Verify the whole file was never loaded and only the window was reported
+        mock_response_get_file.text.assert_not_called()
+        await detection_buffer.flush()
+        assert posted_detections(mock_session_post) == [
+            detection(
+                "first line\ncard 1234-5678-9012-3456\ntext after the card\n",
+                detected_pattern["id"],
+            )
+        ]
+        mock_files_delete.assert_called_once_with(file=file_id)
+
+        # Verify logger calls
+        mock_logger_info.assert_any_call(
+            f"Streaming file content ({content_length or size} bytes)"
+        )
+        mock_logger_info.assert_any_call("File processed with 1 matches found.")
+
     @patch.object(logger, "info")
     async def test_no_matches(
         self,
@@ -569,13 +984,16 @@ class TestProcessFile:
         # Mock file content download
         mock_response_get_file = AsyncMock()
         mock_response_get_file.status = 200
-        mock_response_get_file.text.return_value = file_content
+        mock_response_get_file.charset = None
+        mock_response_get_file.content_length = len(file_content.encode("utf-8"))
+        mock_response_get_file.read.return_value = file_content.encode("utf-8")
         mock_session_get.return_value.__aenter__.return_value = mock_response_get_file
 
         # Mock fetch_patterns response with no matches
         mock_response_get_patterns = AsyncMock()
         mock_response_get_patterns.status = 200
         mock_response_get_patterns.json.return_value = [unmatched_pattern]
+        mock_response_get_patterns.headers = {}
         mock_session_get.return_value.__aenter__.side_effect = [
             mock_response_get_file,
             mock_response_get_patterns,
@@ -0,0 +1,203 @@
+import asyncio
+import json
+import time
+
+import pytest
+from unittest.mock import AsyncMock, patch
+
+from manager import SQSManager
+from transports import (
+    MemoryTransport,
+    SQLiteTransport,
+    SQSTransport,
+    create_transport,
+)
+
+QUEUE = "dlp-tasks"
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def transport(request, tmp_path):
+    """
+    Yield each of the local transports, with a short visibility timeout.
+    """
+    if request.param == "memory":
+        transport = MemoryTransport(visibility_timeout=0.2)
+    else:
+        transport = SQLiteTransport(
+            path=str(tmp_path / "queue.sqlite3"),
+            visibility_timeout=0.2,
+            poll_interval=0.01,
+        )
+    yield transport
+    asyncio.run(transport.close())
+
+
+@pytest.mark.asyncio
+class TestLocalTransports:
+    async def test_send_and_receive(self, transport):
+        """
+        Test that sent messages are received in order, shaped like SQS messages.
+        """
+        assert await transport.send_batch(QUEUE, ["a", "b", "c"]) == []
+
+        messages = await transport.receive(QUEUE, 2, 0)
+
+        assert [message["Body"] for message in messages] == ["a", "b"]
+        assert all(message["ReceiptHandle"] for message in messages)
+        sent = int(messages[0]["Attributes"]["SentTimestamp"]) / 1000
+        assert abs(time.time() - sent) < 5
+        assert await transport.queue_stats(QUEUE) == (1, 2)
+
+    async def test_queues_are_separate(self, transport):
+        """
+        Test that messages are only received from the queue they were sent to.
+        """
+        await transport.send_batch("dlp-files", ["file"])
+
+        assert await transport.receive(QUEUE, 10, 0) == []
+        assert await transport.queue_stats("dlp-files") == (1, 0)
+
+    async def test_receive_waits_for_messages(self, transport):
+        """
+        Test that a receive on an empty queue waits for a message to be sent.
+        """
+        receive = asyncio.create_task(transport.receive(QUEUE, 10, 1))
+        await asyncio.sleep(0.02)
+        await transport.send_batch(QUEUE, ["late"])
+
+        messages = await asyncio.wait_for(receive, 0.5)
+
+        assert [message["Body"] for message in messages] == ["late"]
+
+    async def test_deleted_messages_are_not_redelivered(self, transport):
+        """
+        Test that a deleted message is gone, while an unacknowledged one is
+        delivered again once its visibility timeout expires.
+        """
+        await transport.send_batch(QUEUE, ["done", "lost"])
+        done, lost = await transport.receive(QUEUE, 10, 0)
+
+        assert await transport.delete_batch(QUEUE, [done["ReceiptHandle"]]) == []
+        assert await transport.receive(QUEUE, 10, 0) == []
+
+        messages = await transport.receive(QUEUE, 10, 1)
+        assert [message["Body"] for message in messages] == ["lost"]
+        assert messages[0]["ReceiptHandle"] != lost["ReceiptHandle"]
+
+    async def test_change_visibility(self, transport):
+        """
+        Test that extending the visibility keeps a message from being redelivered
+        and that unknown receipt handles are rejected.
+        """
+        await transport.send_batch(QUEUE, ["long"])
+        (message,) = await transport.receive(QUEUE, 10, 0)
+
+        rejected = await transport.change_visibility_batch(
+            QUEUE, [message["ReceiptHandle"], "unknown"], 5
+        )
+        await asyncio.sleep(0.3)
+
+        assert rejected == ["unknown"]
+        assert await transport.receive(QUEUE, 10, 0) == []
+        assert await transport.queue_stats(QUEUE) == (0, 1)
+
+
+@pytest.mark.asyncio
+class TestSQLiteTransport:
+    async def test_messages_are_durable(self, tmp_path):
+        """
+        Test that messages sent through one connection are received through
+        another, as by the backend and a worker process.
+        """
+        path = str(tmp_path / "queue.sqlite3")
+        producer = SQLiteTransport(path=path)
+        consumer = SQLiteTransport(path=path)
+
+        await producer.send_batch(QUEUE, ["a"])
+        await producer.close()
+        messages = await consumer.receive(QUEUE, 10, 0)
+        await consumer.close()
+
+        assert [message["Body"] for message in messages] == ["a"]
+
+
+@pytest.mark.asyncio
+class TestSQSTransport:
+    @patch("aiobotocore.session.AioSession.create_client")
+    async def test_send_batch(self, mock_create_client):
+        """
+        Test that messages are sent in batches of ten and failed ones returned.
+        """
+        mock_client = AsyncMock()
+        mock_create_client.return_value.__aenter__.return_value = mock_client
+        mock_client.send_message_batch.side_effect = [
+            {"Failed": [{"Id": "3", "SenderFault": False, "Code": "InternalError"}]},
+            {},
+        ]
+        bodies = [f"body-{index}" for index in range(12)]
+
+        failed = await SQSTransport().send_batch(QUEUE, bodies)
+
+        assert failed == ["body-3"]
+        first, second = mock_client.send_message_batch.call_args_list
+        assert len(first.kwargs["Entries"]) == 10
+        assert second.kwargs["Entries"] == [
+            {"Id": "0", "MessageBody": "body-10"},
+            {"Id": "1", "MessageBody": "body-11"},
+        ]
+
+
+class TestCreateTransport:
+    @patch("transports.DLP_QUEUE_SQLITE_PATH", "/tmp/dlp-queue.sqlite3")
+    def test_known_transports(self):
+        """
+        Test that transports are created by name.
+        """
+        assert isinstance(create_transport("memory"), MemoryTransport)
+        assert isinstance(create_transport("sqlite"), SQLiteTransport)
+        assert isinstance(create_transport("sqs"), SQSTransport)
+
+    @patch("transports.DLP_QUEUE_SQLITE_PATH", "")
+    def test_sqlite_path_is_required(self):
+        """
+        Test that the SQLite queue is not created without a configured path,
+        which must be the one the backend sends to.
+        """
+        with pytest.raises(ValueError, match="DLP_QUEUE_SQLITE_PATH"):
+            create_transport("sqlite")
+
+    def test_unknown_transport(self):
+        """
+        Test that an unknown transport name is rejected.
+        """
+        with pytest.raises(ValueError, match="Unknown queue transport: kafka"):
+            create_transport("kafka")
+
+
+@pytest.mark.asyncio
+class TestManagerOverMemoryTransport:
+    async def test_messages_are_processed_and_acknowledged(self):
+        """
+        Test that a manager consumes and acknowledges every message of an
+        in-memory queue without any external service.
+        """
+        transport = MemoryTransport()
+        bodies = [
+            json.dumps({"task": "process_message", "kwargs": {"message": str(index)}})
+            for index in range(25)
+        ]
+        await transport.send_batch(QUEUE, bodies)
+        manager = SQSManager(queue_url=QUEUE, concurrency=5, transport=transport)
+
+        with patch("manager.process_message") as mock_process_message:
+            main = asyncio.create_task(manager.main())
+            while mock_process_message.await_count < 25:
+                await asyncio.sleep(0.01)
+            main.cancel()
+            await main
+
+        assert sorted(
+            call.kwargs["message"] for call in mock_process_message.await_args_list
+        ) == sorted(str(index) for index in range(25))
+        assert await transport.queue_stats(QUEUE) == (0, 0)
@@ -112,3 +112,14 @@ class TestWaitForSQS:
         # Ensure the function retried the maximum number of times
         assert mock_sqs.get_queue_attributes.call_count == 3
         mock_sleep.assert_called_with(1)
+
+    def test_other_transport_does_not_wait(
+        self, mock_sleep, mock_boto_client, mock_env
+    ):
+        """
+        Test that nothing is waited for when the worker does not use SQS.
+        """
+        with patch.dict(os.environ, {"DLP_QUEUE_TRANSPORT": "sqlite"}):
+            wait_for_sqs()
+
+        mock_boto_client.assert_not_called()
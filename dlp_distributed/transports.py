@@ -0,0 +1,647 @@
+import asyncio
+import contextlib
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+from collections import deque
+
+from aiobotocore.config import AioConfig
+from aiobotocore.session import AioSession
+from botocore.exceptions import ConnectionError as BotoConnectionError
+from botocore.exceptions import HTTPClientError
+
+from constants import (
+    AWS_REGION_NAME,
+    AWS_SQS_ENDPOINT_URL,
+    DLP_QUEUE_SQLITE_PATH,
+    DLP_QUEUE_TRANSPORT,
+    DLP_QUEUE_SQLITE_POLL_INTERVAL,
+    SQS_CONNECT_TIMEOUT,
+    SQS_MAX_POOL_CONNECTIONS,
+    SQS_READ_TIMEOUT,
+    SQS_VISIBILITY_TIMEOUT,
+)
+
+logger = logging.getLogger(__name__)
+
+# Errors after which the SQS client is dropped and created again
+CONNECTION_ERRORS = (BotoConnectionError, HTTPClientError)
+
+# Maximum number of entries of an SQS batch request
+SQS_MAX_BATCH = 10
+
+# Schema of the SQLite queue, shared with apps/dlp/transports.py on the producer
+# side. Times are epoch seconds, so that several processes can share the file.
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS queue_messages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    queue TEXT NOT NULL,
+    body TEXT NOT NULL,
+    sent_at REAL NOT NULL,
+    visible_at REAL NOT NULL,
+    receipt_handle TEXT
+);
+CREATE INDEX IF NOT EXISTS queue_messages_visible
+    ON queue_messages (queue, visible_at);
+CREATE INDEX IF NOT EXISTS queue_messages_receipt_handle
+    ON queue_messages (receipt_handle);
+"""
+
+
+def _message(message_id, body: str, sent_at: float, receipt_handle: str) -> dict:
+    """
+    Build a received message in the shape of an SQS message.
+    """
+    return {
+        "MessageId": str(message_id),
+        "Body": body,
+        "ReceiptHandle": receipt_handle,
+        "Attributes": {"SentTimestamp": str(int(sent_at * 1000))},
+    }
+
+
+class QueueTransport:
+    """
+    Interface of the queue backends consumed by SQSManager.
+
+    Queues are identified by their URL, which for the local backends is only a
+    name. Received messages are dicts shaped like SQS messages, with ``Body``,
+    ``ReceiptHandle`` and a ``SentTimestamp`` in milliseconds in ``Attributes``.
+    A received message stays invisible to other receivers for the visibility
+    timeout, and is delivered again unless it is deleted before then.
+    """
+
+    async def send_batch(self, queue_url: str, bodies: list) -> list:
+        """
+        Send messages to a queue.
+
+        Args:
+            queue_url (str): The queue to send to.
+            bodies (list): The message bodies.
+
+        Returns:
+            list: The bodies that could not be sent.
+        """
+        raise NotImplementedError
+
+    async def receive(self, queue_url: str, max_messages: int, wait_time: float):
+        """
+        Receive messages, waiting up to ``wait_time`` seconds for one to arrive.
+
+        Args:
+            queue_url (str): The queue to receive from.
+            max_messages (int): Maximum number of messages to receive.
+            wait_time (float): Seconds to wait while the queue is empty.
+
+        Returns:
+            list: The received messages.
+        """
+        raise NotImplementedError
+
+    async def delete_batch(self, queue_url: str, receipt_handles: list) -> list:
+        """
+        Delete received messages from a queue.
+
+        Args:
+            queue_url (str): The queue of the messages.
+            receipt_handles (list): Receipt handles of at most 10 messages.
+
+        Returns:
+            list: The receipt handles whose deletion failed and may be retried.
+        """
+        raise NotImplementedError
+
+    async def change_visibility_batch(
+        self, queue_url: str, receipt_handles: list, visibility_timeout: int
+    ) -> list:
+        """
+        Keep received messages invisible for another ``visibility_timeout`` seconds.
+
+        Args:
+            queue_url (str): The queue of the messages.
+            receipt_handles (list): Receipt handles of at most 10 messages.
+            visibility_timeout (int): Seconds from now the messages stay invisible.
+
+        Returns:
+            list: The receipt handles that were rejected, because their message
+                is no longer in flight.
+        """
+        raise NotImplementedError
+
+    async def queue_stats(self, queue_url: str) -> tuple:
+        """
+        Count the messages of a queue.
+
+        Args:
+            queue_url (str): The queue to count.
+
+        Returns:
+            tuple: The number of visible messages and of messages in flight.
+        """
+        raise NotImplementedError
+
+    async def close(self):
+        """
+        Release the resources of the transport.
+        """
+
+
+class SQSTransport(QueueTransport):
+    def __init__(self):
+        """
+        Initialize an SQS transport with a long-lived client shared by all queue
+        operations of the process.
+
+        The underlying aiobotocore client is created on first use, with a tuned
+        connection pool.
+        """
+        self.session = AioSession()
+        self.config = AioConfig(
+            max_pool_connections=SQS_MAX_POOL_CONNECTIONS,
+            connect_timeout=SQS_CONNECT_TIMEOUT,
+            read_timeout=SQS_READ_TIMEOUT,
+        )
+        self._client = None
+        self._client_context = None
+        self._client_lock = asyncio.Lock()
+
+    async def _get_client(self):
+        """
+        Return the shared SQS client, creating it if needed.
+
+        Returns:
+            AioBaseClient: The SQS client.
+        """
+        if self._client is None:
+            async with self._client_lock:
+                if self._client is None:
+                    context = self.session.create_client(
+                        "sqs",
+                        region_name=AWS_REGION_NAME,
+                        endpoint_url=AWS_SQS_ENDPOINT_URL,
+                        config=self.config,
+                    )
+                    self._client = await context.__aenter__()
+                    self._client_context = context
+                    logger.info("Created SQS client.")
+        return self._client
+
+    async def _close_client(self, client=None):
+        """
+        Close the shared SQS client.
+
+        Args:
+            client (AioBaseClient, optional): Only close the shared client if it is
+                still this one, so that concurrent failures close it only once.
+        """
+        if self._client is None or (client is not None and client is not self._client):
+            return
+        context = self._client_context
+        self._client = None
+        self._client_context = None
+        try:
+            await context.__aexit__(None, None, None)
+        except Exception as e:
+            logger.warning(f"Error while closing SQS client: {e}")
+
+    async def call(self, operation: str, **kwargs):
+        """
+        Call an SQS operation with the shared client.
+
+        If the connection fails, the client is recreated and the call is retried
+        once.
+
+        Args:
+            operation (str): The name of the client method, e.g. ``receive_message``.
+            **kwargs: The arguments of the operation.
+
+        Returns:
+            dict: The response of the operation.
+        """
+        client = await self._get_client()
+        try:
+            return await getattr(client, operation)(**kwargs)
+        except CONNECTION_ERRORS as e:
+            logger.warning(f"SQS connection error, recreating client: {e}")
+            await self._close_client(client)
+            client = await self._get_client()
+            return await getattr(client, operation)(**kwargs)
+
+    async def send_batch(self, queue_url: str, bodies: list) -> list:
+        failed = []
+        for start in range(0, len(bodies), SQS_MAX_BATCH):
+            batch = bodies[start : start + SQS_MAX_BATCH]
+            response = await self.call(
+                "send_message_batch",
+                QueueUrl=queue_url,
+                Entries=[
+                    {"Id": str(index), "MessageBody": body}
+                    for index, body in enumerate(batch)
+                ],
+            )
+            for failure in response.get("Failed", []):
+                logger.error(
+                    f"Failed to send message: {failure.get('Code')} "
+                    f"{failure.get('Message', '')}"
+                )
+                failed.append(batch[int(failure["Id"])])
+        return failed
+
+    async def receive(self, queue_url: str, max_messages: int, wait_time: float):
+        response = await self.call(
+            "receive_message",
+            QueueUrl=queue_url,
+            AttributeNames=["SentTimestamp"],
+            MaxNumberOfMessages=max_messages,
+            WaitTimeSeconds=int(wait_time),
+        )
+        return response.get("Messages", [])
+
+    async def delete_batch(self, queue_url: str, receipt_handles: list) -> list:
+        response = await self.call(
+            "delete_message_batch",
+            QueueUrl=queue_url,
+            Entries=[
+                {"Id": str(index), "ReceiptHandle": receipt_handle}
+                for index, receipt_handle in enumerate(receipt_handles)
+            ],
+        )
+
+        retry = []
+        for failure in response.get("Failed", []):
+            receipt_handle = receipt_handles[int(failure["Id"])]
+            logger.error(
+                f"Failed to delete message with ReceiptHandle {receipt_handle}: "
+                f"{failure.get('Code')} {failure.get('Message', '')}"
+            )
+            # Sender faults, such as an expired receipt handle, will not succeed
+            if not failure.get("SenderFault"):
+                retry.append(receipt_handle)
+
+        deleted = len(response.get("Successful", []))
+        if deleted:
+            logger.info(f"Deleted {deleted} messages.")
+        return retry
+
+    async def change_visibility_batch(
+        self, queue_url: str, receipt_handles: list, visibility_timeout: int
+    ) -> list:
+        response = await self.call(
+            "change_message_visibility_batch",
+            QueueUrl=queue_url,
+            Entries=[
+                {
+                    "Id": str(index),
+                    "ReceiptHandle": receipt_handle,
+                    "VisibilityTimeout": visibility_timeout,
+                }
+                for index, receipt_handle in enumerate(receipt_handles)
+            ],
+        )
+        rejected = []
+        for failure in response.get("Failed", []):
+            receipt_handle = receipt_handles[int(failure["Id"])]
+            logger.error(
+                f"Failed to extend visibility of message with ReceiptHandle "
+                f"{receipt_handle}: {failure.get('Code')} {failure.get('Message', '')}"
+            )
+            if failure.get("SenderFault"):
+                rejected.append(receipt_handle)
+        return rejected
+
+    async def queue_stats(self, queue_url: str) -> tuple:
+        response = await self.call(
+            "get_queue_attributes",
+            QueueUrl=queue_url,
+            AttributeNames=[
+                "ApproximateNumberOfMessages",
+                "ApproximateNumberOfMessagesNotVisible",
+            ],
+        )
+        attributes = response.get("Attributes", {})
+        return (
+            int(attributes.get("ApproximateNumberOfMessages", 0)),
+            int(attributes.get("ApproximateNumberOfMessagesNotVisible", 0)),
+        )
+
+    async def close(self):
+        """
+        Close the client and its connection pool.
+        """
+        await self._close_client()
+
+
+class _MemoryQueue:
+    def __init__(self):
+        self.ready = deque()
+        # Messages in flight with the time they become visible again, by
+        # receipt handle
+        self.in_flight = {}
+        self.changed = asyncio.Condition()
+
+    def requeue_expired(self, now: float):
+        """
+        Make the messages whose visibility timeout has expired visible again.
+        """
+        expired = [
+            receipt_handle
+            for receipt_handle, (_, visible_at) in self.in_flight.items()
+            if visible_at <= now
+        ]
+        # Put them back in front, so redeliveries keep their order
+        self.ready.extendleft(
+            self.in_flight.pop(receipt_handle)[0] for receipt_handle in expired[::-1]
+        )
+
+
+class MemoryTransport(QueueTransport):
+    def __init__(self, visibility_timeout: float = SQS_VISIBILITY_TIMEOUT):
+        """
+        Initialize a transport keeping its queues in the memory of the process.
+
+        Messages are only seen by consumers of the same process and are lost
+        when it exits, which makes this transport suited for benchmarks and
+        tests rather than for deployments.
+
+        Args:
+            visibility_timeout (float): Seconds a received message stays invisible.
+        """
+        self.visibility_timeout = visibility_timeout
+        self._queues = {}
+
+    def _queue(self, queue_url: str) -> _MemoryQueue:
+        if queue_url not in self._queues:
+            self._queues[queue_url] = _MemoryQueue()
+        return self._queues[queue_url]
+
+    async def send_batch(self, queue_url: str, bodies: list) -> list:
+        queue = self._queue(queue_url)
+        sent_at = time.time()
+        async with queue.changed:
+            for body in bodies:
+                queue.ready.append((uuid.uuid4().hex, body, sent_at))
+            queue.changed.notify_all()
+        return []
+
+    async def receive(self, queue_url: str, max_messages: int, wait_time: float):
+        queue = self._queue(queue_url)
+        deadline = time.monotonic() + wait_time
+        async with queue.changed:
+            while True:
+                now = time.monotonic()
+                queue.requeue_expired(now)
+                if queue.ready or now >= deadline:
+                    break
+                # Wake up for new messages, or when one in flight expires
+                timeout = (
+                    min(
+                        [deadline]
+                        + [visible_at for _, visible_at in queue.in_flight.values()]
+                    )
+                    - now
+                )
+                try:
+                    await asyncio.wait_for(queue.changed.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+
+            messages = []
+            visible_at = now + self.visibility_timeout
+            while queue.ready and len(messages) < max_messages:
+                entry = queue.ready.popleft()
+                receipt_handle = uuid.uuid4().hex
+                queue.in_flight[receipt_handle] = (entry, visible_at)
+                messages.append(_message(*entry, receipt_handle))
+            return messages
+
+    async def delete_batch(self, queue_url: str, receipt_handles: list) -> list:
+        queue = self._queue(queue_url)
+        for receipt_handle in receipt_handles:
+            queue.in_flight.pop(receipt_handle, None)
+        return []
+
+    async def change_visibility_batch(
+        self, queue_url: str, receipt_handles: list, visibility_timeout: int
+    ) -> list:
+        queue = self._queue(queue_url)
+        now = time.monotonic()
+        queue.requeue_expired(now)
+        rejected = []
+        async with queue.changed:
+            for receipt_handle in receipt_handles:
+                if receipt_handle in queue.in_flight:
+                    entry, _ = queue.in_flight[receipt_handle]
+                    queue.in_flight[receipt_handle] = (entry, now + visibility_timeout)
+                else:
+                    rejected.append(receipt_handle)
+            queue.changed.notify_all()
+        return rejected
+
+    async def queue_stats(self, queue_url: str) -> tuple:
+        queue = self._queue(queue_url)
+        queue.requeue_expired(time.monotonic())
+        return len(queue.ready), len(queue.in_flight)
+
+
+class SQLiteTransport(QueueTransport):
+    def __init__(
+        self,
+        path: str | None = None,
+        visibility_timeout: float = SQS_VISIBILITY_TIMEOUT,
+        poll_interval: float = DLP_QUEUE_SQLITE_POLL_INTERVAL,
+    ):
+        """
+        Initialize a durable transport keeping its queues in a local SQLite file.
+
+        The file can be shared by the backend and every worker process of a
+        single node, so that no queue service is needed. Receivers poll the file
+        every ``poll_interval`` seconds while the queue is empty.
+
+        Args:
+            path (str, optional): Path of the SQLite database shared with the
+                backend. Defaults to ``DLP_QUEUE_SQLITE_PATH``.
+            visibility_timeout (float): Seconds a received message stays invisible.
+            poll_interval (float): Seconds between two polls of an empty queue.
+
+        Raises:
+            ValueError: If no path is given or configured.
+        """
+        self.path = path or DLP_QUEUE_SQLITE_PATH
+        if not self.path:
+            raise ValueError(
+                "DLP_QUEUE_SQLITE_PATH must be set to the SQLite queue shared with "
+                "the backend."
+            )
+        self.visibility_timeout = visibility_timeout
+        self.poll_interval = poll_interval
+        self._connection = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        """
+        Return the connection of the process, opening it if needed.
+
+        The connection is opened on first use, so that forked worker processes
+        each open their own.
+        """
+        if self._connection is None:
+            connection = sqlite3.connect(
+                self.path, timeout=30, isolation_level=None, check_same_thread=False
+            )
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.executescript(SQLITE_SCHEMA)
+            self._connection = connection
+        return self._connection
+
+    @staticmethod
+    @contextlib.contextmanager
+    def _transaction(connection):
+        """
+        Run statements in a transaction that holds the write lock of the file
+        from its start, so that two processes cannot receive the same message.
+        """
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+
+    def _run(self, function, *args):
+        """
+        Run a function with the connection, one at a time.
+        """
+        with self._lock:
+            return function(self._connect(), *args)
+
+    async def _execute(self, function, *args):
+        """
+        Run a function with the connection in a thread, off the event loop.
+        """
+        return await asyncio.to_thread(self._run, function, *args)
+
+    def _send(self, connection, queue_url: str, bodies: list):
+        now = time.time()
+        with self._transaction(connection):
+            connection.executemany(
+                "INSERT INTO queue_messages (queue, body, sent_at, visible_at) "
+                "VALUES (?, ?, ?, ?)",
+                [(queue_url, body, now, now) for body in bodies],
+            )
+
+    def _receive(self, connection, queue_url: str, max_messages: int) -> list:
+        now = time.time()
+        with self._transaction(connection):
+            rows = connection.execute(
+                "SELECT id, body, sent_at FROM queue_messages "
+                "WHERE queue = ? AND visible_at <= ? ORDER BY id LIMIT ?",
+                (queue_url, now, max_messages),
+            ).fetchall()
+            messages = []
+            for message_id, body, sent_at in rows:
+                receipt_handle = uuid.uuid4().hex
+                connection.execute(
+                    "UPDATE queue_messages SET visible_at = ?, receipt_handle = ? "
+                    "WHERE id = ?",
+                    (now + self.visibility_timeout, receipt_handle, message_id),
+                )
+                messages.append(_message(message_id, body, sent_at, receipt_handle))
+        return messages
+
+    def _delete(self, connection, queue_url: str, receipt_handles: list):
+        with self._transaction(connection):
+            connection.executemany(
+                "DELETE FROM queue_messages WHERE queue = ? AND receipt_handle = ?",
+                [(queue_url, receipt_handle) for receipt_handle in receipt_handles],
+            )
+
+    def _change_visibility(
+        self, connection, queue_url: str, receipt_handles: list, visibility_timeout
+    ) -> list:
+        visible_at = time.time() + visibility_timeout
+        rejected = []
+        with self._transaction(connection):
+            for receipt_handle in receipt_handles:
+                cursor = connection.execute(
+                    "UPDATE queue_messages SET visible_at = ? "
+                    "WHERE queue = ? AND receipt_handle = ?",
+                    (visible_at, queue_url, receipt_handle),
+                )
+                if cursor.rowcount == 0:
+                    rejected.append(receipt_handle)
+        return rejected
+
+    @staticmethod
+    def _stats(connection, queue_url: str) -> tuple:
+        visible, not_visible = connection.execute(
+            "SELECT COALESCE(SUM(visible_at <= ?), 0), COALESCE(SUM(visible_at > ?), 0) "
+            "FROM queue_messages WHERE queue = ?",
+            (time.time(),) * 2 + (queue_url,),
+        ).fetchone()
+        return visible, not_visible
+
+    async def send_batch(self, queue_url: str, bodies: list) -> list:
+        await self._execute(self._send, queue_url, bodies)
+        return []
+
+    async def receive(self, queue_url: str, max_messages: int, wait_time: float):
+        deadline = time.monotonic() + wait_time
+        while True:
+            messages = await self._execute(self._receive, queue_url, max_messages)
+            remaining = deadline - time.monotonic()
+            if messages or remaining <= 0:
+                return messages
+            await asyncio.sleep(min(self.poll_interval, remaining))
+
+    async def delete_batch(self, queue_url: str, receipt_handles: list) -> list:
+        await self._execute(self._delete, queue_url, receipt_handles)
+        return []
+
+    async def change_visibility_batch(
+        self, queue_url: str, receipt_handles: list, visibility_timeout: int
+    ) -> list:
+        return await self._execute(
+            self._change_visibility, queue_url, receipt_handles, visibility_timeout
+        )
+
+    async def queue_stats(self, queue_url: str) -> tuple:
+        return await self._execute(self._stats, queue_url)
+
+    async def close(self):
+        """
+        Close the connection to the database.
+        """
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+
+TRANSPORTS = {
+    "sqs": SQSTransport,
+    "memory": MemoryTransport,
+    "sqlite": SQLiteTransport,
+}
+
+
+def create_transport(name: str = DLP_QUEUE_TRANSPORT) -> QueueTransport:
+    """
+    Create the queue transport configured for the worker.
+
+    Args:
+        name (str): One of ``sqs``, ``memory`` or ``sqlite``.
+
+    Returns:
+        QueueTransport: The transport.
+
+    Raises:
+        ValueError: If the transport is unknown or not configured.
+    """
+    try:
+        transport_class = TRANSPORTS[name]
+    except KeyError:
+        raise ValueError(f"Unknown queue transport: {name}") from None
+    return transport_class()
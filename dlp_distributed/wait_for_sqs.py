@@ -5,6 +5,11 @@ from botocore.exceptions import ClientError, EndpointConnectionError
 
 
 def wait_for_sqs():
+    transport = os.getenv("DLP_QUEUE_TRANSPORT", "sqs")
+    if transport != "sqs":
+        print(f"Using the {transport} queue transport, not waiting for SQS.")
+        return
+
     queue_url = os.getenv("AWS_SQS_QUEUE_URL", "http://sqs:9324/000000000000/dlp-tasks")
     endpoint_url = os.getenv("AWS_SQS_ENDPOINT_URL", "http://sqs:9324")
     region_name = os.getenv("AWS_REGION_NAME", "us-east-1")